@@ -0,0 +1,70 @@
+"""
+Compara los métodos de carga de la vista diaria (read_sql vs COPY).
+
+Importar main no carga datos ni arranca el refresco en segundo plano (eso
+pasa con el primer request a la app), así que nada más consulta la base
+mientras se mide.
+
+Uso:
+    python benchmark_carga.py --repeticiones 3 --desde 2025-01-01
+"""
+
+import argparse
+import time
+
+import pandas as pd
+
+from main import leer_precios
+
+METODOS = ["read_sql", "copy"]
+
+
+def medir(desde, repeticiones):
+    """
+    Mejor tiempo en segundos y último DataFrame leído de cada método. Los
+    métodos se alternan en cada repetición, después de una lectura de
+    calentamiento que no se mide, para que el caché de la base y las
+    conexiones nuevas no favorezcan a ninguno.
+    """
+    for metodo in METODOS:
+        leer_precios(desde, metodo=metodo)
+
+    tiempos = {metodo: [] for metodo in METODOS}
+    resultados = {}
+    for _ in range(repeticiones):
+        for metodo in METODOS:
+            inicio = time.perf_counter()
+            resultados[metodo] = leer_precios(desde, metodo=metodo)
+            tiempos[metodo].append(time.perf_counter() - inicio)
+    return {
+        metodo: (min(tiempos[metodo]), resultados[metodo])
+        for metodo in METODOS
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--desde", default=None, help="fecha_dia mínima")
+    args = parser.parse_args()
+
+    resultados = {}
+    for metodo, (segundos, df) in medir(args.desde, args.repeticiones).items():
+        resultados[metodo] = df
+        memoria = df.memory_usage(deep=True).sum() / 2**20
+        print(
+            f"{metodo:>8}: {len(df):>10,} filas  {segundos:8.2f} s  "
+            f"{memoria:8.1f} MiB"
+        )
+
+    base, *otros = resultados.values()
+    for metodo, df in zip(METODOS[1:], otros):
+        try:
+            pd.testing.assert_frame_equal(base, df, check_categorical=False)
+            print(f"{metodo}: mismo resultado que {METODOS[0]}")
+        except AssertionError as error:
+            print(f"{metodo}: difiere de {METODOS[0]}\n{error}")
+
+
+if __name__ == "__main__":
+    main()
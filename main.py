@@ -1,25 +1,55 @@
 import base64
+import fcntl
+import hashlib
+import io
+import mmap
 import os
+import pickle
+import stat
+import threading
+import time
+import uuid
 import warnings
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from itertools import pairwise
+from urllib.parse import urlencode
 
 import dash_bootstrap_components as dbc
+import diskcache
 import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
-from flask_caching import Cache
-from sqlalchemy import create_engine
+from flask import (
+    Response,
+    abort,
+    has_request_context,
+    request,
+    send_from_directory,
+    stream_with_context,
+)
+from pandas.api.types import union_categoricals
+from sqlalchemy import bindparam, create_engine, text
 
 from dash import (
     Dash,
+    DiskcacheManager,
     Input,
     Output,
+    Patch,
     State,
     ctx,
+    dash_table,
     dcc,
     html,
+    no_update,
 )
 
 warnings.filterwarnings("ignore")
@@ -39,118 +69,1810 @@ engine = create_engine(
 )
 
 
+# Cómo se lee la vista completa en modo memoria: "copy" usa COPY ... TO
+# STDOUT en CSV y lo parsea directo a columnas tipadas; "read_sql" pasa por
+# pd.read_sql (un objeto Python por celda, más lento)
+METODO_CARGA = os.getenv("METODO_CARGA", "copy")
+
+# Modo de consulta: "memoria" filtra el DataFrame completo cacheado en cada
+# worker; "sql" compila los filtros a un WHERE parametrizado sobre la vista
+MODO_CONSULTA = os.getenv("MODO_CONSULTA", "memoria")
+
+# Tamaño máximo del caché LRU de resultados filtrados (por proceso)
+CACHE_RESULTADOS_MB = int(os.getenv("CACHE_RESULTADOS_MB", "256"))
+
+# Desde cuántos puntos el gráfico principal se dibuja con WebGL (Scattergl)
+UMBRAL_WEBGL_PUNTOS = int(os.getenv("UMBRAL_WEBGL_PUNTOS", "5000"))
+
+# Máximo de puntos por traza del gráfico principal; las series más largas se
+# reducen con LTTB (0 desactiva la reducción)
+MAX_PUNTOS_POR_TRAZA = int(os.getenv("MAX_PUNTOS_POR_TRAZA", "400"))
+
+# Máximo de valores atípicos que se dibujan por caja del boxplot
+MAX_ATIPICOS_BOXPLOT = int(os.getenv("MAX_ATIPICOS_BOXPLOT", "100"))
+
+# Error relativo de los cuantiles que se calculan con sketches
+ERROR_SKETCH = float(os.getenv("ERROR_SKETCH", "0.01"))
+
+# Tamaño de la ventana visible de la comparativa: productos por página y
+# tiendas por página (el resto se pide al servidor al paginar)
+FILAS_COMPARATIVA = int(os.getenv("FILAS_COMPARATIVA", "25"))
+TIENDAS_POR_PAGINA = int(os.getenv("TIENDAS_POR_PAGINA", "5"))
+
+# Detalle por zoom: con rangos de más de DIAS_DETALLE_ZOOM días el gráfico
+# principal se dibuja primero como resumen semanal y, al hacer zoom, se
+# vuelve a consultar solo la ventana visible con resolución diaria
+MODO_DETALLE_ZOOM = os.getenv("MODO_DETALLE_ZOOM", "0") == "1"
+DIAS_DETALLE_ZOOM = int(os.getenv("DIAS_DETALLE_ZOOM", "120"))
+
+# Filas por bloque con que se arman los archivos de descarga
+FILAS_BLOQUE_DESCARGA = int(os.getenv("FILAS_BLOQUE_DESCARGA", "50000"))
+
+# Carpeta propia de la app, que no se comparte con otros usuarios de la
+# máquina: ahí quedan los datos compartidos entre workers y las
+# exportaciones (ver directorio_privado)
+DIRECTORIO_APP = os.getenv(
+    "DIRECTORIO_APP",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+        "dash-scraper",
+    ),
+)
+
+# Exportaciones en segundo plano: carpeta donde quedan los archivos y
+# minutos que se conservan antes de borrarse
+DIRECTORIO_EXPORTACIONES = os.getenv(
+    "DIRECTORIO_EXPORTACIONES", os.path.join(DIRECTORIO_APP, "exportaciones")
+)
+MINUTOS_EXPORTACIONES = int(os.getenv("MINUTOS_EXPORTACIONES", "60"))
+
+# Cada cuántos minutos se refrescan los datos en segundo plano (modo
+# memoria) y cada cuántos segundos el navegador revisa si hay versión nueva
+MINUTOS_REFRESCO = int(os.getenv("MINUTOS_REFRESCO", "30"))
+SEGUNDOS_CONSULTA_VERSION = int(os.getenv("SEGUNDOS_CONSULTA_VERSION", "10"))
+
+# Un refresco pedido dentro de esta cantidad de segundos desde el último que
+# terminó (en cualquier worker) reutiliza ese en vez de volver a consultar
+SEGUNDOS_REUSO_REFRESCO = int(os.getenv("SEGUNDOS_REUSO_REFRESCO", "60"))
+
+# Días recientes que entran en la suma de control de la huella de la vista
+DIAS_HUELLA = int(os.getenv("DIAS_HUELLA", "7"))
+
+# Carpeta local donde se guardan los datos de precios (DataFrame, índice,
+# sketches y pivotes) que comparten todos los workers de la máquina. Se
+# reutilizan al reiniciar, así que tiene que estar en un disco que
+# sobreviva a los reinicios y deploys (el valor por defecto lo está)
+DIRECTORIO_DATOS = os.getenv(
+    "DIRECTORIO_DATOS", os.path.join(DIRECTORIO_APP, "datos")
+)
+
+# Instantánea en Parquet de los últimos datos cargados, para arrancar sin ir
+# a Postgres cuando no hay datos publicados que se puedan usar (primer
+# arranque o formato nuevo tras un deploy)
+RUTA_INSTANTANEA = os.getenv(
+    "RUTA_INSTANTANEA",
+    os.path.join(DIRECTORIO_DATOS, "instantanea-precios.parquet"),
+)
+
+
+def directorio_privado(ruta):
+    """
+    Crea `ruta` (modo 0700) si no existe y la devuelve. Lo que se guarda ahí
+    se vuelve a cargar con pickle, así que se rechaza un directorio de otro
+    usuario, un enlace simbólico o uno en el que otros puedan escribir.
+    """
+    os.makedirs(ruta, mode=0o700, exist_ok=True)
+    info = os.lstat(ruta)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    ):
+        raise PermissionError(
+            f"{ruta} debe ser un directorio propio en el que solo escriba "
+            "este usuario (p. ej. modo 0700)"
+        )
+    return ruta
+
+
 # INICIALIZAR APP
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 
-# Cache en memoria
-cache = Cache(
-    server,
-    config={
-        "CACHE_TYPE": "SimpleCache",
-        "CACHE_DEFAULT_TIMEOUT": 60 * 60 * 2,
-    },
+# Trabajos en segundo plano (exportaciones): corren en un proceso aparte y
+# se coordinan con un caché en disco que comparten todos los workers
+gestor_trabajos = DiskcacheManager(
+    diskcache.Cache(
+        os.path.join(directorio_privado(DIRECTORIO_EXPORTACIONES), "trabajos")
+    ),
+    expire=MINUTOS_EXPORTACIONES * 60,
 )
 
+# Vigencia de los datos: los de precios se recargan completos (no solo los
+# últimos días) cuando su última carga completa es más antigua que esto, y
+# el catálogo del modo sql vuelve a mirar la huella de la vista
+SEGUNDOS_VIGENCIA_CACHE = 60 * 60 * 2
+
+# Tipos en memoria de la vista diaria: las dimensiones como categóricas
+# (códigos enteros + diccionario compartido) y los precios en float32
+ESQUEMA_PRECIOS = {
+    "descripcion_producto": "category",
+    "nombre_producto": "category",
+    "ecommerce": "category",
+    "marca_producto": "category",
+    "presentacion_producto": "category",
+    "subcategoria_producto": "category",
+    "especie_destino_producto": "category",
+    "biomont_producto": "category",
+    "segmento_producto": "category",
+    "sku": "category",
+    "promedio": "float32",
+    "maximo": "float32",
+    "minimo": "float32",
+}
+
+# Filtro del dashboard -> columna de la vista
+COLUMNAS_FILTRO = {
+    "subcategoria": "subcategoria_producto",
+    "biomont": "biomont_producto",
+    "presentacion": "presentacion_producto",
+    "especie": "especie_destino_producto",
+    "ecommerce": "ecommerce",
+    "marca": "marca_producto",
+    "segmento_producto": "segmento_producto",
+}
+
+# Columnas con las que se arman los dropdowns (y que se indexan)
+COLUMNAS_CATALOGO = ["nombre_producto"] + list(COLUMNAS_FILTRO.values())
+
+# Columnas que usan los gráficos y tablas del dashboard
+COLUMNAS_DASHBOARD = [
+    "fecha_dia",
+    "descripcion_producto",
+    "nombre_producto",
+    "presentacion_producto",
+    "ecommerce",
+    "promedio",
+    "maximo",
+    "minimo",
+]
+
+
+def tipar_precios(df):
+    """Aplica ESQUEMA_PRECIOS a las columnas presentes del DataFrame"""
+    df["fecha_dia"] = pd.to_datetime(df["fecha_dia"])
+    return df.astype(
+        {col: tipo for col, tipo in ESQUEMA_PRECIOS.items() if col in df}
+    )
 
-@cache.memoize()
-def get_precios_por_dia():
-    query = """
-        SELECT *
-        FROM vw_peco_ecommerce_antiparasitarios_daily
+
+def concatenar_precios(*dfs):
+    """Concatena DataFrames tipados unificando el diccionario de categorías"""
+    dfs = list(dfs)
+    for col, tipo in ESQUEMA_PRECIOS.items():
+        if tipo != "category" or col not in dfs[0]:
+            continue
+        categorias = union_categoricals(
+            [df[col] for df in dfs]
+        ).categories.sort_values()
+        dfs = [
+            df.assign(**{col: df[col].cat.set_categories(categorias)})
+            for df in dfs
+        ]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def condiciones_filtros(filtros, aplicar_ecommerce=True):
+    """Traduce el estado de filtros a {columna: valores permitidos}"""
+    condiciones = {}
+    if filtros.get("nombre_producto"):
+        condiciones["nombre_producto"] = list(filtros["nombre_producto"])
+
+    for clave, columna in COLUMNAS_FILTRO.items():
+        if clave == "ecommerce" and not aplicar_ecommerce:
+            continue
+        valor = filtros.get(clave)
+        if valor is None or valor == "ALL":
+            continue
+        condiciones[columna] = [valor]
+    return condiciones
+
+
+class IndicePrecios:
+    """
+    Índice invertido sobre las dimensiones de filtro de un DataFrame de
+    precios ordenado por fecha_dia.
+
+    Para cada columna guarda las posiciones de las filas agrupadas por
+    categoría (ascendentes dentro de cada una), así el rango de fechas se
+    resuelve con dos searchsorted y cada filtro con una lista de posiciones.
+    Las categorías con muchas filas no guardan lista (nunca son selectivas).
+    Si algún filtro es selectivo se intersectan sus posiciones; si no, se
+    combinan máscaras booleanas sobre la ventana de fechas.
+
+    Las posiciones usan el entero sin signo más chico que alcanza para las
+    filas del DataFrame y de las fechas solo se guarda dónde empieza cada
+    día, así el índice no pesa más que los datos que indexa.
     """
-    df = pd.read_sql(query, engine)
-    df["fecha_dia"] = pd.to_datetime(df["fecha_dia"])
-    return df
 
+    def __init__(self, df):
+        self.dias, inicios = np.unique(
+            df["fecha_dia"].to_numpy(), return_index=True
+        )
+        self.limites_dia = np.r_[inicios, len(df)]
+        tipo_posicion = np.min_scalar_type(max(len(df) - 1, 0))
+        self.codigos = {}
+        self.categorias = {}
+        self.posiciones = {}
+        self.limites = {}
+        self.selectivas = {}
+        for col in COLUMNAS_CATALOGO:
+            codigos = df[col].cat.codes.to_numpy()
+            orden = np.argsort(codigos, kind="stable").astype(tipo_posicion)
+            n_categorias = len(df[col].cat.categories)
+            self.codigos[col] = codigos
+            self.categorias[col] = {
+                valor: i for i, valor in enumerate(df[col].cat.categories)
+            }
+            # Los nulos (código -1) quedan al inicio y fuera de todo límite
+            limites = np.searchsorted(
+                codigos[orden], np.arange(n_categorias + 1)
+            )
+            # Solo las categorías selectivas (menos de 1/8 de las filas, ver
+            # seleccionar) guardan sus posiciones: las demás se filtran con
+            # máscaras y quedan con una lista vacía
+            filas = np.diff(limites)
+            selectivas = filas * 8 < len(df)
+            self.selectivas[col] = selectivas
+            self.posiciones[col] = orden[limites[0] :][
+                np.repeat(selectivas, filas)
+            ]
+            self.limites[col] = np.r_[
+                0, np.cumsum(np.where(selectivas, filas, 0))
+            ]
 
-# Función auxiliar para crear variaciones
-def crear_variacion_html(precio_actual, precio_anterior):
-    """Crea el HTML para mostrar la variación con el día anterior"""
-    if (
-        precio_anterior is None
-        or precio_actual == "-"
-        or not isinstance(precio_actual, (int, float))
-    ):
-        return html.Span(
-            "Sin dato anterior", style={"color": "gray", "fontSize": "10px"}
+    def rango_fechas(self, inicio=None, fin=None):
+        """Posiciones [lo, hi) de las filas con inicio <= fecha_dia <= fin"""
+        if not inicio or not fin:
+            return 0, int(self.limites_dia[-1])
+        lo = np.searchsorted(self.dias, np.datetime64(pd.Timestamp(inicio)))
+        hi = np.searchsorted(
+            self.dias, np.datetime64(pd.Timestamp(fin)), side="right"
         )
+        return int(self.limites_dia[lo]), int(self.limites_dia[hi])
+
+    def _listas(self, columna, codigos, lo, hi):
+        """Posiciones de cada código recortadas a la ventana [lo, hi)"""
+        limites = self.limites[columna]
+        listas = []
+        for codigo in codigos:
+            pos = self.posiciones[columna][
+                limites[codigo] : limites[codigo + 1]
+            ]
+            listas.append(
+                pos[np.searchsorted(pos, lo) : np.searchsorted(pos, hi)]
+            )
+        return listas
+
+    def _permitidos(self, columna, codigos):
+        """Tabla código -> permitido; la última celda atiende al código -1"""
+        permitidos = np.zeros(len(self.categorias[columna]) + 1, dtype=bool)
+        permitidos[codigos] = True
+        return permitidos
+
+    def restringir(self, pos, columna, valores):
+        """Descarta de `pos` las filas cuya columna no está en `valores`"""
+        mapa = self.categorias[columna]
+        codigos = [mapa[v] for v in valores if v in mapa]
+        permitidos = self._permitidos(columna, codigos)
+        return pos[permitidos[self.codigos[columna][pos]]]
+
+    def seleccionar(self, condiciones, inicio=None, fin=None):
+        """Posiciones (ordenadas por fecha) de las filas que cumplen todo"""
+        lo, hi = self.rango_fechas(inicio, fin)
+        if not condiciones:
+            return np.arange(lo, hi)
+
+        filtros = []
+        for columna, valores in condiciones.items():
+            mapa = self.categorias[columna]
+            # Sin repetidos, como isin: cada código aporta sus filas una vez
+            codigos = sorted({mapa[v] for v in valores if v in mapa})
+            if not codigos:
+                return np.arange(0)
+            if self.selectivas[columna][codigos].all():
+                listas = self._listas(columna, codigos, lo, hi)
+                tamano = sum(len(p) for p in listas)
+            else:
+                tamano = hi - lo  # sin posiciones: va por máscara
+            filtros.append((tamano, columna, codigos))
+
+        filtros.sort(key=lambda f: f[0])
+        tamano, columna, codigos = filtros[0]
+
+        # Filtro selectivo: se parte de sus posiciones y se descartan las
+        # que no cumplen los demás filtros mirando sus códigos
+        if tamano * 8 < hi - lo:
+            pos = np.sort(
+                np.concatenate(self._listas(columna, codigos, lo, hi))
+            )
+            for _, columna, codigos in filtros[1:]:
+                permitidos = self._permitidos(columna, codigos)
+                pos = pos[permitidos[self.codigos[columna][pos]]]
+            return pos
 
-    try:
-        variacion = precio_actual - precio_anterior
-        variacion_porcentaje = (
-            (variacion / precio_anterior) * 100 if precio_anterior != 0 else 0
+        # Filtros amplios: AND de máscaras sobre la ventana de fechas
+        mascara = np.ones(hi - lo, dtype=bool)
+        for _, columna, codigos in filtros:
+            permitidos = self._permitidos(columna, codigos)
+            mascara &= permitidos[self.codigos[columna][lo:hi]]
+        return np.flatnonzero(mascara) + lo
+
+
+def agrupar_series(df):
+    """
+    Serie de cada fila (una por combinación de producto, e-commerce y demás
+    dimensiones de filtro) y tabla con los atributos de cada serie
+    """
+    columnas_serie = ["descripcion_producto"] + COLUMNAS_CATALOGO
+    serie = (
+        df.groupby(columnas_serie, observed=True, dropna=False, sort=False)
+        .ngroup()
+        .to_numpy()
+    )
+    _, primeras = np.unique(serie, return_index=True)
+    return serie, df.iloc[primeras][columnas_serie].reset_index(drop=True)
+
+
+def mascara_series(series, condiciones):
+    """Series cuyos atributos cumplen {columna: valores permitidos}"""
+    mascara = np.ones(len(series), dtype=bool)
+    for columna, valores in condiciones.items():
+        mascara &= series[columna].isin(valores).to_numpy()
+    return mascara
+
+
+class SketchPrecios:
+    """
+    Sketches de cuantiles (estilo DDSketch) por día y serie; una serie es
+    una combinación de producto, e-commerce y demás dimensiones de filtro.
+
+    Cada precio cae en una cubeta logarítmica cuyo representante está a un
+    error relativo de a lo más `error_relativo` del valor real. Los sketches
+    se combinan sumando conteos por cubeta, así que cualquier rango de
+    fechas y filtros se responde sin recorrer filas. Como los precios cambian
+    poco de un día a otro, los días consecutivos de una serie en la misma
+    cubeta se guardan como un solo tramo.
+
+    Por serie y día guarda también sumas y extremos exactos para la tarjeta
+    de estadísticas, solo de las celdas (serie, día) que tienen filas: van
+    en orden de serie y día, las de la serie s entre inicio_serie[s] e
+    inicio_serie[s + 1] (como una matriz CSR), así su tamaño crece con las
+    filas y no con series x días. Días, cubetas y series se guardan con el
+    entero sin signo más chico que alcanza.
+    """
+
+    COLUMNAS = ("maximo", "minimo", "promedio")
+
+    def __init__(self, df, error_relativo=ERROR_SKETCH):
+        self.error_relativo = error_relativo
+        self.gamma = (1 + error_relativo) / (1 - error_relativo)
+
+        serie, self.series = agrupar_series(df)
+        self.dias, dia = np.unique(
+            df["fecha_dia"].to_numpy(), return_inverse=True
         )
+        n_series, n_dias = len(self.series), len(self.dias)
+        tipo_dia = np.min_scalar_type(max(n_dias - 1, 0))
 
-        if variacion > 0:
-            return html.Span(
-                [
-                    html.Span("📈 ", style={"color": "green"}),
-                    f"+S/{variacion:.2f} ",
-                    html.Span(
-                        f"({variacion_porcentaje:.1f}%)",
-                        style={"color": "green", "fontWeight": "bold"},
-                    ),
-                ]
+        celdas, celda = np.unique(
+            serie.astype(np.int64) * n_dias + dia, return_inverse=True
+        )
+        serie_celda, dia_celda = np.divmod(celdas, n_dias)
+        self.inicio_serie = np.searchsorted(
+            serie_celda, np.arange(n_series + 1)
+        )
+        self.dia_celda = dia_celda.astype(tipo_dia)
+        self.maximo = self._extremo(celda, df["maximo"], "max", len(celdas))
+        self.minimo = self._extremo(celda, df["minimo"], "min", len(celdas))
+
+        # Las sumas por celda van en float32 como los precios del DataFrame;
+        # al combinar celdas se acumulan en float64
+        self.suma = {}
+        cubetas = {}
+        for col in self.COLUMNAS:
+            valores = df[col].to_numpy("float64")
+            validos = ~np.isnan(valores)
+            self.suma[col] = np.bincount(
+                celda[validos],
+                weights=valores[validos],
+                minlength=len(celdas),
+            ).astype(np.float32)
+            cubetas[col] = (validos, self._cubeta(valores[validos]))
+
+        self.cubeta_min = min(
+            (c.min() for _, c in cubetas.values() if len(c)), default=0
+        )
+        self.n_cubetas = 1 + max(
+            (c.max() for _, c in cubetas.values() if len(c)),
+            default=self.cubeta_min,
+        )
+        self.n_cubetas -= self.cubeta_min
+
+        # Tramos por columna: (serie, cubeta, primer día, último día, filas
+        # por día), ordenados por serie, cubeta y día
+        self.tramos = {}
+        for col, (validos, cubeta) in cubetas.items():
+            par = serie[validos].astype(np.int64) * self.n_cubetas + (
+                cubeta - self.cubeta_min
             )
-        elif variacion < 0:
-            return html.Span(
-                [
-                    html.Span("📉 ", style={"color": "red"}),
-                    f"S/{variacion:.2f} ",
-                    html.Span(
-                        f"({variacion_porcentaje:.1f}%)",
-                        style={"color": "red", "fontWeight": "bold"},
-                    ),
-                ]
+            claves, filas = np.unique(
+                par * n_dias + dia[validos], return_counts=True
             )
-        else:
-            return html.Span(
-                [html.Span("➡️ ", style={"color": "gray"}), "Sin cambio"]
+            par, dia_tramo = np.divmod(claves, n_dias)
+            nuevo = np.r_[
+                True,
+                (par[1:] != par[:-1])
+                | (dia_tramo[1:] != dia_tramo[:-1] + 1)
+                | (filas[1:] != filas[:-1]),
+            ]
+            inicios = np.flatnonzero(nuevo)
+            fines = np.r_[inicios[1:] - 1, len(claves) - 1].astype(np.int64)
+            serie_tramo, cubeta_tramo = np.divmod(par[inicios], self.n_cubetas)
+            self.tramos[col] = {
+                "serie": serie_tramo.astype(
+                    np.min_scalar_type(max(n_series - 1, 0))
+                ),
+                "cubeta": cubeta_tramo.astype(
+                    np.min_scalar_type(max(self.n_cubetas - 1, 0))
+                ),
+                "desde": dia_tramo[inicios].astype(tipo_dia),
+                "hasta": dia_tramo[fines].astype(tipo_dia),
+                "filas": filas[inicios].astype(
+                    np.min_scalar_type(filas.max(initial=0))
+                ),
+            }
+
+    @staticmethod
+    def _extremo(celda, valores, funcion, n_celdas):
+        """Máximo o mínimo exacto por celda; NaN si no hay precios"""
+        extremos = np.full(n_celdas, np.nan, dtype=np.float32)
+        por_celda = valores.groupby(celda).agg(funcion)
+        extremos[por_celda.index.to_numpy()] = por_celda.to_numpy()
+        return extremos
+
+    def _cubeta(self, valores):
+        # Los precios no deberían ser menores a un céntimo
+        return np.ceil(
+            np.log(np.maximum(valores, 0.01)) / np.log(self.gamma)
+        ).astype(np.int64)
+
+    def _valor(self, cubetas):
+        """Representante de cada cubeta (error relativo <= error_relativo)"""
+        return 2 * self.gamma ** (cubetas + self.cubeta_min) / (self.gamma + 1)
+
+    def _caja(self, conteos, media, max_atipicos=MAX_ATIPICOS_BOXPLOT):
+        """Lo mismo que estadisticas_caja, a partir de conteos por cubeta"""
+        n = conteos.sum()
+        if n == 0:
+            return None
+
+        acumulado = np.cumsum(conteos)
+        rangos = np.array([0.25, 0.5, 0.75]) * (n - 1)
+        q1, mediana, q3 = self._valor(
+            np.searchsorted(acumulado, rangos, side="right")
+        )
+        iqr = q3 - q1
+        valores = self._valor(np.flatnonzero(conteos))
+        es_atipico = (valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)
+        dentro = valores[~es_atipico]
+        atipicos = valores[es_atipico]
+        if len(atipicos) > max_atipicos:
+            atipicos = atipicos[
+                np.linspace(0, len(atipicos) - 1, max_atipicos).astype(int)
+            ]
+
+        return {
+            "q1": round(q1, 2),
+            "mediana": round(mediana, 2),
+            "q3": round(q3, 2),
+            "bigote_inferior": round(dentro.min(), 2),
+            "bigote_superior": round(dentro.max(), 2),
+            "media": round(media, 2),
+            "atipicos": atipicos.round(2),
+        }
+
+    def resumir(self, condiciones, inicio=None, fin=None):
+        """
+        Resumen de distribución (ver resumen_precios) de las filas que
+        cumplen `condiciones` entre inicio y fin; None si no hay filas
+        """
+        mascara = mascara_series(self.series, condiciones)
+
+        lo, hi = 0, len(self.dias)
+        if inicio and fin:
+            lo = np.searchsorted(
+                self.dias, np.datetime64(pd.Timestamp(inicio))
             )
-    except:
-        return html.Span(
-            "Error cálculo", style={"color": "orange", "fontSize": "10px"}
+            hi = np.searchsorted(
+                self.dias, np.datetime64(pd.Timestamp(fin)), side="right"
+            )
+
+        # Celdas de las series elegidas dentro de [lo, hi)
+        filas_serie = np.diff(self.inicio_serie)
+        presentes = (
+            np.repeat(mascara, filas_serie)
+            & (self.dia_celda >= lo)
+            & (self.dia_celda < hi)
         )
+        if not presentes.any():
+            return None
+
+        cajas, medias = {}, {}
+        for col in self.COLUMNAS:
+            tramos = self.tramos[col]
+            sel = mascara[tramos["serie"]]
+            # Filas de cada tramo dentro de [lo, hi)
+            dias = np.minimum(
+                tramos["hasta"][sel].astype(np.int64), hi - 1
+            ) - np.maximum(tramos["desde"][sel].astype(np.int64), lo)
+            filas = np.clip(dias + 1, 0, None) * tramos["filas"][sel]
+            conteos = np.bincount(
+                tramos["cubeta"][sel], weights=filas, minlength=self.n_cubetas
+            )
+            suma = self.suma[col][presentes].sum(dtype=np.float64)
+            medias[col] = suma / conteos.sum() if conteos.sum() else np.nan
+            cajas[col] = self._caja(conteos, medias[col])
 
+        series = np.repeat(np.arange(len(self.series)), filas_serie)
+        productos = self.series["descripcion_producto"].iloc[
+            np.unique(series[presentes])
+        ]
+        return {
+            "productos": productos.nunique(),
+            "dias": len(np.unique(self.dia_celda[presentes])),
+            "maximo": np.nanmax(self.maximo[presentes]),
+            "minimo": np.nanmin(self.minimo[presentes]),
+            "promedio": medias["promedio"],
+            "cajas": cajas,
+            "error_relativo": self.error_relativo,
+        }
 
-# FUNCIÓN PRINCIPAL PARA CREAR GRÁFICOS
-def crear_graficos(df_filtrado, df_comparativa=None):
-    if len(df_filtrado) == 0:
-        fig_vacio = go.Figure()
-        fig_vacio.update_layout(
-            title="No hay datos para los filtros seleccionados",
-            xaxis_title="Fecha",
-            yaxis_title="Precio",
-            height=500,
+
+class PivotesComparativa:
+    """
+    Pivotes producto x e-commerce de todos los días para la comparativa,
+    armados una vez por carga o actualización de datos.
+
+    Se guardan por serie y solo para las celdas (día, serie) con precio:
+    van en orden de día y serie, las del día d entre inicio_dia[d] e
+    inicio_dia[d + 1] (como en SketchPrecios, pero por día), con el precio
+    promedio (float32) y la cantidad de filas de cada una. Los filtros
+    eligen series y la comparativa de cualquier día sale de combinar dos
+    de esos tramos (el del día y el del día anterior con datos), sin volver
+    a pivotear el DataFrame filtrado.
+    """
+
+    def __init__(self, df):
+        serie, self.series = agrupar_series(df)
+        self.dias, dia = np.unique(
+            df["fecha_dia"].to_numpy(), return_inverse=True
+        )
+        n_series, n_dias = len(self.series), len(self.dias)
+
+        valores = df["promedio"].to_numpy("float64")
+        validos = ~np.isnan(valores)
+        celdas, celda, filas = np.unique(
+            dia[validos].astype(np.int64) * n_series + serie[validos],
+            return_inverse=True,
+            return_counts=True,
+        )
+        suma = np.bincount(
+            celda, weights=valores[validos], minlength=len(celdas)
+        )
+        dia_celda, serie_celda = np.divmod(celdas, n_series)
+        self.inicio_dia = np.searchsorted(dia_celda, np.arange(n_dias + 1))
+        self.serie = serie_celda.astype(
+            np.min_scalar_type(max(n_series - 1, 0))
+        )
+        self.precio = (suma / filas).astype(np.float32)
+        self.filas = filas.astype(np.min_scalar_type(filas.max(initial=0)))
+
+        self.producto = self.series[
+            "descripcion_producto"
+        ].cat.codes.to_numpy()
+        self.tienda = self.series["ecommerce"].cat.codes.to_numpy()
+        self.nombres_producto = self.series[
+            "descripcion_producto"
+        ].cat.categories
+        self.nombres_tienda = self.series["ecommerce"].cat.categories
+
+    def _celdas(self, mascara, dia):
+        """Posiciones de las celdas del día cuyas series están en mascara"""
+        desde, hasta = self.inicio_dia[dia], self.inicio_dia[dia + 1]
+        return desde + np.flatnonzero(mascara[self.serie[desde:hasta]])
+
+    def _ultimo_dia(self, mascara, lo, hi):
+        """Último día en [lo, hi) con alguna celda de las series elegidas"""
+        # Casi siempre es el último del rango: se recorre hacia atrás
+        for dia in range(hi - 1, lo - 1, -1):
+            if len(self._celdas(mascara, dia)):
+                return dia
+        return None
+
+    def _pivote(self, celdas, productos, tiendas):
+        """Precio promedio productos x tiendas de esas celdas de un día"""
+        # Código -> posición; la última celda atiende al código -1 (nulo)
+        pos_producto = np.full(len(self.nombres_producto) + 1, -1)
+        pos_producto[productos] = np.arange(len(productos))
+        pos_tienda = np.full(len(self.nombres_tienda) + 1, -1)
+        pos_tienda[tiendas] = np.arange(len(tiendas))
+
+        series = self.serie[celdas]
+        fila = pos_producto[self.producto[series]]
+        columna = pos_tienda[self.tienda[series]]
+        validas = (fila >= 0) & (columna >= 0)
+        celda = fila[validas] * len(tiendas) + columna[validas]
+        filas = self.filas[celdas][validas].astype("float64")
+        precio = self.precio[celdas][validas].astype("float64")
+
+        n_celdas = len(productos) * len(tiendas)
+        suma = np.bincount(celda, weights=precio * filas, minlength=n_celdas)
+        cuenta = np.bincount(celda, weights=filas, minlength=n_celdas)
+        with np.errstate(invalid="ignore"):
+            return (suma / cuenta).reshape(len(productos), len(tiendas))
+
+    def comparativa(self, condiciones, inicio=None, fin=None, fecha=None):
+        """
+        Lo mismo que preparar_comparativa para las series que cumplen
+        `condiciones`. Sin `fecha` usa el último día con datos entre inicio
+        y fin; con `fecha`, el último día con datos hasta esa fecha.
+        """
+        mascara = mascara_series(self.series, condiciones)
+        if not mascara.any():
+            return None
+
+        lo, hi = 0, len(self.dias)
+        if fecha:
+            hi = np.searchsorted(
+                self.dias, np.datetime64(pd.Timestamp(fecha)), side="right"
+            )
+        elif inicio and fin:
+            lo = np.searchsorted(
+                self.dias, np.datetime64(pd.Timestamp(inicio))
+            )
+            hi = np.searchsorted(
+                self.dias, np.datetime64(pd.Timestamp(fin)), side="right"
+            )
+
+        hoy = self._ultimo_dia(mascara, lo, hi)
+        if hoy is None:
+            return None
+        ayer = self._ultimo_dia(mascara, lo, hoy)
+        celdas_hoy = self._celdas(mascara, hoy)
+        celdas_ayer = (
+            self._celdas(mascara, ayer) if ayer is not None else celdas_hoy[:0]
+        )
+
+        # Productos con precio hoy; tiendas con precio hoy o el día anterior
+        productos = np.unique(self.producto[self.serie[celdas_hoy]])
+        productos = productos[productos >= 0]
+        tiendas = np.unique(
+            self.tienda[self.serie[np.r_[celdas_hoy, celdas_ayer]]]
         )
-        estadisticas = html.P(
-            "No hay datos para mostrar", className="text-danger"
+        tiendas = tiendas[tiendas >= 0]
+
+        precios_hoy = self._pivote(celdas_hoy, productos, tiendas)
+        precios_ayer = (
+            self._pivote(celdas_ayer, productos, tiendas)
+            if ayer is not None
+            else np.full_like(precios_hoy, np.nan)
         )
-        tabla = html.P("No hay datos para mostrar", className="text-danger")
-        tabla_comparativa = html.P(
-            "No hay datos para mostrar", className="text-danger"
+        return armar_comparativa(
+            pd.Timestamp(self.dias[hoy]),
+            None if ayer is None else pd.Timestamp(self.dias[ayer]),
+            self.nombres_producto[productos].astype(str).to_numpy(),
+            list(self.nombres_tienda[tiendas]),
+            precios_hoy,
+            precios_ayer,
         )
+
+
+class AlmacenCompartido:
+    """
+    Objetos compartidos entre los workers de la máquina a través de disco.
+
+    Cada versión se guarda en su propio archivo (pickle protocolo 5 con los
+    arrays fuera de banda y alineados) que los workers mapean en memoria de
+    solo lectura, así el sistema operativo mantiene una sola copia de esas
+    páginas para todos. Un sello con la versión vigente se reemplaza de
+    forma atómica al guardar y cada worker vuelve a mapear solo cuando
+    cambia.
+
+    Lo publicado sobrevive a los reinicios. `formato` se sube cuando cambia
+    la forma de lo que se guarda: lo que quedó con otro formato (p. ej. de
+    antes de un deploy) no se lee y se borra al guardar.
+    """
+
+    class _Pickler(pickle.Pickler):
+        def reducer_override(self, objeto):
+            # numpy no expone los arrays de fechas (datetime64/timedelta64)
+            # como buffer y quedarían copiados dentro del pickle: se guardan
+            # como sus int64, fuera de banda, y al cargar se ven de nuevo
+            # como fechas, sin copiar
+            if isinstance(objeto, np.ndarray) and objeto.dtype.kind in "mM":
+                return np.ndarray.view, (objeto.view(np.int64), objeto.dtype)
+            return NotImplemented
+
+    def __init__(self, directorio, nombre, formato=1):
+        self.directorio = directorio_privado(directorio)
+        self.nombre = nombre
+        self.formato = formato
+        self.sello = os.path.join(directorio, f"{nombre}.v{formato}.version")
+        self._lock = threading.Lock()
+        self._version = None
+        self._valor = None
+
+    def _ruta(self, version):
+        return os.path.join(
+            self.directorio, f"{self.nombre}-v{self.formato}-{version}.bin"
+        )
+
+    def version(self):
+        """Versión vigente, o None si todavía no se guardó ninguna"""
+        try:
+            with open(self.sello) as f:
+                return f.read() or None
+        except FileNotFoundError:
+            return None
+
+    def _marca(self, marca):
+        return self.sello if marca is None else f"{self.sello}.{marca}"
+
+    def edad(self, marca=None):
+        """
+        Segundos desde que se publicó (o se revisó, ver tocar) la versión
+        vigente, o desde que se tocó `marca`; None si no hay
+        """
+        try:
+            return time.time() - os.stat(self._marca(marca)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def tocar(self, marca=None, momento=None):
+        """
+        Marca la versión vigente como recién revisada. Con `marca` toca en
+        cambio esa marca (p. ej. "completa", la de la última carga completa)
+        y con `momento` (timestamp) la fecha en ese momento y no ahora.
+        """
+        ruta = self._marca(marca)
+        if marca is not None:
+            open(ruta, "a").close()
+        os.utime(ruta, None if momento is None else (momento, momento))
+
+    @contextmanager
+    def exclusivo(self):
+        """Lock entre procesos (y entre hilos) sobre este almacén"""
+        with open(
+            os.path.join(self.directorio, f"{self.nombre}.lock"), "w"
+        ) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def guardar(self, valor, version, revisado=None):
+        """
+        Publica `valor` como la versión vigente y lo devuelve ya mapeado.
+        revisado (timestamp) fija desde cuándo cuenta su edad, si no es
+        ahora.
+        """
+        buffers = []
+        salida = io.BytesIO()
+        self._Pickler(salida, protocol=5, buffer_callback=buffers.append).dump(
+            valor
+        )
+        cuerpo = salida.getvalue()
+
+        ruta = self._ruta(version)
+        with open(ruta + ".parcial", "wb") as f:
+            posiciones = []
+            # Varios arrays pueden ser vistas de la misma memoria (p. ej. los
+            # códigos de una categórica en el DataFrame y en el índice): se
+            # escriben una vez y al cargar vuelven a compartir las páginas
+            escritos = {}
+            for buffer in buffers:
+                datos = buffer.raw()
+                direccion = (
+                    np.frombuffer(datos, np.uint8).ctypes.data,
+                    datos.nbytes,
+                )
+                if direccion not in escritos:
+                    f.write(bytes(-f.tell() % 64))
+                    escritos[direccion] = (f.tell(), datos.nbytes)
+                    f.write(datos)
+                posiciones.append(escritos[direccion])
+            inicio = f.tell()
+            f.write(pickle.dumps((cuerpo, posiciones), protocol=5))
+            f.write(inicio.to_bytes(8, "little"))
+        os.replace(ruta + ".parcial", ruta)
+
+        with open(self.sello + ".parcial", "w") as f:
+            f.write(version)
+        if revisado is not None:
+            os.utime(self.sello + ".parcial", (revisado, revisado))
+        os.replace(self.sello + ".parcial", self.sello)
+
+        # Las versiones anteriores (y los sellos y marcas de otros formatos)
+        # se pueden borrar aunque otro worker las tenga mapeadas: el archivo
+        # vive hasta que se deja de usar
+        for entrada in os.scandir(self.directorio):
+            anterior = entrada.name.startswith(f"{self.nombre}-") or (
+                entrada.name.startswith(f"{self.nombre}.v")
+                and not entrada.path.startswith(self.sello)
+            )
+            if anterior and entrada.path != ruta:
+                try:
+                    os.remove(entrada.path)
+                except FileNotFoundError:
+                    pass
+
+        return self.obtener(version)
+
+    def obtener(self, version):
+        """Valor de `version`; solo se vuelve a mapear si no es la local"""
+        with self._lock:
+            if self._version != version:
+                self._valor = self._mapear(version)
+                self._version = version
+            return self._valor
+
+    def _mapear(self, version):
+        with open(self._ruta(version), "rb") as f:
+            vista = memoryview(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        inicio = int.from_bytes(vista[-8:], "little")
+        cuerpo, posiciones = pickle.loads(vista[inicio:-8])
+        return pickle.loads(
+            cuerpo, buffers=[vista[i : i + n] for i, n in posiciones]
+        )
+
+
+# Datos de precios compartidos entre workers; el formato se sube al cambiar
+# lo que guarda guardar_precios
+almacen_precios = AlmacenCompartido(DIRECTORIO_DATOS, "precios", formato=4)
+
+
+def consultar_huella():
+    """
+    Huella de la vista que se consulta sin traerla: última fecha_dia, total
+    de filas y, de los últimos DIAS_HUELLA días, cuántas filas hay y la suma
+    de sus precios. Si no cambia, los datos cargados siguen al día.
+    """
+    with engine.connect() as conn:
+        fecha_max, filas = conn.execute(
+            text(
+                """
+                SELECT MAX(fecha_dia), COUNT(*)
+                FROM vw_peco_ecommerce_antiparasitarios_daily
+                """
+            )
+        ).one()
+        filas_recientes, suma_reciente = 0, 0
+        if fecha_max is not None:
+            desde = pd.Timestamp(fecha_max).date() - timedelta(
+                days=DIAS_HUELLA
+            )
+            filas_recientes, suma_reciente = conn.execute(
+                text(
+                    """
+                    SELECT
+                        COUNT(*),
+                        SUM(
+                            COALESCE(promedio, 0)
+                            + COALESCE(maximo, 0)
+                            + COALESCE(minimo, 0)
+                        )
+                    FROM vw_peco_ecommerce_antiparasitarios_daily
+                    WHERE fecha_dia >= :desde
+                    """
+                ),
+                {"desde": desde},
+            ).one()
+
+    clave = (
+        f"{fecha_max}|{filas}|{filas_recientes}|"
+        f"{round(float(suma_reciente or 0), 2)}"
+    )
+    return hashlib.blake2b(clave.encode(), digest_size=8).hexdigest()
+
+
+def escribir_instantanea(datos):
+    """Guarda el DataFrame y su versión en RUTA_INSTANTANEA (Parquet)"""
+    tabla = pa.Table.from_pandas(datos["df"], preserve_index=False)
+    tabla = tabla.replace_schema_metadata(
+        {
+            **tabla.schema.metadata,
+            b"huella": datos["huella"].encode(),
+            b"carga_completa": datos["carga_completa"].isoformat().encode(),
+            b"datos_al": datos["datos_al"].isoformat().encode(),
+        }
+    )
+    pq.write_table(tabla, RUTA_INSTANTANEA + ".parcial", compression="zstd")
+    os.replace(RUTA_INSTANTANEA + ".parcial", RUTA_INSTANTANEA)
+
+
+def leer_instantanea():
+    """
+    (df, huella, carga_completa, datos_al) de la instantánea local, o None
+    si no hay o no se puede leer
+    """
+    try:
+        tabla = pq.read_table(RUTA_INSTANTANEA)
+        metadata = tabla.schema.metadata
+        return (
+            tipar_precios(tabla.to_pandas()),
+            metadata[b"huella"].decode(),
+            datetime.fromisoformat(metadata[b"carga_completa"].decode()),
+            datetime.fromisoformat(metadata[b"datos_al"].decode()),
+        )
+    except (OSError, KeyError, pa.ArrowInvalid):
+        return None
+
+
+def copiar_consulta(query, params=None, dtype=None, parse_dates=None):
+    """
+    Ejecuta `query` (con parámetros al estilo psycopg2) con COPY ... TO STDOUT
+    en CSV y lo lee con pd.read_csv a medida que llega: Postgres escribe en
+    un pipe desde otro hilo y el parser de C de pandas arma las columnas con
+    sus tipos, sin pasar por objetos Python por celda.
+    """
+    conexion = engine.raw_connection()
+    try:
+        with conexion.cursor() as cursor:
+            consulta = cursor.mogrify(query, params).decode()
+        copy = f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+        lectura, escritura = os.pipe()
+        errores = []
+
+        def copiar():
+            try:
+                with (
+                    os.fdopen(escritura, "wb") as salida,
+                    conexion.cursor() as cursor,
+                ):
+                    cursor.copy_expert(copy, salida)
+            except (psycopg2.Error, OSError) as error:
+                errores.append(error)
+
+        hilo = threading.Thread(target=copiar, daemon=True)
+        hilo.start()
+        try:
+            # Si read_csv falla, cerrar el pipe corta también el COPY
+            with os.fdopen(lectura, "rb") as entrada:
+                df = pd.read_csv(
+                    entrada,
+                    dtype=dtype,
+                    parse_dates=parse_dates,
+                    date_format="ISO8601",
+                    # En CSV de Postgres solo el vacío es NULL: textos
+                    # como "NA" o "null" se quedan como texto, igual que
+                    # con read_sql
+                    keep_default_na=False,
+                    na_values=[""],
+                )
+        except (ValueError, OSError) as error:
+            # Si el COPY falló, read_csv solo ve el pipe cortado (p. ej.
+            # EmptyDataError): el error que importa es el de Postgres
+            hilo.join()
+            if errores:
+                raise errores[0] from error
+            raise
+        hilo.join()
+        if errores:
+            raise errores[0]
+        return df
+    finally:
+        conexion.close()
+
+
+def leer_precios(desde=None, metodo=None):
+    """
+    Lee la vista diaria, opcionalmente solo desde una fecha_dia en adelante.
+    metodo es "copy" o "read_sql" (por defecto METODO_CARGA).
+    """
+    query = """
+        SELECT *
+        FROM vw_peco_ecommerce_antiparasitarios_daily
+    """
+    params = {}
+    if desde is not None:
+        params["desde"] = pd.Timestamp(desde).date()
+
+    if (metodo or METODO_CARGA) == "copy":
+        if params:
+            query += " WHERE fecha_dia >= %(desde)s"
+        df = copiar_consulta(
+            query, params, dtype=ESQUEMA_PRECIOS, parse_dates=["fecha_dia"]
+        )
+        return tipar_precios(df)
+
+    if params:
+        query += " WHERE fecha_dia >= :desde"
+    df = pd.read_sql(text(query), engine, params=params)
+    return tipar_precios(df)
+
+
+def guardar_precios(
+    df, huella, carga_completa=None, datos_al=None, instantanea=True
+):
+    """
+    Ordena por fecha_dia, construye el índice, los sketches de cuantiles y
+    los pivotes de la comparativa y publica todo en el almacén compartido
+    (y, si instantanea=True, en la instantánea local). carga_completa es el
+    momento de la última lectura completa de la vista y datos_al el de la
+    lectura de df (ahora, si no se indican).
+
+    La versión es la huella de la vista más el momento de la carga completa
+    que trajo los datos: mientras la vista no cambie se mantiene (y con ella
+    el caché de resultados). Una carga completa con correcciones en días
+    que la huella no mira empieza una versión nueva; si trae lo mismo no se
+    publica (ver refrescar_datos_precios).
+    """
+    df = df.sort_values("fecha_dia", kind="stable", ignore_index=True)
+    datos_al = datos_al or datetime.now()
+    carga_completa = carga_completa or datos_al
+    datos = {
+        "df": df,
+        "indice": IndicePrecios(df),
+        "sketch": SketchPrecios(df),
+        "pivotes": PivotesComparativa(df),
+        "catalogo": catalogo_precios(df),
+        "version": f"{huella}-{int(carga_completa.timestamp() * 1000)}",
+        "huella": huella,
+        "datos_al": datos_al,
+        "carga_completa": carga_completa,
+    }
+    if instantanea:
+        escribir_instantanea(datos)
+    # Su edad cuenta desde que se leyeron de la vista, así los datos que
+    # vienen de una instantánea vieja se reconcilian de inmediato
+    return almacen_precios.guardar(
+        datos, datos["version"], revisado=datos_al.timestamp()
+    )
+
+
+def cargar_datos_iniciales():
+    """
+    Primera carga, cuando no hay ninguna versión publicada: desde la
+    instantánea local si la hay (refresco_precios la pone al día con la
+    base en segundo plano) y si no, desde Postgres
+    """
+    instantanea = leer_instantanea()
+    if instantanea is None:
+        datos = guardar_precios(leer_precios(), consultar_huella())
+    else:
+        df, huella, carga_completa, datos_al = instantanea
+        datos = guardar_precios(
+            df, huella, carga_completa, datos_al, instantanea=False
+        )
+    almacen_precios.tocar("completa", datos["carga_completa"].timestamp())
+    return datos
+
+
+def get_datos_precios():
+    """
+    Datos de la versión vigente, sin esperar a que se refresquen: de eso se
+    encarga refresco_precios en segundo plano. Al reiniciar se mapean los
+    que quedaron publicados, sin volver a armar índice, sketches ni
+    pivotes; solo el arranque en frío (sin ninguna versión publicada en
+    este formato) carga en el momento.
+    """
+    version = almacen_precios.version()
+    if version is None:
+        # Un solo worker hace la carga inicial y el resto espera el lock y
+        # usa la que dejó publicada
+        with almacen_precios.exclusivo():
+            version = almacen_precios.version()
+            if version is None:
+                version = cargar_datos_iniciales()["version"]
+    try:
+        return almacen_precios.obtener(version)
+    except FileNotFoundError:
+        # Otro worker publicó una versión más nueva entre medio
+        return get_datos_precios()
+
+
+def get_precios_por_dia():
+    return get_datos_precios()["df"]
+
+
+def suma_control(df):
+    """Suma de control del contenido de df, sin importar el orden de filas"""
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def refrescar_datos_precios(completa=False):
+    """
+    Actualiza los datos de forma incremental: usa la última fecha_dia vista
+    como marca de agua y solo trae las filas desde esa fecha (inclusive, para
+    recoger scrapes tardíos del último día), reemplazándolas en el almacén.
+    Con completa=True (o sin datos previos) vuelve a leer la vista entera,
+    lo que recoge correcciones en días anteriores a la marca de agua.
+
+    Antes se consulta la huella de la vista: si es la de los datos cargados
+    no se trae nada y se siguen usando esos. Una carga completa que trae
+    los mismos datos tampoco publica nada, así la versión (y el caché de
+    resultados de los workers) se mantiene.
+    """
+    # La huella se toma antes de leer: si la vista cambia entre medio, la
+    # próxima consulta de la huella ya no coincide y se vuelve a cargar
+    huella = consultar_huella()
+    version = almacen_precios.version()
+    datos = None if version is None else almacen_precios.obtener(version)
+    misma_huella = datos is not None and datos["huella"] == huella
+
+    if completa or datos is None or datos["df"].empty:
+        df_nuevo = leer_precios()
+        sin_cambios = misma_huella and (
+            suma_control(df_nuevo) == suma_control(datos["df"])
+        )
+        if not sin_cambios:
+            datos = guardar_precios(df_nuevo, huella)
+        almacen_precios.tocar()
+        almacen_precios.tocar("completa")
+        return datos
+
+    if misma_huella:
+        almacen_precios.tocar()
+        return datos
+
+    df = datos["df"]
+    marca_agua = df["fecha_dia"].max()
+    df_nuevo = leer_precios(desde=marca_agua)
+    return guardar_precios(
+        concatenar_precios(df[df["fecha_dia"] < marca_agua], df_nuevo),
+        huella,
+        carga_completa=datos["carga_completa"],
+    )
+
+
+class RefrescoDatos:
+    """
+    Refresca los datos de precios en un hilo de fondo, cada `intervalo`
+    segundos y cada vez que se pide, mientras se siguen sirviendo los de la
+    versión vigente; la nueva versión se publica de una vez en el almacén.
+
+    Cada worker tiene su hilo, pero la carga se hace con el lock del almacén
+    tomado, así los pedidos simultáneos (de varios callbacks, usuarios o
+    workers) se suman al refresco que ya está en curso: al conseguir el lock
+    ven que la versión es de hace menos de `reuso` segundos y no consultan de
+    nuevo. El refresco periódico se salta igual si otro worker publicó hace
+    menos de un intervalo.
+    """
+
+    def __init__(self, almacen, intervalo, reuso=0):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self.reuso = reuso
+        self._pedido = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def iniciar(self):
+        """
+        Arranca el hilo en este proceso, también después de un fork. Lo
+        primero que hace es un refresco pedido, para reconciliar con la base
+        los datos con que arrancó el proceso (p. ej. de la instantánea)
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pedido.set()
+            threading.Thread(
+                target=self._ciclo, name="refresco-precios", daemon=True
+            ).start()
+
+    def solicitar(self):
+        """Pide un refresco y vuelve de inmediato, sin esperarlo"""
+        self.iniciar()
+        self._pedido.set()
+
+    def _ciclo(self):
+        while True:
+            pedido = self._pedido.wait(self.intervalo)
+            self._pedido.clear()
+            try:
+                self.refrescar(forzar=pedido)
+            except Exception:
+                # Si falla se siguen sirviendo los datos que había
+                server.logger.exception("Falló el refresco de precios")
+
+    def refrescar(self, forzar=False):
+        with self.almacen.exclusivo():
+            edad = self.almacen.edad()
+            if edad is not None and edad < (
+                self.reuso if forzar else self.intervalo
+            ):
+                return
+            edad_completa = self.almacen.edad("completa")
+            refrescar_datos_precios(
+                completa=edad_completa is None
+                or edad_completa > SEGUNDOS_VIGENCIA_CACHE
+            )
+
+
+refresco_precios = RefrescoDatos(
+    almacen_precios, MINUTOS_REFRESCO * 60, reuso=SEGUNDOS_REUSO_REFRESCO
+)
+
+
+@server.before_request
+def iniciar_refresco():
+    """
+    El refresco en segundo plano corre solo en los procesos que sirven la
+    app (cada worker, tras el fork). Los trabajos en segundo plano y los
+    scripts que importan este módulo usan la versión publicada sin arrancar
+    su propio hilo.
+    """
+    if MODO_CONSULTA != "sql":
+        refresco_precios.iniciar()
+
+
+# Catálogo de opciones de filtros (modo sql), compartido entre los workers
+# para que todos sirvan la misma versión. Los refrescos simultáneos esperan
+# el lock del almacén y usan el que dejó publicado el que estaba en curso
+almacen_catalogo = AlmacenCompartido(DIRECTORIO_DATOS, "catalogo")
+
+
+def construir_consulta_filtros(
+    filtros, columnas=None, aplicar_ecommerce=True, orden=None
+):
+    """
+    Compila el estado de filtros del dashboard a un SELECT parametrizado
+    sobre la vista diaria. Devuelve la consulta y sus parámetros.
+    """
+    condiciones = condiciones_filtros(filtros, aplicar_ecommerce)
+    where = [f"{columna} IN :{columna}" for columna in condiciones]
+    params = dict(condiciones)
+
+    if filtros.get("start_date") and filtros.get("end_date"):
+        where.append("fecha_dia BETWEEN :start_date AND :end_date")
+        params["start_date"] = pd.Timestamp(filtros["start_date"]).date()
+        params["end_date"] = pd.Timestamp(filtros["end_date"]).date()
+
+    query = f"""
+        SELECT {", ".join(columnas) if columnas else "*"}
+        FROM vw_peco_ecommerce_antiparasitarios_daily
+    """
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    if orden:
+        query += " ORDER BY " + ", ".join(orden)
+
+    consulta = text(query).bindparams(
+        *[bindparam(columna, expanding=True) for columna in condiciones]
+    )
+    return consulta, params
+
+
+def consultar_precios_filtrados(
+    filtros, columnas=None, aplicar_ecommerce=True, orden=None
+):
+    """Trae de Postgres solo las filas y columnas que piden los filtros"""
+    consulta, params = construir_consulta_filtros(
+        filtros, columnas, aplicar_ecommerce, orden
+    )
+    df = pd.read_sql(consulta, engine, params=params)
+    return tipar_precios(df)
+
+
+def catalogo_precios(df):
+    """Opciones de cada filtro y rango de fechas de un DataFrame de precios"""
+    catalogo = {}
+    for col in COLUMNAS_CATALOGO:
+        # Categorías con filas (tras concatenar puede haber de más); los
+        # nulos tienen código -1
+        codigos = np.unique(df[col].cat.codes.to_numpy())
+        catalogo[col] = sorted(df[col].cat.categories[codigos[codigos >= 0]])
+    catalogo["fecha_min"] = df["fecha_dia"].min()
+    catalogo["fecha_max"] = df["fecha_dia"].max()
+    return catalogo
+
+
+def get_catalogo_filtros(refrescar=False):
+    """
+    Opciones de cada filtro y rango de fechas disponible. En modo memoria se
+    arman una vez al guardar los datos (ver guardar_precios); en modo sql se
+    consultan con DISTINCT/MIN/MAX en vez de cargar la vista completa y se
+    publican en almacen_catalogo; pasado SEGUNDOS_VIGENCIA_CACHE (o al pedir
+    un refresco, si el publicado es de hace más de SEGUNDOS_REUSO_REFRESCO)
+    se vuelve a mirar la huella de la vista.
+    """
+    if MODO_CONSULTA != "sql":
+        if refrescar:
+            refresco_precios.solicitar()
+        return get_datos_precios()["catalogo"]
+
+    def vigente(edad):
         return (
-            fig_vacio,
-            fig_vacio,
-            fig_vacio,
-            estadisticas,
-            tabla,
-            tabla_comparativa,
+            edad is not None
+            and edad <= SEGUNDOS_VIGENCIA_CACHE
+            and not (refrescar and edad > SEGUNDOS_REUSO_REFRESCO)
+        )
+
+    version = almacen_catalogo.version()
+    if vigente(almacen_catalogo.edad()):
+        try:
+            return almacen_catalogo.obtener(version)
+        except FileNotFoundError:
+            pass  # otro worker publicó uno nuevo entre medio
+
+    with almacen_catalogo.exclusivo():
+        version = almacen_catalogo.version()
+        if vigente(almacen_catalogo.edad()):
+            return almacen_catalogo.obtener(version)
+
+        # Con la misma huella el catálogo (y la versión) siguen valiendo
+        huella = consultar_huella()
+        if version == huella:
+            almacen_catalogo.tocar()
+            return almacen_catalogo.obtener(version)
+
+        df_dim = pd.read_sql(
+            text(
+                f"""
+                SELECT DISTINCT {", ".join(COLUMNAS_CATALOGO)}
+                FROM vw_peco_ecommerce_antiparasitarios_daily
+                """
+            ),
+            engine,
+        )
+        df_fechas = pd.read_sql(
+            text(
+                """
+                SELECT MIN(fecha_dia) AS fecha_min, MAX(fecha_dia) AS fecha_max
+                FROM vw_peco_ecommerce_antiparasitarios_daily
+                """
+            ),
+            engine,
+        )
+        catalogo = {
+            col: sorted(df_dim[col].dropna().unique())
+            for col in COLUMNAS_CATALOGO
+        }
+        catalogo["fecha_min"] = pd.Timestamp(df_fechas["fecha_min"].iloc[0])
+        catalogo["fecha_max"] = pd.Timestamp(df_fechas["fecha_max"].iloc[0])
+        catalogo["version"] = huella
+        catalogo["datos_al"] = datetime.now()
+        return almacen_catalogo.guardar(catalogo, huella)
+
+
+def get_version_datos():
+    """
+    Versión de los datos, derivada de la huella de la vista: solo cambia
+    cuando cambian los datos (o, en modo memoria, con una carga completa que
+    trae correcciones)
+    """
+    if MODO_CONSULTA == "sql":
+        return get_catalogo_filtros()["version"]
+    version = almacen_precios.version()
+    if version is None:
+        # guardar_precios la vuelve a publicar en el almacén
+        version = get_datos_precios()["version"]
+    return version
+
+
+def get_datos_al():
+    """Momento en que se cargaron los datos que se están sirviendo"""
+    if MODO_CONSULTA == "sql":
+        return get_catalogo_filtros()["datos_al"]
+    return get_datos_precios()["datos_al"]
+
+
+def texto_datos_al(datos_al):
+    return f"Datos al {datos_al:%d/%m/%Y %H:%M}"
+
+
+def get_fecha_max():
+    """Última fecha_dia disponible"""
+    if MODO_CONSULTA == "sql":
+        return get_catalogo_filtros()["fecha_max"]
+    # El DataFrame cacheado está ordenado por fecha_dia
+    return get_precios_por_dia()["fecha_dia"].iloc[-1]
+
+
+def posiciones_filtro(filtros, indice):
+    """
+    Posiciones (ascendentes) de las filas que cumplen los filtros, con y sin
+    el de e-commerce. Si no hay filtro de e-commerce ambas son el mismo array.
+    """
+    ecommerce = condiciones_filtros(filtros).get("ecommerce")
+    pos_base = indice.seleccionar(
+        condiciones_filtros(filtros, aplicar_ecommerce=False),
+        filtros.get("start_date"),
+        filtros.get("end_date"),
+    )
+    if not ecommerce:
+        return pos_base, pos_base
+    return indice.restringir(pos_base, "ecommerce", ecommerce), pos_base
+
+
+def filtrar_precios(
+    filtros, columnas=None, con_comparativa=True, orden=None, datos=None
+):
+    """
+    Motor de filtros compartido por los gráficos, la comparativa y la
+    descarga. La selección base (todos los filtros menos e-commerce) se
+    calcula una sola vez y de ella se deriva la vista con e-commerce.
+
+    Devuelve (df_filtrado, df_comparativa); df_comparativa es el mismo objeto
+    que df_filtrado si no hay filtro de e-commerce, y None si
+    con_comparativa=False.
+    """
+    ecommerce = condiciones_filtros(filtros).get("ecommerce")
+
+    if MODO_CONSULTA == "sql":
+        # Sin comparativa el filtro de e-commerce también va a la consulta
+        df_base = consultar_precios_filtrados(
+            filtros,
+            columnas,
+            aplicar_ecommerce=not con_comparativa,
+            orden=orden,
         )
+        if not con_comparativa:
+            return df_base, None
+        if not ecommerce:
+            return df_base, df_base
+        return df_base[df_base["ecommerce"].isin(ecommerce)], df_base
+
+    datos = datos or get_datos_precios()
+    df = datos["df"]
+    ubicacion_columnas = (
+        slice(None) if columnas is None else df.columns.get_indexer(columnas)
+    )
+    pos, pos_base = posiciones_filtro(filtros, datos["indice"])
+
+    df_filtrado = df.iloc[pos, ubicacion_columnas]
+    if orden:
+        df_filtrado = df_filtrado.sort_values(orden)
+
+    if not con_comparativa:
+        return df_filtrado, None
+    if pos is pos_base:
+        return df_filtrado, df_filtrado
+    return df_filtrado, df.iloc[pos_base, ubicacion_columnas]
+
+
+class CacheLRU:
+    """
+    Caché LRU en memoria del proceso, acotado por tamaño en bytes. El tamaño
+    de cada entrada lo estima quien la guarda.
+    """
+
+    # Marca de entrada ausente: un valor guardado puede ser None
+    _FALTA = object()
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        # llave -> [lock, hilos que lo usan]
+        self._calculando = {}
+
+    def get(self, llave, defecto=None):
+        with self._lock:
+            if llave not in self._entradas:
+                return defecto
+            self._entradas.move_to_end(llave)
+            return self._entradas[llave][0]
+
+    def set(self, llave, valor, tamano):
+        if tamano > self.max_bytes:
+            return
+        with self._lock:
+            if llave in self._entradas:
+                self.bytes -= self._entradas.pop(llave)[1]
+            self._entradas[llave] = (valor, tamano)
+            self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                _, (_, tamano_viejo) = self._entradas.popitem(last=False)
+                self.bytes -= tamano_viejo
+
+    def obtener(self, llave, calcular, tamano=None):
+        """
+        get que, si falta la entrada, la calcula con `calcular()` y la guarda.
+        Si varios hilos piden la misma llave a la vez solo uno calcula y el
+        resto espera ese resultado. El lock de la llave se descarta cuando
+        ya no lo usa ningún hilo.
+        """
+        valor = self.get(llave, self._FALTA)
+        if valor is not self._FALTA:
+            return valor
+        with self._lock:
+            espera = self._calculando.setdefault(llave, [threading.Lock(), 0])
+            espera[1] += 1
+        try:
+            with espera[0]:
+                valor = self.get(llave, self._FALTA)
+                if valor is self._FALTA:
+                    valor = calcular()
+                    self.set(llave, valor, (tamano or tamano_en_bytes)(valor))
+        finally:
+            with self._lock:
+                espera[1] -= 1
+                if not espera[1]:
+                    del self._calculando[llave]
+        return valor
+
+
+cache_resultados = CacheLRU(CACHE_RESULTADOS_MB * 1024 * 1024)
+
+
+def tamano_en_bytes(valor):
+    """Estimación del tamaño en memoria de DataFrames, figuras y componentes"""
+    if valor is None:
+        return 0
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamano_en_bytes(v) for v in valor)
+    return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def normalizar_filtros(filtros):
+    """
+    Forma canónica del estado de filtros: productos ordenados, None como
+    "ALL" y fechas ISO. Dos estados equivalentes dan la misma tupla.
+    """
+    fechas = [
+        pd.Timestamp(filtros[clave]).date().isoformat()
+        if filtros.get("start_date") and filtros.get("end_date")
+        else None
+        for clave in ("start_date", "end_date")
+    ]
+    return (
+        tuple(sorted(filtros.get("nombre_producto") or [])),
+        *(
+            "ALL" if filtros.get(clave) is None else filtros[clave]
+            for clave in COLUMNAS_FILTRO
+        ),
+        *fechas,
+    )
+
+
+def version_filtros(filtros):
+    """
+    Versión de datos de un estado de filtros: el token de store-df-version
+    que update_dashboard deja en él, así todas las salidas de una misma
+    actualización de la página comparten la llave aunque entre medio se
+    publique otra versión. Sin token (p. ej. en las descargas), la vigente.
+    """
+    return filtros.get("version") or get_version_datos()
+
+
+def obtener_filtrados(filtros):
+    """
+    filtrar_precios con caché LRU por (versión, filtros); la versión es la
+    de version_filtros
+    """
+
+    def tamano(resultado):
+        # Si no hay filtro de e-commerce ambos son el mismo objeto
+        if resultado[1] is resultado[0]:
+            return tamano_en_bytes(resultado[0])
+        return tamano_en_bytes(resultado[0]) + tamano_en_bytes(resultado[1])
+
+    llave = (
+        "filtrados",
+        version_filtros(filtros),
+        normalizar_filtros(filtros),
+    )
+    return cache_resultados.obtener(
+        llave, lambda: filtrar_precios(filtros, COLUMNAS_DASHBOARD), tamano
+    )
+
+
+def obtener_salida(nombre, filtros):
+    """
+    Una salida del dashboard (ver SALIDAS_DASHBOARD) con caché LRU por
+    (salida, versión, filtros); las que usan filas parten del mismo
+    DataFrame filtrado
+    """
+    llave = (nombre, version_filtros(filtros), normalizar_filtros(filtros))
+
+    def calcular():
+        if nombre in SALIDAS_RESUMEN:
+            return SALIDAS_DASHBOARD[nombre](obtener_resumen(filtros))
+        return SALIDAS_DASHBOARD[nombre](obtener_filtrados(filtros)[0])
+
+    return cache_resultados.obtener(llave, calcular)
+
+
+def obtener_resumen(filtros):
+    """
+    Resumen de distribución para el boxplot y las estadísticas. Con los
+    datos en memoria se arma combinando los sketches, sin recorrer filas; en
+    modo sql se calcula sobre el DataFrame filtrado.
+    """
+    if MODO_CONSULTA == "sql":
+        return resumen_precios(obtener_filtrados(filtros)[0])
+    return get_datos_precios()["sketch"].resumir(
+        condiciones_filtros(filtros),
+        filtros.get("start_date"),
+        filtros.get("end_date"),
+    )
+
+
+def obtener_comparativa(filtros, fecha=None):
+    """
+    Comparativa del último día con datos (o del último hasta `fecha`) con
+    caché LRU; la llave ignora el filtro de e-commerce porque la comparativa
+    siempre muestra todas las tiendas. Con los datos en memoria sale de los
+    pivotes precalculados; en modo sql se pivotea el DataFrame filtrado.
+    """
+    llave = (
+        "comparativa",
+        version_filtros(filtros),
+        normalizar_filtros(dict(filtros, ecommerce="ALL")),
+        fecha,
+    )
+
+    def calcular():
+        if MODO_CONSULTA != "sql":
+            return get_datos_precios()["pivotes"].comparativa(
+                condiciones_filtros(filtros, aplicar_ecommerce=False),
+                filtros.get("start_date"),
+                filtros.get("end_date"),
+                fecha,
+            )
+        filtros_dia = filtros
+        if fecha:
+            # Ventana que alcanza para encontrar el día anterior con datos
+            filtros_dia = dict(
+                filtros,
+                start_date=(pd.Timestamp(fecha) - timedelta(days=31)).strftime(
+                    "%Y-%m-%d"
+                ),
+                end_date=fecha,
+            )
+        return preparar_comparativa(obtener_filtrados(filtros_dia)[1], fecha)
+
+    return cache_resultados.obtener(llave, calcular)
+
+
+def lttb_por_bloques(x, y, limites, n_salida):
+    """
+    Largest-Triangle-Three-Buckets sobre varias series contiguas a la vez
+    (la serie k ocupa x[limites[k]:limites[k + 1]]). De cada serie con más
+    de `n_salida` puntos conserva el primero, el último y, en cada cubeta
+    intermedia, el que forma el triángulo de mayor área con el punto elegido
+    antes y el promedio de la cubeta siguiente; así se mantienen picos y
+    caídas con pocos puntos. Las cubetas se recorren en orden, pero cada
+    paso se calcula para todas las series juntas.
+
+    Devuelve, por serie, las posiciones (absolutas) de los puntos a dibujar.
+    """
+    inicios, fines = limites[:-1], limites[1:]
+    series = [np.arange(inicio, fin) for inicio, fin in pairwise(limites)]
+    largas = np.flatnonzero(fines - inicios > n_salida)
+    if n_salida < 3 or len(largas) == 0:
+        return series
+
+    # Las fechas se tratan como nanosegundos desde la primera
+    if x.dtype.kind == "M":
+        x = x.astype("int64")
+        x = x - x.min()
+    x = x.astype("float64")
+    y = y.astype("float64")
+
+    # Cortes de cada serie larga: primer punto, n_salida - 2 cubetas y
+    # último punto, es decir n_salida segmentos [cortes[j], cortes[j + 1])
+    inicio, largo = inicios[largas], fines[largas] - inicios[largas]
+    cortes = np.empty((len(largas), n_salida + 1), dtype=np.int64)
+    cortes[:, 0] = inicio
+    cortes[:, 1:-1] = inicio[:, None] + (
+        1
+        + np.arange(n_salida - 1)[None, :]
+        * (largo[:, None] - 2)
+        / (n_salida - 2)
+    ).astype(np.int64)
+    cortes[:, -1] = inicio + largo
+
+    # Promedio de cada segmento a partir de sumas acumuladas
+    suma_x = np.r_[0.0, np.cumsum(x)]
+    suma_y = np.r_[0.0, np.cumsum(y)]
+    cantidad = cortes[:, 1:] - cortes[:, :-1]
+    x_prom = (suma_x[cortes[:, 1:]] - suma_x[cortes[:, :-1]]) / cantidad
+    y_prom = (suma_y[cortes[:, 1:]] - suma_y[cortes[:, :-1]]) / cantidad
+
+    elegidos = np.empty((len(largas), n_salida), dtype=np.int64)
+    elegidos[:, 0] = inicio
+    elegidos[:, -1] = inicio + largo - 1
+
+    filas = np.arange(len(largas))
+    paso = np.arange(cantidad[:, 1:-1].max())
+    a = inicio
+    for j in range(1, n_salida - 1):
+        pos = cortes[:, j, None] + paso[None, :]
+        valido = pos < cortes[:, j + 1, None]
+        pos = np.where(valido, pos, cortes[:, j, None])
+
+        x_a, y_a = x[a][:, None], y[a][:, None]
+        x_sig, y_sig = x_prom[:, j + 1, None], y_prom[:, j + 1, None]
+        areas = np.abs(
+            (x_a - x_sig) * (y[pos] - y_a) - (x_a - x[pos]) * (y_sig - y_a)
+        )
+        areas[~valido] = -1
+
+        a = pos[filas, np.argmax(areas, axis=1)]
+        elegidos[:, j] = a
+
+    for fila, serie in enumerate(largas):
+        series[serie] = elegidos[fila]
+    return series
+
+
+def hover_principal(frecuencia=None):
+    """Plantilla del hover del gráfico principal (diario o por cubeta)"""
+    etiqueta = "Semana del" if frecuencia else "Fecha:"
+    return (
+        "<b>%{fullData.name}</b><br>"
+        + etiqueta
+        + " %{x|%d %b %Y}<br>"
+        + "Prom: S/ %{customdata[2]:.2f}<br>"
+        + "Máx: S/ %{customdata[0]:.2f}<br>"
+        + "Mín: S/ %{customdata[1]:.2f}<br>"
+        + "<extra></extra>"
+    )
+
+
+def frecuencia_resumen(df_filtrado):
+    """Cubeta del resumen inicial del gráfico principal (None = diario)"""
+    if not MODO_DETALLE_ZOOM or len(df_filtrado) == 0:
+        return None
+    fechas = df_filtrado["fecha_dia"]
+    if (fechas.max() - fechas.min()).days > DIAS_DETALLE_ZOOM:
+        return "W"
+    return None
+
+
+# Gráfico principal - Evolución temporal
+def crear_figura_principal(
+    df_filtrado, max_puntos=MAX_PUNTOS_POR_TRAZA, frecuencia=None
+):
+    """
+    Una traza por producto, armadas en una sola pasada: el groupby deja las
+    filas ordenadas por producto y fecha, así cada traza es un bloque
+    contiguo que se recorta por posiciones en vez de filtrar por producto.
+    Las trazas con más de `max_puntos` fechas se reducen con LTTB.
+
+    Con `frecuencia` (p. ej. "W") las fechas se agrupan en cubetas de ese
+    periodo; el máximo y el mínimo de cada cubeta se conservan en el hover.
+    """
+    fechas_grupo = df_filtrado["fecha_dia"]
+    if frecuencia:
+        fechas_grupo = fechas_grupo.dt.to_period(frecuencia).dt.start_time
 
-    # Gráfico principal - Evolución temporal
     df_prod = (
-        df_filtrado.groupby(["fecha_dia", "descripcion_producto"])
+        df_filtrado.groupby(
+            [df_filtrado["descripcion_producto"], fechas_grupo], observed=True
+        )
         .agg({"promedio": "mean", "maximo": "max", "minimo": "min"})
         .reset_index()
-        .sort_values("fecha_dia")
     )
 
-    fig_principal = go.Figure()
-    productos_unicos = sorted(df_prod["descripcion_producto"].unique())
+    codigos = df_prod["descripcion_producto"].cat.codes.to_numpy()
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+    limites = np.r_[inicios, len(df_prod)]
+    productos_unicos = df_prod["descripcion_producto"].to_numpy()[inicios]
     n_productos = len(productos_unicos)
+
     PALETA = px.colors.sequential.Blues
     if n_productos <= 8:
         colors = PALETA[-n_productos:]  # Los más oscuros al final
@@ -158,32 +1880,53 @@ def crear_graficos(df_filtrado, df_comparativa=None):
         positions = np.linspace(0.3, 1, n_productos)
         colors = px.colors.sample_colorscale(PALETA, positions)
 
-    for idx, prod in enumerate(productos_unicos):
-        df_i = df_prod[df_prod["descripcion_producto"] == prod]
+    fechas = df_prod["fecha_dia"].to_numpy()
+    promedios = df_prod["promedio"].to_numpy()
+    customdata = df_prod[["maximo", "minimo", "promedio"]].to_numpy()
+
+    largos = np.diff(limites)
+    if max_puntos:
+        largos = np.minimum(largos, max_puntos)
+
+    # Con muchos puntos SVG se vuelve lento en el navegador
+    Traza = go.Scattergl if largos.sum() > UMBRAL_WEBGL_PUNTOS else go.Scatter
+
+    if max_puntos:
+        puntos_por_traza = lttb_por_bloques(
+            fechas, promedios, limites, max_puntos
+        )
+    else:
+        puntos_por_traza = [
+            slice(inicio, fin) for inicio, fin in pairwise(limites)
+        ]
 
+    trazas = []
+    for idx, prod in enumerate(productos_unicos):
+        puntos = puntos_por_traza[idx]
         color = colors[idx % len(colors)]
 
-        fig_principal.add_trace(
-            go.Scatter(
-                x=df_i["fecha_dia"],
-                y=df_i["promedio"],
+        trazas.append(
+            Traza(
+                x=fechas[puntos],
+                y=promedios[puntos],
                 mode="lines+markers",
                 name=str(prod),
                 line=dict(width=2, color=color),
                 marker=dict(size=6, color=color, symbol="circle"),
                 opacity=0.85,
-                customdata=df_i[["maximo", "minimo", "promedio"]],
-                hovertemplate="<b>%{fullData.name}</b><br>"
-                + "Fecha: %{x|%d %b %Y}<br>"
-                + "Prom: S/ %{customdata[2]:.2f}<br>"
-                + "Máx: S/ %{customdata[0]:.2f}<br>"
-                + "Mín: S/ %{customdata[1]:.2f}<br>"
-                + "<extra></extra>",
+                customdata=customdata[puntos],
+                hovertemplate=hover_principal(frecuencia),
             )
         )
 
+    fig_principal = go.Figure(data=trazas)
+
+    titulo = f"Evolución de precios por producto ({n_productos} productos)"
+    if frecuencia:
+        titulo += " - resumen semanal, acerque para ver el detalle diario"
+
     fig_principal.update_layout(
-        title=f"Evolución de precios por producto ({n_productos} productos)",
+        title=titulo,
         xaxis_title="Fecha",
         yaxis_title="Precio (S/)",
         hovermode="x unified",
@@ -201,7 +1944,98 @@ def crear_graficos(df_filtrado, df_comparativa=None):
         margin=dict(b=120),
     )
 
-    # Boxplot - Distribución de precios con tonos
+    return fig_principal
+
+
+# FUNCIONES PARA CREAR GRÁFICOS
+# Cada salida del dashboard se arma por separado a partir del mismo
+# DataFrame filtrado, para poder calcularlas y cachearlas de forma
+# independiente
+def crear_figura_vacia():
+    fig_vacio = go.Figure()
+    fig_vacio.update_layout(
+        title="No hay datos para los filtros seleccionados",
+        xaxis_title="Fecha",
+        yaxis_title="Precio",
+        height=500,
+    )
+    return fig_vacio
+
+
+def crear_grafico_principal(df_filtrado):
+    """Gráfico principal, como resumen semanal si el rango es largo"""
+    if len(df_filtrado) == 0:
+        return crear_figura_vacia()
+    return crear_figura_principal(
+        df_filtrado, frecuencia=frecuencia_resumen(df_filtrado)
+    )
+
+
+def estadisticas_caja(valores, max_atipicos=MAX_ATIPICOS_BOXPLOT):
+    """
+    Estadísticas de una caja del boxplot: cuartiles, bigotes (último valor
+    dentro de 1.5 IQR, como Plotly), media y hasta `max_atipicos` valores
+    atípicos repartidos entre el menor y el mayor.
+    """
+    valores = np.asarray(valores, dtype="float64")
+    valores = valores[~np.isnan(valores)]
+    if len(valores) == 0:
+        return None
+
+    q1, mediana, q3 = np.quantile(valores, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    es_atipico = (valores < q1 - 1.5 * iqr) | (valores > q3 + 1.5 * iqr)
+    dentro = valores[~es_atipico]
+    atipicos = np.sort(valores[es_atipico])
+    if len(atipicos) > max_atipicos:
+        atipicos = atipicos[
+            np.linspace(0, len(atipicos) - 1, max_atipicos).astype(int)
+        ]
+
+    # Redondeo a céntimos: los precios vienen en float32
+    return {
+        "q1": round(q1, 2),
+        "mediana": round(mediana, 2),
+        "q3": round(q3, 2),
+        "bigote_inferior": round(dentro.min(), 2),
+        "bigote_superior": round(dentro.max(), 2),
+        "media": round(valores.mean(), 2),
+        "atipicos": atipicos.round(2),
+    }
+
+
+def resumen_precios(df_filtrado):
+    """
+    Resumen de distribución que usan el boxplot y la tarjeta de
+    estadísticas, calculado de forma exacta sobre el DataFrame filtrado.
+    SketchPrecios.resumir devuelve lo mismo a partir de los sketches.
+    """
+    if len(df_filtrado) == 0:
+        return None
+    return {
+        "productos": df_filtrado["descripcion_producto"].nunique(),
+        "dias": df_filtrado["fecha_dia"].nunique(),
+        "maximo": df_filtrado["maximo"].max(),
+        "minimo": df_filtrado["minimo"].min(),
+        "promedio": df_filtrado["promedio"].mean(),
+        "cajas": {
+            col: estadisticas_caja(df_filtrado[col].to_numpy())
+            for col in SketchPrecios.COLUMNAS
+        },
+        "error_relativo": 0,
+    }
+
+
+# Boxplot - Distribución de precios con tonos
+def crear_boxplot(resumen):
+    """
+    Las cajas se dibujan con estadísticas ya calculadas (ver
+    resumen_precios) y los atípicos como una traza de puntos aparte, así el
+    tamaño de la figura no depende de la cantidad de filas.
+    """
+    if resumen is None:
+        return crear_figura_vacia()
+
     fig_boxplot = go.Figure()
 
     # O usando la paleta Blues:
@@ -216,25 +2050,57 @@ def crear_graficos(df_filtrado, df_comparativa=None):
         ("minimo", "Mínimo", box_colors_blues[1]),
         ("promedio", "Promedio", box_colors_blues[2]),
     ]:
+        # Sin valores en la columna la caja queda vacía
+        caja = resumen["cajas"][col] or {"atipicos": np.array([])}
+
         fig_boxplot.add_trace(
             go.Box(
-                y=df_filtrado[col].dropna(),
+                x=[name],
+                q1=[caja.get("q1")],
+                median=[caja.get("mediana")],
+                q3=[caja.get("q3")],
+                lowerfence=[caja.get("bigote_inferior")],
+                upperfence=[caja.get("bigote_superior")],
+                mean=[caja.get("media")],
                 name=name,
                 marker_color=color,
                 boxmean=True,
                 line=dict(color=color, width=2),
             )
         )
+        # Una traza de atípicos por caja (aunque esté vacía), para que las
+        # figuras tengan siempre las mismas trazas y se puedan parchear
+        fig_boxplot.add_trace(
+            go.Scatter(
+                x=[name] * len(caja["atipicos"]),
+                y=caja["atipicos"],
+                mode="markers",
+                name=f"{name} (atípicos)",
+                marker=dict(color=color, size=4, opacity=0.6),
+                hovertemplate="Atípico: S/ %{y:.2f}<extra></extra>",
+            )
+        )
+
+    titulo = "Distribución de Precios"
+    if resumen["error_relativo"]:
+        titulo += f" (cuantiles ±{resumen['error_relativo']:.0%})"
 
     fig_boxplot.update_layout(
-        title="Distribución de Precios",
+        title=titulo,
         yaxis_title="Precio (S/)",
         template="plotly_white",
         height=300,
         showlegend=False,
     )
 
-    # Gráfico de conteo por día con Blues
+    return fig_boxplot
+
+
+# Gráfico de conteo por día con Blues
+def crear_conteo(df_filtrado):
+    if len(df_filtrado) == 0:
+        return crear_figura_vacia()
+
     df_conteo = (
         df_filtrado.groupby("fecha_dia")["descripcion_producto"]
         .nunique()
@@ -271,12 +2137,19 @@ def crear_graficos(df_filtrado, df_comparativa=None):
         showlegend=False,
     )
 
-    # Estadísticas rápidas
-    total_prod = df_filtrado["descripcion_producto"].nunique()
-    total_dias = df_filtrado["fecha_dia"].nunique()
-    precio_max_global = df_filtrado["maximo"].max()
-    precio_min_global = df_filtrado["minimo"].min()
-    precio_prom_global = df_filtrado["promedio"].mean()
+    return fig_conteo
+
+
+# Estadísticas rápidas
+def crear_estadisticas(resumen):
+    if resumen is None:
+        return html.P("No hay datos para mostrar", className="text-danger")
+
+    total_prod = resumen["productos"]
+    total_dias = resumen["dias"]
+    precio_max_global = resumen["maximo"]
+    precio_min_global = resumen["minimo"]
+    precio_prom_global = resumen["promedio"]
 
     estadisticas = html.Div(
         [
@@ -301,10 +2174,18 @@ def crear_graficos(df_filtrado, df_comparativa=None):
         ]
     )
 
-    # Tabla top 10
+    return estadisticas
+
+
+# Tabla top 10
+def crear_tabla_top(df_filtrado):
+    if len(df_filtrado) == 0:
+        return html.P("No hay datos para mostrar", className="text-danger")
+
     tabla_resumen = (
         df_filtrado.groupby(
-            ["descripcion_producto", "presentacion_producto", "ecommerce"]
+            ["descripcion_producto", "presentacion_producto", "ecommerce"],
+            observed=True,
         )
         .agg({"promedio": "mean", "maximo": "max", "minimo": "min"})
         .reset_index()
@@ -316,334 +2197,610 @@ def crear_graficos(df_filtrado, df_comparativa=None):
     tabla_resumen = tabla_resumen.round({"maximo": 2})
     tabla_resumen = tabla_resumen.round({"minimo": 2})
 
-    tabla = dbc.Table.from_dataframe(
-        tabla_resumen, bordered=True, hover=True, responsive=True, size="sm"
+    tabla = dbc.Table.from_dataframe(
+        tabla_resumen, bordered=True, hover=True, responsive=True, size="sm"
+    )
+
+    return tabla
+
+
+# COMPARATIVA E-COMMERCE
+def armar_comparativa(fecha, fecha_anterior, productos, tiendas, hoy, ayer):
+    """
+    Comparativa lista para paginar: matrices producto x tienda del día y del
+    día anterior con datos, más las marcas de más caro / más barato de cada
+    producto entre todas las tiendas (solo si hay diferencia)
+    """
+    maximos = np.nanmax(hoy, axis=1, keepdims=True)
+    minimos = np.nanmin(hoy, axis=1, keepdims=True)
+    con_rango = maximos != minimos
+    return {
+        "fecha": fecha,
+        "fecha_anterior": fecha_anterior,
+        "productos": productos,
+        "tiendas": tiendas,
+        "hoy": hoy,
+        "ayer": ayer,
+        "es_max": (hoy == maximos) & con_rango,
+        "es_min": (hoy == minimos) & con_rango,
+    }
+
+
+def preparar_comparativa(df_comp, fecha=None):
+    """
+    Comparativa (ver armar_comparativa) del último día con datos, o del
+    último hasta `fecha`, pivoteando el DataFrame filtrado sin el filtro de
+    e-commerce. Las filas son los productos con precio ese día y las
+    columnas, las tiendas con precio ese día o el anterior. Con los datos
+    en memoria se usa PivotesComparativa, que devuelve lo mismo sin
+    pivotear. None si no hay datos.
+    """
+    # Solo cuentan las filas con precio, como en PivotesComparativa
+    con_precio = df_comp["promedio"].notna()
+    if fecha:
+        con_precio &= df_comp["fecha_dia"] <= pd.Timestamp(fecha)
+    df_comp = df_comp[con_precio]
+    if len(df_comp) == 0:
+        return None
+
+    # Último día con datos y el anterior con datos
+    fecha_mas_reciente = df_comp["fecha_dia"].max()
+    anteriores = df_comp["fecha_dia"] < fecha_mas_reciente
+    fecha_anterior = df_comp.loc[anteriores, "fecha_dia"].max()
+    if pd.isna(fecha_anterior):
+        fecha_anterior = None
+
+    df_hoy = df_comp[df_comp["fecha_dia"] == fecha_mas_reciente]
+    df_ayer = df_comp[df_comp["fecha_dia"] == fecha_anterior]
+
+    # Tiendas con precio el día o el día anterior
+    tiendas = sorted(
+        set(df_hoy["ecommerce"].dropna()) | set(df_ayer["ecommerce"].dropna())
+    )
+
+    # Precio promedio por producto y tienda; float64 para los cálculos
+    def pivotear(df_dia):
+        return df_dia.pivot_table(
+            index="descripcion_producto",
+            columns="ecommerce",
+            values="promedio",
+            aggfunc="mean",
+            observed=True,
+        ).astype("float64")
+
+    pivot_hoy = pivotear(df_hoy).reindex(columns=tiendas)
+    ayer = pivotear(df_ayer).reindex(index=pivot_hoy.index, columns=tiendas)
+
+    return armar_comparativa(
+        fecha_mas_reciente,
+        fecha_anterior,
+        pivot_hoy.index.astype(str).to_numpy(),
+        tiendas,
+        pivot_hoy.to_numpy(),
+        ayer.to_numpy(),
+    )
+
+
+def ventana_comparativa(comparativa, pagina_filas=0, pagina_tiendas=0):
+    """
+    Filas (data) y columnas del DataTable para una página de productos y
+    una de tiendas; solo se da formato a las celdas visibles. Las columnas de
+    tienda usan ids por posición (tienda_0, tienda_1...) para que los
+    estilos condicionales no dependan de los nombres.
+    """
+    filas = slice(
+        pagina_filas * FILAS_COMPARATIVA,
+        (pagina_filas + 1) * FILAS_COMPARATIVA,
+    )
+    columnas = slice(
+        pagina_tiendas * TIENDAS_POR_PAGINA,
+        (pagina_tiendas + 1) * TIENDAS_POR_PAGINA,
+    )
+    hoy = comparativa["hoy"][filas, columnas]
+    ayer = comparativa["ayer"][filas, columnas]
+    es_max = comparativa["es_max"][filas, columnas]
+    es_min = comparativa["es_min"][filas, columnas]
+    tiendas = comparativa["tiendas"][columnas]
+
+    # Variación contra el día anterior
+    variacion = hoy - ayer
+    porcentaje = np.divide(
+        variacion * 100,
+        ayer,
+        out=np.zeros_like(variacion),
+        where=(ayer != 0) & ~np.isnan(ayer),
+    )
+
+    precio = np.char.add("S/ ", np.char.mod("%.2f", hoy))
+    precio = np.where(
+        es_max,
+        np.char.add("🟢 ", precio),
+        np.where(es_min, np.char.add("🔴 ", precio), precio),
+    )
+    cambio = np.char.add(
+        np.char.mod("S/%.2f (", variacion),
+        np.char.mod("%.1f%%)", porcentaje),
+    )
+    cambio = np.select(
+        [np.isnan(variacion), variacion > 0, variacion < 0],
+        [
+            "Sin dato anterior",
+            np.char.add("📈 +", cambio),
+            np.char.add("📉 ", cambio),
+        ],
+        "➡️ Sin cambio",
+    )
+    # Sin precio hoy la celda queda solo con "-"
+    celdas = np.where(
+        np.isnan(hoy), "-", np.char.add(np.char.add(precio, "\n"), cambio)
+    )
+
+    ids_tiendas = [f"tienda_{i}" for i in range(len(tiendas))]
+    data = pd.DataFrame(celdas, columns=ids_tiendas)
+    data.insert(0, "producto", comparativa["productos"][filas])
+    columns = [{"name": "Producto", "id": "producto"}] + [
+        {"name": tienda, "id": id_tienda}
+        for tienda, id_tienda in zip(tiendas, ids_tiendas)
+    ]
+    return data.to_dict("records"), columns
+
+
+def estilos_comparativa():
+    """Colores de las celdas según las marcas 🟢 / 🔴 o la falta de precio"""
+    estilos = []
+    for i in range(TIENDAS_POR_PAGINA):
+        id_tienda = f"tienda_{i}"
+        estilos += [
+            {
+                "if": {
+                    "column_id": id_tienda,
+                    "filter_query": f'{{{id_tienda}}} contains "🟢"',
+                },
+                "backgroundColor": "#d4edda",  # Verde claro para más caro
+                "fontWeight": "bold",
+            },
+            {
+                "if": {
+                    "column_id": id_tienda,
+                    "filter_query": f'{{{id_tienda}}} contains "🔴"',
+                },
+                "backgroundColor": "#fff3cd",  # Amarillo claro para más barato
+                "fontWeight": "bold",
+            },
+            {
+                "if": {
+                    "column_id": id_tienda,
+                    "filter_query": f'{{{id_tienda}}} = "-"',
+                },
+                "backgroundColor": "#f8f9fa",  # Gris para sin dato
+            },
+        ]
+    return estilos
+
+
+def crear_encabezado_comparativa(comparativa):
+    """Título con la fecha y leyenda de la comparativa"""
+    if comparativa is None:
+        return html.P("No hay datos para comparar", className="text-danger")
+
+    fecha_mas_reciente = comparativa["fecha"]
+    fecha_anterior = comparativa["fecha_anterior"]
+    return html.Div(
+        [
+            html.H6(
+                f"📊 Comparativa de Precios - {fecha_mas_reciente.strftime('%d/%m/%Y')}",
+                style={
+                    "textAlign": "center",
+                    "marginBottom": "10px",
+                    "color": "#0d6efd",
+                },
+            ),
+            html.P(
+                f"{len(comparativa['productos'])} productos en "
+                f"{len(comparativa['tiendas'])} tiendas"
+                + (
+                    f" · variación vs {fecha_anterior.strftime('%d/%m/%Y')}"
+                    if fecha_anterior is not None
+                    else ""
+                ),
+                className="text-muted small text-center mb-1",
+            ),
+            html.Div(
+                [
+                    html.Span(
+                        "🟢 = Precio más caro (entre tiendas)",
+                        style={
+                            "marginRight": "20px",
+                            "fontSize": "11px",
+                        },
+                    ),
+                    html.Span(
+                        "🔴 = Precio más barato (entre tiendas)",
+                        style={"fontSize": "11px"},
+                    ),
+                ],
+                style={
+                    "marginBottom": "8px",
+                    "textAlign": "center",
+                },
+            ),
+            html.Div(
+                [
+                    html.Span(
+                        "📈 = Subió vs día anterior",
+                        style={
+                            "marginRight": "15px",
+                            "fontSize": "10px",
+                            "color": "green",
+                        },
+                    ),
+                    html.Span(
+                        "📉 = Bajó vs día anterior",
+                        style={
+                            "marginRight": "15px",
+                            "fontSize": "10px",
+                            "color": "red",
+                        },
+                    ),
+                    html.Span(
+                        "➡️ = Sin cambios/sin dato",
+                        style={
+                            "fontSize": "10px",
+                            "color": "gray",
+                        },
+                    ),
+                ],
+                style={
+                    "marginBottom": "15px",
+                    "textAlign": "center",
+                },
+            ),
+        ]
+    )
+
+
+# Salidas del dashboard que dependen de todos los filtros (la comparativa va
+# aparte porque ignora el de e-commerce). Las de SALIDAS_RESUMEN se arman
+# con obtener_resumen en vez del DataFrame filtrado
+SALIDAS_RESUMEN = {"boxplot", "estadisticas"}
+SALIDAS_DASHBOARD = {
+    "principal": crear_grafico_principal,
+    "boxplot": crear_boxplot,
+    "conteo": crear_conteo,
+    "estadisticas": crear_estadisticas,
+    "tabla": crear_tabla_top,
+}
+
+
+# ACTUALIZACIONES PARCIALES (Patch)
+def estado_graficos(fig_principal):
+    """Lo que el cliente ya tiene dibujado, para calcular el próximo Patch"""
+    return {
+        "trazas": [traza.name for traza in fig_principal.data],
+        "tipo": fig_principal.data[0].type if fig_principal.data else None,
+    }
+
+
+def patch_figura_principal(fig_principal, estado):
+    """
+    Patch que lleva el gráfico principal del cliente (descrito por `estado`)
+    a `fig_principal`: borra las trazas de productos que ya no están y
+    reemplaza datos, colores y título del resto. Si aparecen productos
+    nuevos o cambia el tipo de traza se envía la figura completa.
+    """
+    anteriores = (estado or {}).get("trazas") or []
+    nuevas = [traza.name for traza in fig_principal.data]
+    if not nuevas or not anteriores:
+        return fig_principal
+    if fig_principal.data[0].type != estado.get("tipo"):
+        return fig_principal
+    nombres_nuevos = set(nuevas)
+    if [nombre for nombre in anteriores if nombre in nombres_nuevos] != nuevas:
+        return fig_principal
+
+    # to_dict codifica los arreglos numéricos en base64, como la figura
+    datos = fig_principal.to_dict()["data"]
+    patch = Patch()
+    # De atrás hacia adelante para que no se muevan los índices pendientes
+    for idx in reversed(range(len(anteriores))):
+        if anteriores[idx] not in nombres_nuevos:
+            del patch["data"][idx]
+    for idx, traza in enumerate(datos):
+        for clave in ("x", "y", "customdata", "hovertemplate"):
+            patch["data"][idx][clave] = traza[clave]
+        patch["data"][idx]["line"]["color"] = traza["line"]["color"]
+        patch["data"][idx]["marker"]["color"] = traza["marker"]["color"]
+    patch["layout"]["title"]["text"] = fig_principal.layout.title.text
+    return patch
+
+
+def patch_boxplot(fig_boxplot, estado):
+    """
+    El boxplot tiene siempre las mismas trazas (caja y atípicos por columna),
+    así que basta con reemplazar sus estadísticas y puntos; si el cliente o
+    la nueva figura están vacíos va completo.
+    `estado` es el del gráfico principal, que está vacío en los mismos casos.
+    """
+    if not (estado or {}).get("trazas") or not fig_boxplot.data:
+        return fig_boxplot
+
+    patch = Patch()
+    for idx, traza in enumerate(fig_boxplot.to_dict()["data"]):
+        if traza["type"] == "box":
+            claves = ["q1", "median", "q3", "lowerfence", "upperfence", "mean"]
+        else:
+            claves = ["x", "y"]
+        for clave in claves:
+            patch["data"][idx][clave] = traza.get(clave, [])
+    return patch
+
+
+def patch_conteo(fig_conteo, estado):
+    """Igual que patch_boxplot, para la única traza de barras del conteo"""
+    if not (estado or {}).get("trazas") or not fig_conteo.data:
+        return fig_conteo
+
+    barras = fig_conteo.to_dict()["data"][0]
+    patch = Patch()
+    for clave in ("x", "y"):
+        patch["data"][0][clave] = barras[clave]
+    patch["data"][0]["marker"]["color"] = barras["marker"]["color"]
+    return patch
+
+
+# DESCARGAS
+# Los archivos se sirven desde una ruta de Flask que los arma por bloques a
+# medida que salen, sin pasar por un callback de Dash. Además del CSV hay
+# Parquet y Arrow IPC (stream), que conservan los tipos de las columnas
+RUTA_DESCARGA = "/descargar/precios"
+
+# Filtros que viajan en el query string de la descarga
+CLAVES_DESCARGA = (*COLUMNAS_FILTRO, "start_date", "end_date")
+
+
+def filtros_a_query(filtros):
+    """Codifica el estado de filtros aplicado en el query string"""
+    if not (filtros and filtros.get("aplicado")):
+        return ""
+    params = {"nombre_producto": filtros.get("nombre_producto") or []}
+    for clave in CLAVES_DESCARGA:
+        if filtros.get(clave) not in (None, "ALL"):
+            params[clave] = filtros[clave]
+    return urlencode(params, doseq=True)
+
+
+def filtros_desde_query(args):
+    """Inverso de filtros_a_query a partir de request.args"""
+    filtros = {
+        clave: args[clave] for clave in CLAVES_DESCARGA if args.get(clave)
+    }
+    filtros["nombre_producto"] = args.getlist("nombre_producto")
+    return filtros
+
+
+def bloques_descarga(filtros, filas_bloque=FILAS_BLOQUE_DESCARGA):
+    """
+    Genera las filas filtradas de la descarga, ordenadas por fecha y sku, en
+    DataFrames de a lo más filas_bloque filas.
+    """
+    if MODO_CONSULTA == "sql":
+        consulta, params = construir_consulta_filtros(
+            filtros, orden=["fecha_dia", "sku"]
+        )
+        with engine.connect().execution_options(stream_results=True) as conn:
+            for bloque in pd.read_sql(
+                consulta, conn, params=params, chunksize=filas_bloque
+            ):
+                yield tipar_precios(bloque)
+        return
+
+    # Las posiciones ya vienen por fecha: solo se desempata por sku (sin
+    # copiar el DataFrame) y cada bloque se extrae cuando toca escribirlo
+    datos = get_datos_precios()
+    df = datos["df"]
+    pos, _ = posiciones_filtro(filtros, datos["indice"])
+    skus = df["sku"].cat.codes.to_numpy()[pos]
+    skus = np.where(skus < 0, np.iinfo(skus.dtype).max, skus)
+    pos = pos[np.lexsort((skus, df["fecha_dia"].to_numpy()[pos]))]
+
+    for inicio in range(0, max(len(pos), 1), filas_bloque):
+        yield df.iloc[pos[inicio : inicio + filas_bloque]]
+
+
+def csv_por_bloques(bloques, comprimir=True):
+    """Escribe cada bloque como CSV y, si se pide, lo comprime en gzip"""
+    compresor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    i = -1
+    for i, bloque in enumerate(bloques):
+        texto = bloque.to_csv(index=False, header=i == 0).encode()
+        salida = compresor.compress(texto) if comprimir else texto
+        if salida:
+            yield salida
+    if i < 0:
+        # Sin bloques igual sale la fila de encabezados
+        texto = (
+            pd.DataFrame(columns=["fecha_dia", *ESQUEMA_PRECIOS])
+            .to_csv(index=False)
+            .encode()
+        )
+        yield compresor.compress(texto) if comprimir else texto
+    if comprimir:
+        yield compresor.flush()
+
+
+class SalidaPorBloques(io.RawIOBase):
+    """Archivo de solo escritura que guarda lo escrito hasta que se retira"""
+
+    def __init__(self):
+        super().__init__()
+        self.partes = []
+        self.posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def retirar(self):
+        datos = b"".join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+def tablas_arrow(bloques):
+    """
+    Convierte los bloques a tablas Arrow con el esquema del primero. Las
+    categóricas pasan a diccionarios con índices int32, así los bloques con
+    distinto número de categorías (modo sql) comparten el mismo esquema.
+    Los precios vuelven a float64 redondeados a céntimos, como en la vista.
+    """
+    esquema = None
+    for bloque in bloques:
+        precios = bloque.select_dtypes("float32").columns
+        bloque = bloque.astype(dict.fromkeys(precios, "float64")).round(
+            dict.fromkeys(precios, 2)
+        )
+        tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+        if esquema is None:
+            esquema = pa.schema(
+                [
+                    campo.with_type(
+                        pa.dictionary(pa.int32(), campo.type.value_type)
+                    )
+                    if pa.types.is_dictionary(campo.type)
+                    else campo
+                    for campo in tabla.schema
+                ],
+                metadata=tabla.schema.metadata,
+            )
+        yield tabla.cast(esquema)
+
+
+def escritor_parquet(salida, esquema):
+    return pq.ParquetWriter(salida, esquema, compression="zstd")
+
+
+def escritor_arrow(salida, esquema):
+    # Formato stream: admite que cada bloque traiga su propio diccionario
+    return pa.ipc.new_stream(
+        salida, esquema, options=pa.ipc.IpcWriteOptions(compression="zstd")
     )
 
-    # COMPARATIVA E-COMMERCE - Usar df_comparativa si está disponible
-    df_comp = df_comparativa if df_comparativa is not None else df_filtrado
 
-    if len(df_comp) > 0:
-        # Obtener las 3 tiendas principales (o todas si hay menos de 3)
-        todas_tiendas = sorted(df_comp["ecommerce"].dropna().unique())
-        tiendas = (
-            todas_tiendas[:3] if len(todas_tiendas) >= 3 else todas_tiendas
-        )
+def esquema_arrow_precios():
+    """
+    Esquema Arrow de fecha_dia y ESQUEMA_PRECIOS con los mismos tipos que
+    arma tablas_arrow, para exportar sin filas
+    """
+    tipos = {
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "float32": pa.float64(),
+    }
+    return pa.schema(
+        [pa.field("fecha_dia", pa.timestamp("ns"))]
+        + [pa.field(col, tipos[tipo]) for col, tipo in ESQUEMA_PRECIOS.items()]
+    )
 
-        # Obtener la fecha más reciente
-        fecha_mas_reciente = df_comp["fecha_dia"].max()
-        fecha_anterior = fecha_mas_reciente - pd.Timedelta(days=1)
 
-        # Filtrar datos del día más reciente
-        df_hoy = df_comp[df_comp["fecha_dia"] == fecha_mas_reciente].copy()
-        df_ayer = df_comp[df_comp["fecha_dia"] == fecha_anterior].copy()
+def archivo_por_bloques(bloques, abrir_escritor):
+    """Escribe cada bloque como tabla Arrow y entrega los bytes que produce"""
+    salida = SalidaPorBloques()
+    escritor = None
+    for tabla in tablas_arrow(bloques):
+        if escritor is None:
+            escritor = abrir_escritor(salida, tabla.schema)
+        escritor.write_table(tabla)
+        yield salida.retirar()
+    if escritor is None:
+        # Sin bloques (p. ej. una consulta sql vacía) igual sale un archivo
+        # legible: solo el esquema, sin filas
+        escritor = abrir_escritor(salida, esquema_arrow_precios())
+    escritor.close()
+    yield salida.retirar()
+
+
+# Formato de descarga -> (tipo MIME, función que abre su escritor Arrow); el
+# CSV no pasa por Arrow
+FORMATOS_DESCARGA = {
+    "csv": ("text/csv", None),
+    "parquet": ("application/vnd.apache.parquet", escritor_parquet),
+    "arrows": ("application/vnd.apache.arrow.stream", escritor_arrow),
+}
+
+
+def contenido_descarga(bloques, formato, comprimir=True):
+    """Bytes del archivo de descarga en el formato pedido, por bloques"""
+    abrir_escritor = FORMATOS_DESCARGA[formato][1]
+    if abrir_escritor is None:
+        return csv_por_bloques(bloques, comprimir)
+    return archivo_por_bloques(bloques, abrir_escritor)
+
+
+def contar_filas_descarga(filtros):
+    """Cuántas filas tendrá la descarga con estos filtros"""
+    if MODO_CONSULTA == "sql":
+        consulta, params = construir_consulta_filtros(
+            filtros, columnas=["COUNT(*)"]
+        )
+        with engine.connect() as conn:
+            return conn.execute(consulta, params).scalar()
 
-        if len(df_hoy) == 0:
-            tabla_comparativa = html.P(
-                f"No hay datos para la fecha más reciente ({fecha_mas_reciente.date()})",
-                className="text-warning",
-            )
-        else:
-            # Crear tabla pivot con promedio por producto y tienda
-            pivot_table = df_hoy.pivot_table(
-                index="descripcion_producto",
-                columns="ecommerce",
-                values="promedio",
-                aggfunc="mean",
-            ).reset_index()
-
-            # Asegurarse de que todas las tiendas estén presentes
-            for tienda in tiendas:
-                if tienda not in pivot_table.columns:
-                    pivot_table[tienda] = "-"
-
-            # Reordenar columnas para que las tiendas estén en el orden deseado
-            column_order = ["descripcion_producto"] + tiendas
-            pivot_table = pivot_table[column_order]
-            pivot_table = pivot_table.fillna("-")
-
-            # Calcular precios del día anterior para cada producto
-            variaciones = {}
-            if len(df_ayer) > 0:
-                precios_ayer = (
-                    df_ayer.groupby(["descripcion_producto", "ecommerce"])[
-                        "promedio"
-                    ]
-                    .mean()
-                    .reset_index()
-                )
-                for _, row in precios_ayer.iterrows():
-                    producto = row["descripcion_producto"]
-                    tienda = row["ecommerce"]
-                    precio_ayer = row["promedio"]
-                    if producto not in variaciones:
-                        variaciones[producto] = {}
-                    variaciones[producto][tienda] = precio_ayer
-
-            # Generar la tabla HTML
-            rows = []
-            for _, row in pivot_table.iterrows():
-                # Calcular máximos y mínimos solo para precios válidos
-                precios_validos = [
-                    row[tienda]
-                    for tienda in tiendas
-                    if row[tienda] != "-"
-                    and isinstance(row[tienda], (int, float))
-                ]
+    datos = get_datos_precios()
+    pos, _ = posiciones_filtro(filtros, datos["indice"])
+    return len(pos)
 
-                if precios_validos:
-                    max_val = max(precios_validos)
-                    min_val = min(precios_validos)
-                else:
-                    max_val = 0
-                    min_val = 0
-
-                # Crear celdas para cada tienda
-                celdas = []
-                for tienda in tiendas:
-                    value = row[tienda]
-
-                    # Determinar si es el más caro o más barato
-                    es_max = (
-                        value != "-"
-                        and isinstance(value, (int, float))
-                        and value == max_val
-                        and max_val != min_val
-                    )
-                    es_min = (
-                        value != "-"
-                        and isinstance(value, (int, float))
-                        and value == min_val
-                        and max_val != min_val
-                    )
 
-                    # Color de fondo basado en precio
-                    if es_max:
-                        bg_color = "#d4edda"  # Verde claro para más caro
-                        color_bolita = "green"
-                    elif es_min:
-                        bg_color = "#fff3cd"  # Amarillo claro para más barato
-                        color_bolita = "red"
-                    elif value == "-":
-                        bg_color = "#f8f9fa"  # Gris para sin dato
-                        color_bolita = "transparent"
-                    else:
-                        bg_color = "white"
-                        color_bolita = "transparent"
-
-                    celda = html.Td(
-                        [
-                            # Contenedor principal
-                            html.Div(
-                                [
-                                    # Fila 1: Bolita y precio
-                                    html.Div(
-                                        [
-                                            # Bolita de color
-                                            html.Div(
-                                                style={
-                                                    "width": "12px",
-                                                    "height": "12px",
-                                                    "borderRadius": "50%",
-                                                    "backgroundColor": color_bolita,
-                                                    "display": "inline-block",
-                                                    "marginRight": "8px",
-                                                    "verticalAlign": "middle",
-                                                    "border": "1px solid #ddd"
-                                                    if color_bolita
-                                                    == "transparent"
-                                                    else "none",
-                                                }
-                                            ),
-                                            # Precio actual
-                                            html.Span(
-                                                f"S/ {value:.2f}"
-                                                if value != "-"
-                                                and pd.notna(value)
-                                                else "-",
-                                                style={
-                                                    "fontWeight": "bold"
-                                                    if es_max or es_min
-                                                    else "normal",
-                                                    "verticalAlign": "middle",
-                                                },
-                                            ),
-                                        ],
-                                        style={"marginBottom": "5px"},
-                                    ),
-                                    # Fila 2: Variación
-                                    html.Div(
-                                        crear_variacion_html(
-                                            value,
-                                            variaciones.get(
-                                                row["descripcion_producto"], {}
-                                            ).get(tienda, None),
-                                        )
-                                    ),
-                                ]
-                            )
-                        ],
-                        style={
-                            "textAlign": "center",
-                            "padding": "8px",
-                            "backgroundColor": bg_color,
-                            "minWidth": "150px",
-                            "border": "1px solid #dee2e6",
-                            "verticalAlign": "middle",
-                        },
-                    )
-                    celdas.append(celda)
+# Las exportaciones en segundo plano se dejan en DIRECTORIO_EXPORTACIONES con
+# un nombre aleatorio y se entregan desde esta ruta mientras no venzan
+RUTA_EXPORTACIONES = "/descargar/exportaciones"
 
-                # Crear fila
-                rows.append(
-                    html.Tr(
-                        [
-                            html.Td(
-                                row["descripcion_producto"],
-                                style={
-                                    "position": "sticky",
-                                    "left": 0,
-                                    "background": "white",
-                                    "fontWeight": "bold",
-                                    "zIndex": 1,
-                                    "minWidth": "200px",
-                                    "border": "1px solid #dee2e6",
-                                },
-                            )
-                        ]
-                        + celdas
-                    )
-                )
 
-            tabla_comparativa_html = html.Table(
-                [
-                    html.Thead(
-                        html.Tr(
-                            [
-                                html.Th(
-                                    "Producto",
-                                    style={
-                                        "position": "sticky",
-                                        "left": 0,
-                                        "background": "white",
-                                        "zIndex": 2,
-                                        "minWidth": "200px",
-                                        "border": "1px solid #dee2e6",
-                                    },
-                                )
-                            ]
-                            + [
-                                html.Th(
-                                    tienda,
-                                    style={
-                                        "textAlign": "center",
-                                        "minWidth": "150px",
-                                        "backgroundColor": "#f8f9fa",
-                                        "border": "1px solid #dee2e6",
-                                    },
-                                )
-                                for tienda in tiendas
-                            ]
-                        )
-                    ),
-                    html.Tbody(rows),
-                ],
-                style={
-                    "width": "100%",
-                    "borderCollapse": "collapse",
-                    "fontSize": "13px",
-                    "border": "1px solid #dee2e6",
-                },
-            )
+def limpiar_exportaciones():
+    """Borra los archivos exportados (o a medio escribir) que ya vencieron"""
+    limite = time.time() - MINUTOS_EXPORTACIONES * 60
+    for entrada in os.scandir(DIRECTORIO_EXPORTACIONES):
+        if entrada.is_file() and entrada.stat().st_mtime < limite:
+            try:
+                os.remove(entrada.path)
+            except FileNotFoundError:
+                # Otro worker lo borró primero
+                pass
 
-            # Pie de tabla con información
-            tabla_comparativa = html.Div(
-                [
-                    html.Div(
-                        [
-                            html.H6(
-                                f"📊 Comparativa de Precios - {fecha_mas_reciente.strftime('%d/%m/%Y')}",
-                                style={
-                                    "textAlign": "center",
-                                    "marginBottom": "10px",
-                                    "color": "#0d6efd",
-                                },
-                            ),
-                            html.Div(
-                                [
-                                    html.Span(
-                                        "🟢 = Precio más caro (entre tiendas)",
-                                        style={
-                                            "marginRight": "20px",
-                                            "fontSize": "11px",
-                                        },
-                                    ),
-                                    html.Span(
-                                        "🔴 = Precio más barato (entre tiendas)",
-                                        style={"fontSize": "11px"},
-                                    ),
-                                ],
-                                style={
-                                    "marginBottom": "8px",
-                                    "textAlign": "center",
-                                },
-                            ),
-                            html.Div(
-                                [
-                                    html.Span(
-                                        "📈 = Subió vs ayer",
-                                        style={
-                                            "marginRight": "15px",
-                                            "fontSize": "10px",
-                                            "color": "green",
-                                        },
-                                    ),
-                                    html.Span(
-                                        "📉 = Bajó vs ayer",
-                                        style={
-                                            "marginRight": "15px",
-                                            "fontSize": "10px",
-                                            "color": "red",
-                                        },
-                                    ),
-                                    html.Span(
-                                        "➡️ = Sin cambios/sin dato",
-                                        style={
-                                            "fontSize": "10px",
-                                            "color": "gray",
-                                        },
-                                    ),
-                                ],
-                                style={
-                                    "marginBottom": "15px",
-                                    "textAlign": "center",
-                                },
-                            ),
-                        ]
-                    ),
-                    html.Div(
-                        tabla_comparativa_html,
-                        style={
-                            "maxHeight": "400px",
-                            "overflowY": "auto",
-                            "border": "1px solid #dee2e6",
-                        },
-                    ),
-                ]
-            )
-    else:
-        tabla_comparativa = html.P(
-            "No hay datos para comparar", className="text-danger"
-        )
 
-    return (
-        fig_principal,
-        fig_boxplot,
-        fig_conteo,
-        estadisticas,
-        tabla,
-        tabla_comparativa,
+def exportar_a_archivo(filtros, formato, avance=None):
+    """
+    Escribe la descarga en DIRECTORIO_EXPORTACIONES y devuelve el nombre del
+    archivo (el CSV va comprimido en gzip). Tras cada bloque se llama a
+    avance(filas_escritas, filas_totales).
+    """
+    limpiar_exportaciones()
+    total = contar_filas_descarga(filtros)
+
+    def bloques_con_avance():
+        escritas = 0
+        for bloque in bloques_descarga(filtros):
+            yield bloque
+            escritas += len(bloque)
+            if avance:
+                avance(escritas, total)
+
+    nombre = f"{uuid.uuid4().hex}.{formato}" + (
+        ".gz" if formato == "csv" else ""
     )
+    ruta = os.path.join(DIRECTORIO_EXPORTACIONES, nombre)
+
+    # Se escribe aparte y se renombra al terminar, así nunca se entrega un
+    # archivo a medias
+    with open(ruta + ".parcial", "wb") as archivo:
+        archivo.writelines(contenido_descarga(bloques_con_avance(), formato))
+    os.replace(ruta + ".parcial", ruta)
+    return nombre
 
 
 def image_to_base64(path):
@@ -652,13 +2809,30 @@ def image_to_base64(path):
 
 
 def server_layout():
-    df = get_precios_por_dia()
+    # Dash también llama a esta función al importar el módulo, fuera de un
+    # request, solo para validar los ids de los callbacks: en ese caso se
+    # arma sin consultar datos
+    if has_request_context():
+        catalogo = get_catalogo_filtros()
+        version = get_version_datos()
+        datos_al = texto_datos_al(get_datos_al())
+    else:
+        hoy = pd.Timestamp.today().normalize()
+        catalogo = {col: [] for col in COLUMNAS_CATALOGO}
+        catalogo["fecha_min"] = catalogo["fecha_max"] = hoy
+        version, datos_al = None, ""
     logo_biomont = image_to_base64("dash/public/logo-biomont.png")
     return dbc.Container(
         [
             # Este componente dispara la carga inicial y las actualizaciones
             dcc.Interval(id="init", n_intervals=0, max_intervals=1),
-            dcc.Store(id="store-df-version", data=0),
+            # Versión de los datos que muestra la página; se revisa cada
+            # SEGUNDOS_CONSULTA_VERSION por si el refresco publicó otra
+            dcc.Interval(
+                id="intervalo-version",
+                interval=SEGUNDOS_CONSULTA_VERSION * 1000,
+            ),
+            dcc.Store(id="store-df-version", data=version),
             dbc.Row(
                 [
                     dbc.Col(
@@ -700,6 +2874,11 @@ def server_layout():
                                                                 "Actualización diaria",
                                                                 className="text-muted small",
                                                             ),
+                                                            html.Div(
+                                                                datos_al,
+                                                                id="texto-datos-al",
+                                                                className="text-muted small",
+                                                            ),
                                                             html.Div(
                                                                 "Fuente: Scraping e-commerce",
                                                                 className="text-muted small",
@@ -760,11 +2939,9 @@ def server_layout():
                                                         "label": str(prod),
                                                         "value": prod,
                                                     }
-                                                    for prod in sorted(
-                                                        df["nombre_producto"]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for prod in catalogo[
+                                                        "nombre_producto"
+                                                    ]
                                                 ],
                                                 value=[],
                                                 multi=True,
@@ -788,11 +2965,9 @@ def server_layout():
                                                         "label": str(bio),
                                                         "value": bio,
                                                     }
-                                                    for bio in sorted(
-                                                        df["segmento_producto"]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for bio in catalogo[
+                                                        "segmento_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona producto bulk...",
@@ -816,13 +2991,9 @@ def server_layout():
                                                         "label": str(pres),
                                                         "value": pres,
                                                     }
-                                                    for pres in sorted(
-                                                        df[
-                                                            "presentacion_producto"
-                                                        ]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for pres in catalogo[
+                                                        "presentacion_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona presentación...",
@@ -846,13 +3017,9 @@ def server_layout():
                                                         "label": str(sub),
                                                         "value": sub,
                                                     }
-                                                    for sub in sorted(
-                                                        df[
-                                                            "subcategoria_producto"
-                                                        ]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for sub in catalogo[
+                                                        "subcategoria_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona subcategoría...",
@@ -876,13 +3043,9 @@ def server_layout():
                                                         "label": str(esp),
                                                         "value": esp,
                                                     }
-                                                    for esp in sorted(
-                                                        df[
-                                                            "especie_destino_producto"
-                                                        ]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for esp in catalogo[
+                                                        "especie_destino_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona especie...",
@@ -954,11 +3117,9 @@ def server_layout():
                                                         "label": str(eco),
                                                         "value": eco,
                                                     }
-                                                    for eco in sorted(
-                                                        df["ecommerce"]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for eco in catalogo[
+                                                        "ecommerce"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona e-commerce...",
@@ -971,15 +3132,17 @@ def server_layout():
                                             ),
                                             dcc.DatePickerRange(
                                                 id="filtro-fechas",
-                                                min_date_allowed=df[
-                                                    "fecha_dia"
-                                                ].min(),
-                                                max_date_allowed=df[
-                                                    "fecha_dia"
-                                                ].max(),
-                                                start_date=df["fecha_dia"].max()
+                                                min_date_allowed=catalogo[
+                                                    "fecha_min"
+                                                ],
+                                                max_date_allowed=catalogo[
+                                                    "fecha_max"
+                                                ],
+                                                start_date=catalogo[
+                                                    "fecha_max"
+                                                ]
                                                 - timedelta(days=30),
-                                                end_date=df["fecha_dia"].max(),
+                                                end_date=catalogo["fecha_max"],
                                                 className="mb-3 w-100",
                                             ),
                                             html.Label(
@@ -998,11 +3161,9 @@ def server_layout():
                                                         "label": str(marca),
                                                         "value": marca,
                                                     }
-                                                    for marca in sorted(
-                                                        df["marca_producto"]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for marca in catalogo[
+                                                        "marca_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona marca...",
@@ -1026,11 +3187,9 @@ def server_layout():
                                                         "label": str(bio),
                                                         "value": bio,
                                                     }
-                                                    for bio in sorted(
-                                                        df["biomont_producto"]
-                                                        .dropna()
-                                                        .unique()
-                                                    )
+                                                    for bio in catalogo[
+                                                        "biomont_producto"
+                                                    ]
                                                 ],
                                                 value="ALL",
                                                 placeholder="Selecciona biomont...",
@@ -1086,13 +3245,95 @@ def server_layout():
                                     dbc.CardBody(
                                         [
                                             html.Div(
-                                                id="tabla-comparativa",
-                                                style={"overflowX": "auto"},
-                                            )
+                                                [
+                                                    html.Label(
+                                                        "Fecha:",
+                                                        className="fw-bold small me-2",
+                                                    ),
+                                                    # Vacío = último día
+                                                    # con datos del filtro
+                                                    dcc.DatePickerSingle(
+                                                        id="fecha-comparativa",
+                                                        min_date_allowed=catalogo[
+                                                            "fecha_min"
+                                                        ],
+                                                        max_date_allowed=catalogo[
+                                                            "fecha_max"
+                                                        ],
+                                                        placeholder="Más reciente",
+                                                        display_format="DD/MM/YYYY",
+                                                        clearable=True,
+                                                    ),
+                                                ],
+                                                className="d-flex align-items-center mb-2",
+                                            ),
+                                            html.Div(id="tabla-comparativa"),
+                                            # Productos paginados en el
+                                            # servidor; solo viaja la página
+                                            # visible
+                                            dash_table.DataTable(
+                                                id="tabla-comparativa-datos",
+                                                data=[],
+                                                columns=[],
+                                                page_action="custom",
+                                                page_current=0,
+                                                page_size=FILAS_COMPARATIVA,
+                                                page_count=0,
+                                                fixed_columns={
+                                                    "headers": True,
+                                                    "data": 1,
+                                                },
+                                                style_table={
+                                                    "minWidth": "100%",
+                                                    "border": "1px solid #dee2e6",
+                                                },
+                                                style_cell={
+                                                    "whiteSpace": "pre-line",
+                                                    "textAlign": "center",
+                                                    "padding": "8px",
+                                                    "minWidth": "150px",
+                                                    "fontSize": "13px",
+                                                    "border": "1px solid #dee2e6",
+                                                },
+                                                style_cell_conditional=[
+                                                    {
+                                                        "if": {
+                                                            "column_id": "producto"
+                                                        },
+                                                        "textAlign": "left",
+                                                        "fontWeight": "bold",
+                                                        "minWidth": "200px",
+                                                    }
+                                                ],
+                                                style_header={
+                                                    "backgroundColor": "#f8f9fa",
+                                                    "fontWeight": "bold",
+                                                },
+                                                style_data_conditional=estilos_comparativa(),
+                                            ),
+                                            # Tiendas de a TIENDAS_POR_PAGINA
+                                            html.Div(
+                                                [
+                                                    html.Span(
+                                                        "Tiendas:",
+                                                        className="small text-muted me-2",
+                                                    ),
+                                                    dbc.Pagination(
+                                                        id="paginas-tiendas",
+                                                        max_value=1,
+                                                        active_page=1,
+                                                        fully_expanded=False,
+                                                        size="sm",
+                                                    ),
+                                                ],
+                                                id="contenedor-paginas-tiendas",
+                                                className="align-items-center mt-2",
+                                                style={"display": "none"},
+                                            ),
                                         ]
                                     ),
                                     dbc.CardFooter(
-                                        "Comparativa del día más reciente disponible. Los precios son promedios diarios.",
+                                        "Comparativa del día elegido (o del más reciente disponible) contra el día anterior con datos. Los precios son promedios diarios.",
                                         className="text-muted small",
                                     ),
                                 ]
@@ -1165,18 +3406,85 @@ def server_layout():
                                     dbc.CardBody(
                                         [
                                             html.Div(id="tabla-datos"),
-                                            html.Div(
+                                            dbc.ButtonGroup(
                                                 [
                                                     dbc.Button(
                                                         "📥 Descargar CSV",
                                                         id="btn-descargar",
+                                                        href=app.get_relative_path(
+                                                            RUTA_DESCARGA
+                                                            + ".csv"
+                                                        ),
+                                                        external_link=True,
+                                                        color="success",
+                                                    ),
+                                                    dbc.Button(
+                                                        "Parquet",
+                                                        id="btn-descargar-parquet",
+                                                        href=app.get_relative_path(
+                                                            RUTA_DESCARGA
+                                                            + ".parquet"
+                                                        ),
+                                                        external_link=True,
                                                         color="success",
-                                                        className="mt-3 w-100",
+                                                        outline=True,
                                                     ),
-                                                    dcc.Download(
-                                                        id="download-dataframe-csv"
+                                                    dbc.Button(
+                                                        "Arrow",
+                                                        id="btn-descargar-arrow",
+                                                        href=app.get_relative_path(
+                                                            RUTA_DESCARGA
+                                                            + ".arrows"
+                                                        ),
+                                                        external_link=True,
+                                                        color="success",
+                                                        outline=True,
                                                     ),
-                                                ]
+                                                ],
+                                                className="mt-3 w-100",
+                                            ),
+                                            # Historial completo: se arma en
+                                            # segundo plano y se entrega al
+                                            # terminar
+                                            dbc.InputGroup(
+                                                [
+                                                    dbc.Select(
+                                                        id="formato-exportacion",
+                                                        options=[
+                                                            {
+                                                                "label": "CSV",
+                                                                "value": "csv",
+                                                            },
+                                                            {
+                                                                "label": "Parquet",
+                                                                "value": "parquet",
+                                                            },
+                                                            {
+                                                                "label": "Arrow",
+                                                                "value": "arrows",
+                                                            },
+                                                        ],
+                                                        value="parquet",
+                                                    ),
+                                                    dbc.Button(
+                                                        "⏳ Preparar historial completo",
+                                                        id="btn-exportar",
+                                                        color="secondary",
+                                                    ),
+                                                ],
+                                                className="mt-2",
+                                            ),
+                                            dbc.Progress(
+                                                id="progreso-exportacion",
+                                                value=0,
+                                                striped=True,
+                                                animated=True,
+                                                className="mt-2",
+                                                style={"display": "none"},
+                                            ),
+                                            html.Div(
+                                                id="contenedor-exportacion",
+                                                className="mt-2",
                                             ),
                                         ]
                                     ),
@@ -1189,6 +3497,13 @@ def server_layout():
             ),
             # Almacenar estado de los filtros
             dcc.Store(id="store-filtros-aplicados", data={"aplicado": False}),
+            # Mismo estado, pero solo cambia si cambia algo que no sea el
+            # e-commerce (lo único que usa la comparativa)
+            dcc.Store(
+                id="store-filtros-comparativa", data={"aplicado": False}
+            ),
+            # Versión de datos y trazas ya dibujadas, para enviar Patch
+            dcc.Store(id="store-estado-graficos", data={}),
         ],
         fluid=True,
     )
@@ -1218,8 +3533,7 @@ app.layout = server_layout
     prevent_initial_call=True,
 )
 def limpiar_filtros(n_clicks):
-    df = get_precios_por_dia()
-    fecha_max = df["fecha_dia"].max()
+    fecha_max = get_fecha_max()
     fecha_inicio = fecha_max - timedelta(days=30)
 
     return (
@@ -1250,81 +3564,93 @@ def limpiar_filtros(n_clicks):
         Output("filtro-fechas", "max_date_allowed"),
         Output("filtro-fechas", "start_date", allow_duplicate=True),
         Output("filtro-fechas", "end_date", allow_duplicate=True),
-        Output("store-df-version", "data"),
+        Output("fecha-comparativa", "min_date_allowed"),
+        Output("fecha-comparativa", "max_date_allowed"),
     ],
     Input("btn-actualizar", "n_clicks"),
+    Input("store-df-version", "data"),
     prevent_initial_call=True,
 )
-def actualizar_opciones(_):
-    cache.delete_memoized(get_precios_por_dia)
-    df = get_precios_por_dia()
-    fecha_max = df["fecha_dia"].max()
+def actualizar_opciones(_, version):
+    # El botón pide el refresco y no lo espera: las opciones se vuelven a
+    # armar cuando llega la versión nueva, sin tocar las fechas elegidas
+    catalogo = get_catalogo_filtros(
+        refrescar=ctx.triggered_id == "btn-actualizar"
+    )
+    fecha_max = catalogo["fecha_max"]
     fecha_inicio = fecha_max - timedelta(days=30)
+    reiniciar_fechas = ctx.triggered_id == "btn-actualizar"
 
     return (
-        [
-            {"label": str(p), "value": p}
-            for p in sorted(df["nombre_producto"].dropna().unique())
-        ],
+        [{"label": str(p), "value": p} for p in catalogo["nombre_producto"]],
         [{"label": "Todas", "value": "ALL"}]
         + [
             {"label": str(x), "value": x}
-            for x in sorted(df["subcategoria_producto"].dropna().unique())
+            for x in catalogo["subcategoria_producto"]
         ],
         [{"label": "Todos", "value": "ALL"}]
         + [
-            {"label": str(x), "value": x}
-            for x in sorted(df["biomont_producto"].dropna().unique())
+            {"label": str(x), "value": x} for x in catalogo["biomont_producto"]
         ],
         [{"label": "Todos", "value": "ALL"}]
         + [
             {"label": str(x), "value": x}
-            for x in sorted(df["segmento_producto"].dropna().unique())
+            for x in catalogo["segmento_producto"]
         ],
         [{"label": "Todas", "value": "ALL"}]
         + [
             {"label": str(x), "value": x}
-            for x in sorted(df["presentacion_producto"].dropna().unique())
+            for x in catalogo["presentacion_producto"]
         ],
         [{"label": "Todas", "value": "ALL"}]
         + [
             {"label": str(x), "value": x}
-            for x in sorted(df["especie_destino_producto"].dropna().unique())
+            for x in catalogo["especie_destino_producto"]
         ],
         [{"label": "Todos", "value": "ALL"}]
-        + [
-            {"label": str(x), "value": x}
-            for x in sorted(df["ecommerce"].dropna().unique())
-        ],
+        + [{"label": str(x), "value": x} for x in catalogo["ecommerce"]],
         [{"label": "Todas", "value": "ALL"}]
-        + [
-            {"label": str(x), "value": x}
-            for x in sorted(df["marca_producto"].dropna().unique())
-        ],
-        df["fecha_dia"].min(),
+        + [{"label": str(x), "value": x} for x in catalogo["marca_producto"]],
+        catalogo["fecha_min"],
+        fecha_max,
+        fecha_inicio.strftime("%Y-%m-%d") if reiniciar_fechas else no_update,
+        fecha_max.strftime("%Y-%m-%d") if reiniciar_fechas else no_update,
+        catalogo["fecha_min"],
         fecha_max,
-        fecha_inicio.strftime("%Y-%m-%d"),
-        fecha_max.strftime("%Y-%m-%d"),
-        datetime.now().timestamp(),  # fuerza downstream callbacks
     )
 
 
-# Callback principal - MODIFICADO
+# Callback versión de datos: cuando el refresco en segundo plano publica una
+# versión nueva la deja en store-df-version, de donde la toman las opciones
+# y el estado de filtros
+@app.callback(
+    Output("store-df-version", "data"),
+    Output("texto-datos-al", "children"),
+    Input("intervalo-version", "n_intervals"),
+    State("store-df-version", "data"),
+    prevent_initial_call=True,
+)
+def vigilar_version(_, version_actual):
+    version = get_version_datos()
+    if version == version_actual:
+        return no_update, no_update
+    return version, texto_datos_al(get_datos_al())
+
+
+# Callback principal: solo arma el estado de filtros. Cada salida se
+# actualiza en su propio callback (abajo) a partir de los stores, así Dash
+# las pide en paralelo y las que no cambian no se vuelven a calcular
 @app.callback(
     [
-        Output("grafico-principal", "figure"),
-        Output("grafico-boxplot", "figure"),
-        Output("grafico-conteo", "figure"),
-        Output("estadisticas-rapidas", "children"),
-        Output("tabla-datos", "children"),
-        Output("tabla-comparativa", "children"),
         Output("store-filtros-aplicados", "data"),
+        Output("store-filtros-comparativa", "data"),
     ],
     [
         Input("init", "n_intervals"),
         Input("btn-actualizar", "n_clicks"),
         Input("btn-aplicar-filtros", "n_clicks"),
         Input("btn-limpiar-filtros", "n_clicks"),
+        Input("store-df-version", "data"),
     ],
     [
         State("filtro-nombre-producto", "value"),
@@ -1337,6 +3663,7 @@ def actualizar_opciones(_):
         State("filtro-bulk", "value"),
         State("filtro-fechas", "start_date"),
         State("filtro-fechas", "end_date"),
+        State("store-filtros-aplicados", "data"),
     ],
 )
 def update_dashboard(
@@ -1344,6 +3671,7 @@ def update_dashboard(
     n_clicks_actualizar,
     n_clicks_aplicar,
     n_clicks_limpiar,
+    version,
     nombre_producto,
     subcategoria,
     biomont,
@@ -1354,28 +3682,15 @@ def update_dashboard(
     filtro_bulk,
     start_date,
     end_date,
+    filtros_anteriores,
 ):
-    df = get_precios_por_dia()
     trigger = ctx.triggered_id
 
-    # Carga inicial
+    # Carga inicial: últimos 30 días sin otros filtros
     if trigger in (None, "init"):
-        fecha_max = df["fecha_dia"].max()
+        fecha_max = get_fecha_max()
         fecha_inicio = fecha_max - timedelta(days=30)
 
-        df_filtrado = df[
-            (df["fecha_dia"] >= fecha_inicio) & (df["fecha_dia"] <= fecha_max)
-        ]
-
-        (
-            fig_principal,
-            fig_boxplot,
-            fig_conteo,
-            estadisticas,
-            tabla,
-            tabla_comparativa,
-        ) = crear_graficos(df_filtrado)
-
         filtros = {
             "aplicado": True,
             "tipo": "inicial",
@@ -1391,202 +3706,342 @@ def update_dashboard(
             "end_date": fecha_max.strftime("%Y-%m-%d"),
         }
 
-        return (
-            fig_principal,
-            fig_boxplot,
-            fig_conteo,
-            estadisticas,
-            tabla,
-            tabla_comparativa,
-            filtros,
-        )
+    # Versión nueva de los datos: se vuelven a aplicar los mismos filtros
+    elif trigger == "store-df-version":
+        if not filtros_anteriores:
+            return no_update, no_update
+        filtros = dict(filtros_anteriores, tipo=trigger)
 
-    elif trigger == "btn-actualizar":
-        cache.delete_memoized(get_precios_por_dia)
-        df = get_precios_por_dia()
+    else:
+        filtros = {
+            "aplicado": True,
+            "tipo": trigger,
+            "nombre_producto": nombre_producto,
+            "subcategoria": subcategoria,
+            "biomont": biomont,
+            "presentacion": presentacion,
+            "especie": especie,
+            "ecommerce": ecommerce,
+            "marca": marca,
+            "segmento_producto": filtro_bulk,
+            "start_date": start_date,
+            "end_date": end_date,
+        }
 
-    # Para gráficos principales: aplicar TODOS los filtros incluyendo e-commerce
-    df_filtrado = df.copy()
+    # Solo se recalcula lo que depende de algo que cambió: con la misma
+    # versión de datos y los mismos filtros no se dispara nada, y si solo
+    # cambió el e-commerce la comparativa (que lo ignora) se queda igual.
+    # La versión es el token de store-df-version, el mismo para todos los
+    # callbacks de la página hasta que llegue otra
+    filtros["version"] = version or get_version_datos()
+    anterior = None
+    if (filtros_anteriores or {}).get("version") == filtros["version"]:
+        anterior = filtros_anteriores
+    if anterior is not None and (
+        normalizar_filtros(anterior) == normalizar_filtros(filtros)
+    ):
+        return no_update, no_update
 
-    if nombre_producto:
-        df_filtrado = df_filtrado[
-            df_filtrado["nombre_producto"].isin(nombre_producto)
-        ]
+    cambia_comparativa = anterior is None or (
+        normalizar_filtros(dict(anterior, ecommerce="ALL"))
+        != normalizar_filtros(dict(filtros, ecommerce="ALL"))
+    )
+    return filtros, filtros if cambia_comparativa else no_update
 
-    if subcategoria != "ALL":
-        df_filtrado = df_filtrado[
-            df_filtrado["subcategoria_producto"] == subcategoria
-        ]
-    if biomont != "ALL":
-        df_filtrado = df_filtrado[df_filtrado["biomont_producto"] == biomont]
-    if presentacion != "ALL":
-        df_filtrado = df_filtrado[
-            df_filtrado["presentacion_producto"] == presentacion
-        ]
-    if especie != "ALL":
-        df_filtrado = df_filtrado[
-            df_filtrado["especie_destino_producto"] == especie
-        ]
-    if ecommerce != "ALL":
-        df_filtrado = df_filtrado[df_filtrado["ecommerce"] == ecommerce]
-    if marca != "ALL":
-        df_filtrado = df_filtrado[df_filtrado["marca_producto"] == marca]
-    if filtro_bulk != "ALL":
-        df_filtrado = df_filtrado[
-            df_filtrado["segmento_producto"] == filtro_bulk
-        ]
 
-    if start_date and end_date:
-        df_filtrado = df_filtrado[
-            (df_filtrado["fecha_dia"] >= pd.to_datetime(start_date))
-            & (df_filtrado["fecha_dia"] <= pd.to_datetime(end_date))
-        ]
+# Callbacks de cada salida. Todas leen el mismo DataFrame filtrado del caché
+# LRU (se calcula una sola vez aunque lo pidan a la vez) y cachean su salida
+@app.callback(
+    Output("grafico-principal", "figure"),
+    Output("store-estado-graficos", "data"),
+    Input("store-filtros-aplicados", "data"),
+    State("store-estado-graficos", "data"),
+    prevent_initial_call=True,
+)
+def actualizar_grafico_principal(filtros, estado):
+    fig_principal = obtener_salida("principal", filtros)
+    # Al cliente solo viajan los datos de las trazas, no la figura
+    return (
+        patch_figura_principal(fig_principal, estado),
+        estado_graficos(fig_principal),
+    )
 
-    # Para la tabla comparativa: NO APLICAR FILTRO DE E-COMMERCE
-    df_comparativa = df.copy()
 
-    if nombre_producto:
-        df_comparativa = df_comparativa[
-            df_comparativa["nombre_producto"].isin(nombre_producto)
-        ]
-    if subcategoria != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["subcategoria_producto"] == subcategoria
-        ]
-    if biomont != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["biomont_producto"] == biomont
-        ]
-    if presentacion != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["presentacion_producto"] == presentacion
-        ]
-    if especie != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["especie_destino_producto"] == especie
-        ]
-    # IMPORTANTE: NO aplicar filtro de ecommerce aquí para ver todas las tiendas
-    # if ecommerce != 'ALL':
-    #     df_comparativa = df_comparativa[df_comparativa['ecommerce'] == ecommerce]
-    if marca != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["marca_producto"] == marca
-        ]
-    if filtro_bulk != "ALL":
-        df_comparativa = df_comparativa[
-            df_comparativa["segmento_producto"] == filtro_bulk
-        ]
+@app.callback(
+    Output("grafico-boxplot", "figure"),
+    Input("store-filtros-aplicados", "data"),
+    State("store-estado-graficos", "data"),
+    prevent_initial_call=True,
+)
+def actualizar_boxplot(filtros, estado):
+    return patch_boxplot(obtener_salida("boxplot", filtros), estado)
 
-    if start_date and end_date:
-        df_comparativa = df_comparativa[
-            (df_comparativa["fecha_dia"] >= pd.to_datetime(start_date))
-            & (df_comparativa["fecha_dia"] <= pd.to_datetime(end_date))
-        ]
 
-    # Crear gráficos con ambos DataFrames
-    (
-        fig_principal,
-        fig_boxplot,
-        fig_conteo,
-        estadisticas,
-        tabla,
-        tabla_comparativa,
-    ) = crear_graficos(df_filtrado, df_comparativa)
+@app.callback(
+    Output("grafico-conteo", "figure"),
+    Input("store-filtros-aplicados", "data"),
+    State("store-estado-graficos", "data"),
+    prevent_initial_call=True,
+)
+def actualizar_conteo(filtros, estado):
+    return patch_conteo(obtener_salida("conteo", filtros), estado)
+
+
+@app.callback(
+    Output("estadisticas-rapidas", "children"),
+    Input("store-filtros-aplicados", "data"),
+    prevent_initial_call=True,
+)
+def actualizar_estadisticas(filtros):
+    return obtener_salida("estadisticas", filtros)
 
-    filtros = {
-        "aplicado": True,
-        "tipo": trigger,
-        "nombre_producto": nombre_producto,
-        "subcategoria": subcategoria,
-        "biomont": biomont,
-        "presentacion": presentacion,
-        "especie": especie,
-        "ecommerce": ecommerce,
-        "marca": marca,
-        "segmento_producto": filtro_bulk,
-        "start_date": start_date,
-        "end_date": end_date,
-    }
 
+@app.callback(
+    Output("tabla-datos", "children"),
+    Input("store-filtros-aplicados", "data"),
+    prevent_initial_call=True,
+)
+def actualizar_tabla_top(filtros):
+    return obtener_salida("tabla", filtros)
+
+
+@app.callback(
+    Output("tabla-comparativa", "children"),
+    Output("tabla-comparativa-datos", "data"),
+    Output("tabla-comparativa-datos", "columns"),
+    Output("tabla-comparativa-datos", "page_count"),
+    Output("tabla-comparativa-datos", "page_current"),
+    Output("paginas-tiendas", "max_value"),
+    Output("paginas-tiendas", "active_page"),
+    Output("contenedor-paginas-tiendas", "style"),
+    Input("store-filtros-comparativa", "data"),
+    Input("fecha-comparativa", "date"),
+    Input("tabla-comparativa-datos", "page_current"),
+    Input("paginas-tiendas", "active_page"),
+    prevent_initial_call=True,
+)
+def actualizar_comparativa(filtros, fecha, pagina_filas, pagina_tiendas):
+    """
+    Con filtros o fecha nuevos arma la comparativa completa (en caché) y
+    muestra la primera página; al paginar filas o tiendas solo envía la
+    ventana nueva
+    """
+    if not (filtros and filtros.get("aplicado")):
+        return (no_update,) * 8
+    comparativa = obtener_comparativa(filtros, fecha)
+
+    if comparativa is None:
+        return (
+            crear_encabezado_comparativa(None),
+            [],
+            [],
+            0,
+            0,
+            1,
+            1,
+            {"display": "none"},
+        )
+
+    if ctx.triggered_id in ("tabla-comparativa-datos", "paginas-tiendas"):
+        data, columns = ventana_comparativa(
+            comparativa, pagina_filas or 0, (pagina_tiendas or 1) - 1
+        )
+        return (no_update, data, columns) + (no_update,) * 5
+
+    data, columns = ventana_comparativa(comparativa)
+    paginas_filas = -(-len(comparativa["productos"]) // FILAS_COMPARATIVA)
+    paginas_tiendas = -(-len(comparativa["tiendas"]) // TIENDAS_POR_PAGINA)
     return (
-        fig_principal,
-        fig_boxplot,
-        fig_conteo,
-        estadisticas,
-        tabla,
-        tabla_comparativa,
-        filtros,
+        crear_encabezado_comparativa(comparativa),
+        data,
+        columns,
+        paginas_filas,
+        0,
+        paginas_tiendas,
+        1,
+        {"display": "flex"} if paginas_tiendas > 1 else {"display": "none"},
     )
 
 
-# Callback descarga csv
+# Callback detalle por zoom del gráfico principal
 @app.callback(
-    Output("download-dataframe-csv", "data"),
-    Input("btn-descargar", "n_clicks"),
+    Output("grafico-principal", "figure", allow_duplicate=True),
+    Input("grafico-principal", "relayoutData"),
     State("store-filtros-aplicados", "data"),
+    State("store-estado-graficos", "data"),
     prevent_initial_call=True,
 )
-def download_csv(n_clicks, filtros):
-    df = get_precios_por_dia()
-
-    if filtros and filtros["aplicado"]:
-        df_descarga = df.copy()
-        if filtros["nombre_producto"] and len(filtros["nombre_producto"]) > 0:
-            df_descarga = df_descarga[
-                df_descarga["nombre_producto"].isin(filtros["nombre_producto"])
-            ]
-        if filtros["subcategoria"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["subcategoria_producto"] == filtros["subcategoria"]
-            ]
-        if filtros["biomont"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["biomont_producto"] == filtros["biomont"]
-            ]
-        if filtros["presentacion"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["presentacion_producto"] == filtros["presentacion"]
-            ]
-        if filtros["especie"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["especie_destino_producto"] == filtros["especie"]
-            ]
-        if filtros["ecommerce"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["ecommerce"] == filtros["ecommerce"]
-            ]
-        if filtros["marca"] != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["marca_producto"] == filtros["marca"]
-            ]
-        if filtros.get("segmento_producto", "ALL") != "ALL":
-            df_descarga = df_descarga[
-                df_descarga["segmento_producto"] == filtros["segmento_producto"]
-            ]
-        if filtros["start_date"] and filtros["end_date"]:
-            df_descarga = df_descarga[
-                (
-                    df_descarga["fecha_dia"]
-                    >= pd.to_datetime(filtros["start_date"])
-                )
-                & (
-                    df_descarga["fecha_dia"]
-                    <= pd.to_datetime(filtros["end_date"])
-                )
-            ]
+def detalle_zoom_principal(relayout, filtros, estado):
+    """
+    Con el resumen semanal en pantalla, al hacer zoom o desplazar el eje x
+    se consulta solo la ventana visible y se reemplazan los puntos de cada
+    traza con el detalle diario; el eje y la leyenda se quedan como están.
+    """
+    trazas = (estado or {}).get("trazas")
+    if not (MODO_DETALLE_ZOOM and relayout and trazas):
+        return no_update
+    if not (filtros and filtros.get("aplicado")):
+        return no_update
+
+    inicio_filtro = filtros.get("start_date")
+    fin_filtro = filtros.get("end_date")
+    if inicio_filtro and fin_filtro:
+        dias = (pd.Timestamp(fin_filtro) - pd.Timestamp(inicio_filtro)).days
+        if dias <= DIAS_DETALLE_ZOOM:
+            return no_update  # ya se dibujó con resolución diaria
+
+    # Doble clic (autorange): volver al resumen, normalmente ya en caché
+    if relayout.get("xaxis.autorange"):
+        return obtener_salida("principal", filtros)
+
+    rango = relayout.get("xaxis.range") or [
+        relayout.get("xaxis.range[0]"),
+        relayout.get("xaxis.range[1]"),
+    ]
+    if not (rango[0] and rango[1]):
+        return no_update  # zoom solo en y, autosize, leyenda...
+
+    # Un día de margen a cada lado para que las líneas lleguen al borde
+    inicio = pd.Timestamp(rango[0]).normalize() - timedelta(days=1)
+    fin = pd.Timestamp(rango[1]).normalize() + timedelta(days=1)
+    if inicio_filtro:
+        inicio = max(inicio, pd.Timestamp(inicio_filtro))
+    if fin_filtro:
+        fin = min(fin, pd.Timestamp(fin_filtro))
+
+    filtros_ventana = dict(
+        filtros,
+        start_date=inicio.strftime("%Y-%m-%d"),
+        end_date=fin.strftime("%Y-%m-%d"),
+    )
+    df_ventana, _ = filtrar_precios(
+        filtros_ventana, COLUMNAS_DASHBOARD, con_comparativa=False
+    )
+    # to_dict codifica los arreglos numéricos en base64, como la figura
+    detalle = {
+        traza["name"]: traza
+        for traza in crear_figura_principal(df_ventana).to_dict()["data"]
+    }
+
+    # Mismo orden de trazas que el resumen; sin datos en la ventana quedan
+    # vacías para que no se muevan colores ni leyenda
+    patch = Patch()
+    for idx, nombre in enumerate(trazas):
+        traza = detalle.get(nombre, {})
+        for clave in ("x", "y", "customdata"):
+            patch["data"][idx][clave] = traza.get(clave, [])
+        patch["data"][idx]["hovertemplate"] = hover_principal()
+    patch["layout"]["title"]["text"] = (
+        f"Evolución de precios por producto ({len(trazas)} productos) - "
+        f"detalle diario del {inicio:%d/%m/%Y} al {fin:%d/%m/%Y}"
+    )
+    return patch
 
-        # Ordenar por fecha y sku
-        df_descarga = df_descarga.sort_values(["fecha_dia", "sku"])
 
-        # Descargar csv
-        return dcc.send_data_frame(
-            df_descarga.to_csv, "precios_filtrados_completos.csv", index=False
-        )
-    else:
-        df_completo = df.copy().sort_values(["fecha_dia", "sku"])
-        return dcc.send_data_frame(
-            df_completo.to_csv, "precios_completos.csv", index=False
-        )
+# Callback enlaces de descarga: llevan los filtros aplicados a la ruta
+@app.callback(
+    Output("btn-descargar", "href"),
+    Output("btn-descargar-parquet", "href"),
+    Output("btn-descargar-arrow", "href"),
+    Input("store-filtros-aplicados", "data"),
+)
+def actualizar_enlace_descarga(filtros):
+    query = filtros_a_query(filtros)
+    ruta = app.get_relative_path(RUTA_DESCARGA)
+    return [
+        f"{ruta}.{formato}?{query}" if query else f"{ruta}.{formato}"
+        for formato in FORMATOS_DESCARGA
+    ]
+
+
+# Ruta de descarga (csv, parquet o arrows)
+@server.route(RUTA_DESCARGA + ".<formato>")
+def descargar_precios(formato):
+    if formato not in FORMATOS_DESCARGA:
+        abort(404)
+    mimetype, abrir_escritor = FORMATOS_DESCARGA[formato]
+    aplicado = bool(request.args)
+
+    cabeceras = {
+        "Content-Disposition": "attachment; filename="
+        + ("precios_filtrados_completos" if aplicado else "precios_completos")
+        + f".{formato}"
+    }
+    comprimir = "gzip" in request.headers.get("Accept-Encoding", "")
+    if abrir_escritor is None and comprimir:
+        cabeceras["Content-Encoding"] = "gzip"
+
+    contenido = contenido_descarga(
+        bloques_descarga(filtros_desde_query(request.args)),
+        formato,
+        comprimir,
+    )
+    return Response(
+        stream_with_context(contenido), mimetype=mimetype, headers=cabeceras
+    )
+
+
+# Callback exportación del historial completo en segundo plano: corre en un
+# proceso aparte (el worker sigue atendiendo a los demás) e informa el avance
+@app.callback(
+    Output("contenedor-exportacion", "children"),
+    Input("btn-exportar", "n_clicks"),
+    State("formato-exportacion", "value"),
+    background=True,
+    manager=gestor_trabajos,
+    running=[
+        (Output("btn-exportar", "disabled"), True, False),
+        (
+            Output("progreso-exportacion", "style"),
+            {"height": "20px"},
+            {"display": "none"},
+        ),
+    ],
+    progress=[
+        Output("progreso-exportacion", "value"),
+        Output("progreso-exportacion", "label"),
+    ],
+    prevent_initial_call=True,
+)
+def exportar_historial(set_progress, n_clicks, formato):
+    def avance(escritas, total):
+        porcentaje = int(100 * escritas / total) if total else 100
+        set_progress((porcentaje, f"{porcentaje}%"))
+
+    set_progress((0, ""))
+    nombre = exportar_a_archivo({}, formato, avance)
+
+    return [
+        dbc.Button(
+            "📥 Descargar historial completo",
+            href=app.get_relative_path(f"{RUTA_EXPORTACIONES}/{nombre}"),
+            external_link=True,
+            color="success",
+            className="w-100",
+        ),
+        html.Small(
+            f"Disponible por {MINUTOS_EXPORTACIONES} minutos",
+            className="text-muted",
+        ),
+    ]
+
+
+# Ruta de descarga de las exportaciones en segundo plano
+@server.route(RUTA_EXPORTACIONES + "/<nombre>")
+def descargar_exportacion(nombre):
+    limpiar_exportaciones()
+    extension = nombre.partition(".")[2]
+    if extension.removesuffix(".gz") not in FORMATOS_DESCARGA:
+        abort(404)
+    return send_from_directory(
+        DIRECTORIO_EXPORTACIONES,
+        nombre,
+        mimetype="application/gzip"
+        if extension.endswith(".gz")
+        else FORMATOS_DESCARGA[extension][0],
+        as_attachment=True,
+        download_name=f"precios_completos.{extension}",
+    )
 
 
 # EJECUTAR APP
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# main lee la configuración al importarse: sus directorios van a uno
+# temporal
+os.environ.setdefault("DIRECTORIO_APP", tempfile.mkdtemp())
+
+import main
+
+
+def precios_prueba(productos=30, tiendas=4, dias=120, seed=0):
+    """
+    DataFrame de precios tipado y ordenado por fecha_dia, como el que se
+    carga de la vista: ~10% de celdas (producto, tienda, día) sin filas,
+    algunas con dos SKU, promedios nulos y una marca nula
+    """
+    rng = np.random.default_rng(seed)
+    producto, tienda, dia = (
+        a.ravel()
+        for a in np.meshgrid(
+            np.arange(productos),
+            np.arange(tiendas),
+            np.arange(dias),
+            indexing="ij",
+        )
+    )
+    presentes = rng.random(len(dia)) < 0.9
+    producto, tienda, dia = (
+        producto[presentes],
+        tienda[presentes],
+        dia[presentes],
+    )
+    duplicadas = rng.random(len(dia)) < 0.1
+    sku = np.r_[np.zeros(len(dia), int), np.ones(duplicadas.sum(), int)]
+    producto = np.r_[producto, producto[duplicadas]]
+    tienda = np.r_[tienda, tienda[duplicadas]]
+    dia = np.r_[dia, dia[duplicadas]]
+
+    promedio = np.exp(rng.normal(3 + producto / productos, 0.2)).round(2)
+    promedio[rng.random(len(promedio)) < 0.02] = np.nan
+    marca = np.array([f"Marca {p % 5}" for p in producto], dtype=object)
+    marca[producto == 0] = None
+    df = pd.DataFrame(
+        {
+            "fecha_dia": pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(dia, "D"),
+            "sku": [
+                f"SKU{p}-{t}-{s}" for p, t, s in zip(producto, tienda, sku)
+            ],
+            "descripcion_producto": [f"Producto {p} 10ml" for p in producto],
+            "nombre_producto": [f"Producto {p}" for p in producto],
+            "ecommerce": [f"Tienda {t}" for t in tienda],
+            "marca_producto": marca,
+            "presentacion_producto": np.where(
+                producto % 2, "Pipeta", "Tableta"
+            ),
+            "subcategoria_producto": np.where(
+                producto % 3, "Pulgas", "Garrapatas"
+            ),
+            "especie_destino_producto": np.where(
+                producto % 2, "Perro", "Gato"
+            ),
+            "biomont_producto": np.where(producto % 4 == 0, "SI", "NO"),
+            "segmento_producto": np.where(producto % 2, "Bulk", "Retail"),
+            "promedio": promedio,
+            "maximo": (promedio * 1.1).round(2),
+            "minimo": (promedio * 0.9).round(2),
+        }
+    )
+    return main.tipar_precios(df).sort_values(
+        "fecha_dia", kind="stable", ignore_index=True
+    )
+
+
+@pytest.fixture(scope="session")
+def precios():
+    return precios_prueba()
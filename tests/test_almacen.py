@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    return str(tmp_path / "datos")
+
+
+def test_guardar_y_obtener(precios, directorio):
+    almacen = main.AlmacenCompartido(directorio, "precios")
+    valor = {"df": precios, "indice": main.IndicePrecios(precios)}
+    guardado = almacen.guardar(valor, "v1")
+    assert almacen.version() == "v1"
+
+    # Otro worker con su propia instancia lee lo mismo desde el archivo
+    otro = main.AlmacenCompartido(directorio, "precios").obtener("v1")
+    for leido in [guardado, otro]:
+        pd.testing.assert_frame_equal(leido["df"], precios)
+        np.testing.assert_array_equal(
+            leido["indice"].seleccionar({"ecommerce": ["Tienda 1"]}),
+            valor["indice"].seleccionar({"ecommerce": ["Tienda 1"]}),
+        )
+
+
+def test_arrays_mapeados_de_solo_lectura(precios, directorio):
+    almacen = main.AlmacenCompartido(directorio, "precios")
+    df = almacen.guardar({"df": precios}, "v1")["df"]
+
+    precios_leidos = df["promedio"].to_numpy()
+    fechas = df["fecha_dia"].to_numpy()
+    assert fechas.dtype == precios["fecha_dia"].dtype
+    # Las fechas también son una vista del archivo y no una copia
+    for array in [precios_leidos, fechas, df["sku"].cat.codes.to_numpy()]:
+        assert not array.flags.writeable
+        with pytest.raises(ValueError):
+            array[0] = array[1]
+
+
+def test_guardar_borra_versiones_anteriores(directorio):
+    almacen = main.AlmacenCompartido(directorio, "precios")
+    almacen.guardar({"a": np.arange(10)}, "v1")
+    almacen.guardar({"a": np.arange(20)}, "v2")
+
+    archivos = [n for n in os.listdir(directorio) if n.endswith(".bin")]
+    assert archivos == ["precios-v1-v2.bin"]
+    np.testing.assert_array_equal(almacen.obtener("v2")["a"], np.arange(20))
+
+
+def test_otro_formato_no_se_lee(directorio):
+    main.AlmacenCompartido(directorio, "precios").guardar({"a": 1}, "v1")
+    nuevo = main.AlmacenCompartido(directorio, "precios", formato=2)
+    assert nuevo.version() is None
+
+    nuevo.guardar({"a": 2}, "v1")
+    assert main.AlmacenCompartido(directorio, "precios").version() is None
+    assert nuevo.obtener("v1") == {"a": 2}
+
+
+def test_edad(directorio):
+    almacen = main.AlmacenCompartido(directorio, "precios")
+    assert almacen.edad() is None
+    almacen.guardar({"a": 1}, "v1")
+    assert 0 <= almacen.edad() < 60
+
+
+def test_directorio_privado(tmp_path):
+    ruta = tmp_path / "privado"
+    assert main.directorio_privado(str(ruta)) == str(ruta)
+    assert ruta.stat().st_mode & 0o777 == 0o700
+
+    compartido = tmp_path / "compartido"
+    compartido.mkdir()
+    compartido.chmod(0o777)
+    with pytest.raises(PermissionError):
+        main.directorio_privado(str(compartido))
+
+    enlace = tmp_path / "enlace"
+    enlace.symlink_to(ruta)
+    with pytest.raises(PermissionError):
+        main.directorio_privado(str(enlace))
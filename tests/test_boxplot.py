@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_estadisticas_caja(seed):
+    rng = np.random.default_rng(seed)
+    valores = np.r_[rng.normal(50, 5, 500), rng.normal(50, 40, 20), np.nan]
+    caja = main.estadisticas_caja(valores, max_atipicos=10)
+
+    validos = valores[~np.isnan(valores)]
+    q1, mediana, q3 = np.quantile(validos, [0.25, 0.5, 0.75])
+    assert caja["q1"] == round(q1, 2)
+    assert caja["mediana"] == round(mediana, 2)
+    assert caja["q3"] == round(q3, 2)
+    assert caja["media"] == round(validos.mean(), 2)
+
+    # Bigotes: último valor dentro de 1.5 IQR a cada lado
+    limite = 1.5 * (q3 - q1)
+    dentro = validos[(validos >= q1 - limite) & (validos <= q3 + limite)]
+    assert caja["bigote_inferior"] == round(dentro.min(), 2)
+    assert caja["bigote_superior"] == round(dentro.max(), 2)
+
+    # A lo sumo max_atipicos, incluidos el menor y el mayor
+    atipicos = np.sort(np.setdiff1d(validos, dentro))
+    assert 0 < len(caja["atipicos"]) <= 10
+    assert caja["atipicos"][0] == atipicos[0].round(2)
+    assert caja["atipicos"][-1] == atipicos[-1].round(2)
+
+
+def test_caja_sin_valores():
+    assert main.estadisticas_caja(np.array([np.nan, np.nan])) is None
+
+
+def test_boxplot_no_crece_con_las_filas(precios):
+    df = precios[main.COLUMNAS_DASHBOARD]
+    chico = main.crear_boxplot(main.resumen_precios(df.iloc[:2000]))
+    grande = main.crear_boxplot(main.resumen_precios(df))
+    chico, grande = chico.to_json(), grande.to_json()
+    assert len(grande) < 2 * len(chico)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import main
+
+
+def test_desaloja_lo_menos_usado():
+    cache = main.CacheLRU(max_bytes=10)
+    cache.set("a", 1, 4)
+    cache.set("b", 2, 4)
+    assert cache.get("a") == 1  # "b" pasa a ser la menos usada
+    cache.set("c", 3, 4)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.bytes == 8
+
+    # Una entrada más grande que el límite no se guarda
+    cache.set("d", 4, 11)
+    assert cache.get("d") is None
+
+
+def test_obtener_guarda_none():
+    cache = main.CacheLRU(max_bytes=100)
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+
+    assert cache.obtener("a", calcular, lambda valor: 1) is None
+    assert cache.obtener("a", calcular, lambda valor: 1) is None
+    assert len(llamadas) == 1
+
+
+def test_obtener_calcula_una_vez_entre_hilos():
+    cache = main.CacheLRU(max_bytes=100)
+    llamadas = []
+    resultados = []
+
+    def calcular():
+        llamadas.append(1)
+        time.sleep(0.05)
+        return "valor"
+
+    def pedir():
+        resultados.append(cache.obtener("a", calcular, lambda valor: 1))
+
+    hilos = [threading.Thread(target=pedir) for _ in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert len(llamadas) == 1
+    assert resultados == ["valor"] * 8
+    # Sin hilos esperando no quedan locks por llave
+    assert cache._calculando == {}
+
+
+def test_obtener_libera_el_lock_si_falla():
+    cache = main.CacheLRU(max_bytes=100)
+
+    def fallar():
+        raise ValueError
+
+    try:
+        cache.obtener("a", fallar)
+    except ValueError:
+        pass
+    assert cache._calculando == {}
+    assert cache.obtener("a", lambda: 2, lambda valor: 1) == 2
@@ -0,0 +1,172 @@
+import pytest
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+import main
+from dash import no_update
+
+
+@pytest.fixture
+def datos(precios, monkeypatch):
+    """Los callbacks leen `precios` con la versión "v1" y un LRU vacío"""
+    datos = {
+        "df": precios,
+        "indice": main.IndicePrecios(precios),
+        "sketch": main.SketchPrecios(precios),
+        "pivotes": main.PivotesComparativa(precios),
+    }
+    llamadas = []
+    original = main.filtrar_precios
+
+    def filtrar_precios(filtros, *args, **kwargs):
+        llamadas.append(filtros)
+        return original(filtros, *args, **kwargs)
+
+    monkeypatch.setattr(main, "MODO_CONSULTA", "memoria")
+    monkeypatch.setattr(main, "get_datos_precios", lambda: datos)
+    monkeypatch.setattr(main, "get_version_datos", lambda: "v1")
+    monkeypatch.setattr(main, "cache_resultados", main.CacheLRU(2**30))
+    monkeypatch.setattr(main, "filtrar_precios", filtrar_precios)
+    return llamadas
+
+
+def disparar(prop_id):
+    """Deja a `prop_id` como el input que disparó el callback"""
+    context_value.set(
+        AttributeDict(triggered_inputs=[{"prop_id": prop_id, "value": 1}])
+    )
+
+
+def aplicar_filtros(anteriores=None, ecommerce="ALL", marca="ALL"):
+    """update_dashboard como si se hubiera pulsado "Aplicar filtros" """
+    disparar("btn-aplicar-filtros.n_clicks")
+    return main.update_dashboard(
+        None,
+        None,
+        1,
+        None,
+        None,
+        ["Producto 1", "Producto 2"],
+        "ALL",
+        "ALL",
+        "ALL",
+        "ALL",
+        ecommerce,
+        marca,
+        "ALL",
+        "2025-01-10",
+        "2025-03-10",
+        anteriores,
+    )
+
+
+def test_mismos_filtros_no_disparan_nada(datos):
+    filtros, comparativa = aplicar_filtros()
+    assert filtros["version"] == "v1"
+    assert comparativa is filtros
+    assert aplicar_filtros(filtros) == (no_update, no_update)
+
+
+def test_solo_ecommerce_no_rehace_la_comparativa(datos):
+    filtros, _ = aplicar_filtros()
+    nuevos, comparativa = aplicar_filtros(filtros, ecommerce="Tienda 1")
+    assert nuevos["ecommerce"] == "Tienda 1"
+    assert comparativa is no_update
+
+    nuevos, comparativa = aplicar_filtros(filtros, marca="Marca 1")
+    assert comparativa is nuevos
+
+
+def test_otra_version_actualiza_todo(datos):
+    filtros, _ = aplicar_filtros()
+    nuevos, comparativa = aplicar_filtros(dict(filtros, version="v0"))
+    assert nuevos is not no_update and comparativa is nuevos
+
+
+def test_salidas_comparten_el_filtrado(datos):
+    filtros, _ = aplicar_filtros(ecommerce="Tienda 2")
+    fig, estado = main.actualizar_grafico_principal(filtros, None)
+    assert isinstance(fig, main.go.Figure)
+    assert estado["trazas"] == ["Producto 1 10ml", "Producto 2 10ml"]
+    main.actualizar_boxplot(filtros, estado)
+    main.actualizar_conteo(filtros, estado)
+    main.actualizar_estadisticas(filtros)
+    main.actualizar_tabla_top(filtros)
+    disparar("store-filtros-comparativa.data")
+    main.actualizar_comparativa(filtros, None, None, None)
+    assert len(datos) == 1
+
+    # Con el cliente ya dibujado, los mismos filtros viajan como Patch
+    fig, _ = main.actualizar_grafico_principal(filtros, estado)
+    assert isinstance(fig, main.Patch)
+    assert isinstance(main.actualizar_boxplot(filtros, estado), main.Patch)
+    assert len(datos) == 1
+
+
+def test_comparativa_paginada(datos, monkeypatch):
+    monkeypatch.setattr(main, "FILAS_COMPARATIVA", 2)
+    monkeypatch.setattr(main, "TIENDAS_POR_PAGINA", 3)
+    filtros, _ = aplicar_filtros()
+
+    # Filtros nuevos: primera página y la cantidad de páginas
+    disparar("store-filtros-comparativa.data")
+    salida = main.actualizar_comparativa(filtros, None, 1, 2)
+    _, data, columns, paginas, pagina, max_tiendas, activa, estilo = salida
+    assert (paginas, pagina, max_tiendas, activa) == (1, 0, 2, 1)
+    assert estilo == {"display": "flex"}
+    assert [c["name"] for c in columns] == [
+        "Producto",
+        "Tienda 0",
+        "Tienda 1",
+        "Tienda 2",
+    ]
+    assert len(data) == 2
+
+    # Al paginar solo viajan las filas y columnas de la ventana
+    disparar("paginas-tiendas.active_page")
+    salida = main.actualizar_comparativa(filtros, None, 0, 2)
+    assert salida[0] is no_update and salida[3:] == (no_update,) * 5
+    assert [c["name"] for c in salida[2]] == ["Producto", "Tienda 3"]
+    assert [fila["producto"] for fila in salida[1]] == [
+        fila["producto"] for fila in data
+    ]
+
+
+def test_version_nueva_reaplica_los_filtros(datos):
+    disparar("store-df-version.data")
+    assert main.update_dashboard(
+        None, None, None, None, "v1", *[None] * 10, None
+    ) == (no_update, no_update)
+
+    # Con filtros ya aplicados se repiten, ahora con la versión nueva
+    filtros, _ = aplicar_filtros(ecommerce="Tienda 1")
+    disparar("store-df-version.data")
+    nuevos, comparativa = main.update_dashboard(
+        None, None, None, None, "v1", *[None] * 10, dict(filtros, version="v0")
+    )
+    assert nuevos["version"] == "v1"
+    assert nuevos["ecommerce"] == "Tienda 1"
+    assert comparativa is nuevos
+
+
+def test_vigilar_version(datos, monkeypatch):
+    monkeypatch.setattr(
+        main, "get_datos_al", lambda: main.datetime(2025, 3, 1)
+    )
+    assert main.vigilar_version(1, "v1") == (no_update, no_update)
+    assert main.vigilar_version(2, "v0") == ("v1", "Datos al 01/03/2025 00:00")
+
+
+def test_version_del_store_en_las_llaves(datos):
+    # El token de store-df-version manda sobre la versión publicada
+    disparar("btn-aplicar-filtros.n_clicks")
+    filtros, _ = main.update_dashboard(
+        None, None, 1, None, "v2", *[None] * 10, None
+    )
+    assert filtros["version"] == "v2"
+    assert main.version_filtros(filtros) == "v2"
+    assert main.version_filtros({}) == "v1"
+
+    main.obtener_filtrados(filtros)
+    llave = ("filtrados", "v2", main.normalizar_filtros(filtros))
+    assert main.cache_resultados.get(llave) is not None
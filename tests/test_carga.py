@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import psycopg2
+import pytest
+from sqlalchemy import create_engine, text
+
+import main
+
+
+class CursorCopy:
+    """
+    Cursor de psycopg2 falso: mogrify interpola los parámetros y
+    copy_expert corre la consulta en SQLite y escribe el CSV como lo haría
+    COPY ... TO STDOUT (NULL como campo vacío)
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, query, params):
+        literales = {clave: f"'{valor}'" for clave, valor in params.items()}
+        return (query % literales).encode()
+
+    def copy_expert(self, copy, salida):
+        if self.conexion.error is not None:
+            raise self.conexion.error
+        consulta = copy.removeprefix("COPY (").rsplit(") TO STDOUT", 1)[0]
+        df = pd.read_sql(text(consulta), self.conexion.engine)
+        salida.write(df.to_csv(index=False).encode())
+
+
+class ConexionCopy:
+    def __init__(self, engine, error=None):
+        self.engine = engine
+        self.error = error
+        self.cerrada = False
+
+    def cursor(self):
+        return CursorCopy(self)
+
+    def close(self):
+        self.cerrada = True
+
+
+@pytest.fixture
+def vista_copy(precios, tmp_path):
+    """
+    La vista en un SQLite en tmp_path (el COPY la lee desde otro hilo):
+    `engine` la lee con read_sql y `copia` con COPY simulado (anota sus
+    conexiones en `conexiones`)
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'vista.db'}")
+    precios = precios.copy()
+    # Un texto que read_csv tomaría por NULL con sus valores por defecto
+    precios["marca_producto"] = precios["marca_producto"].cat.add_categories(
+        "NA"
+    )
+    precios.loc[1, "marca_producto"] = "NA"
+    precios.to_sql(
+        "vw_peco_ecommerce_antiparasitarios_daily", engine, index=False
+    )
+    vista = SimpleNamespace(engine=engine, conexiones=[])
+
+    def raw_connection():
+        vista.conexiones.append(ConexionCopy(engine))
+        return vista.conexiones[-1]
+
+    vista.copia = SimpleNamespace(raw_connection=raw_connection)
+    return vista
+
+
+def leer_con(engine, monkeypatch, *args, **kwargs):
+    monkeypatch.setattr(main, "engine", engine)
+    return main.leer_precios(*args, **kwargs)
+
+
+@pytest.mark.parametrize("desde", [None, "2025-03-01"])
+def test_copy_igual_a_read_sql(vista_copy, monkeypatch, desde):
+    read_sql = leer_con(
+        vista_copy.engine, monkeypatch, desde, metodo="read_sql"
+    )
+    copy = leer_con(vista_copy.copia, monkeypatch, desde, metodo="copy")
+
+    pd.testing.assert_frame_equal(copy, read_sql)
+    assert copy["fecha_dia"].dtype == "datetime64[ns]"
+    assert [conexion.cerrada for conexion in vista_copy.conexiones] == [True]
+
+
+def test_copy_no_toma_textos_como_null(vista_copy, monkeypatch):
+    df = leer_con(vista_copy.copia, monkeypatch, metodo="copy")
+    assert df.loc[1, "marca_producto"] == "NA"
+    assert df["marca_producto"].isna().any()
+
+
+def test_error_del_copy_se_propaga(monkeypatch):
+    conexion = ConexionCopy(
+        None, error=psycopg2.ProgrammingError("no existe la vista")
+    )
+    monkeypatch.setattr(
+        main, "engine", SimpleNamespace(raw_connection=lambda: conexion)
+    )
+
+    # read_csv solo ve el pipe vacío: el error que sube es el de Postgres
+    with pytest.raises(psycopg2.ProgrammingError, match="no existe"):
+        main.leer_precios(metodo="copy")
+    assert conexion.cerrada
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+# (condiciones, fecha): filtros que dejan varias series por celda, una
+# sola tienda o nada, y fechas al inicio, en medio y después de los datos
+CASOS_HISTORICOS = [
+    ({}, "2025-02-10"),
+    ({}, "2025-01-01"),
+    ({"marca_producto": ["Marca 1", "Marca 4"]}, "2025-03-20"),
+    ({"ecommerce": ["Tienda 2"]}, "2025-02-28"),
+    ({"segmento_producto": ["Bulk"], "biomont_producto": ["NO"]}, None),
+    ({"nombre_producto": ["Producto 0"]}, "2025-04-02"),
+    ({"ecommerce": ["No existe"]}, "2025-02-10"),
+    ({}, "2026-01-01"),
+]
+
+
+def dia(fecha, precios):
+    """Filas de un día a partir de {(producto, tienda): promedio}"""
+    return [
+        {
+            "fecha_dia": pd.Timestamp(fecha),
+            "descripcion_producto": producto,
+            "ecommerce": tienda,
+            "promedio": promedio,
+        }
+        for (producto, tienda), promedio in precios.items()
+    ]
+
+
+@pytest.fixture
+def df_comp():
+    filas = dia(
+        "2025-03-01",
+        {("A", "T1"): 10.0, ("A", "T2"): 12.0, ("A", "T3"): 9.0},
+    ) + dia(
+        "2025-03-02",
+        {
+            ("A", "T1"): 11.0,
+            ("A", "T2"): 12.0,
+            ("B", "T1"): 5.0,
+            ("B", "T2"): 5.0,
+            ("B", "T3"): 5.0,
+        },
+    )
+    return main.tipar_precios(pd.DataFrame(filas))
+
+
+def ventanas(comparativa):
+    """Todas las páginas de filas y tiendas, unidas en una sola tabla"""
+    paginas_filas = -(-len(comparativa["productos"]) // main.FILAS_COMPARATIVA)
+    paginas_tiendas = -(
+        -len(comparativa["tiendas"]) // main.TIENDAS_POR_PAGINA
+    )
+    bloques = []
+    for pagina_filas in range(paginas_filas):
+        fila = []
+        for pagina_tiendas in range(paginas_tiendas):
+            data, columns = main.ventana_comparativa(
+                comparativa, pagina_filas, pagina_tiendas
+            )
+            nombres = {c["id"]: c["name"] for c in columns}
+            fila.append(
+                pd.DataFrame(data)
+                .rename(columns=nombres)
+                .set_index("Producto")
+            )
+        bloques.append(pd.concat(fila, axis=1))
+    return pd.concat(bloques)
+
+
+def test_celdas(df_comp):
+    data, columns = main.ventana_comparativa(
+        main.preparar_comparativa(df_comp)
+    )
+    assert [c["name"] for c in columns] == ["Producto", "T1", "T2", "T3"]
+    assert data == [
+        {
+            "producto": "A",
+            "tienda_0": "🔴 S/ 11.00\n📈 +S/1.00 (10.0%)",
+            "tienda_1": "🟢 S/ 12.00\n➡️ Sin cambio",
+            "tienda_2": "-",
+        },
+        {
+            "producto": "B",
+            "tienda_0": "S/ 5.00\nSin dato anterior",
+            "tienda_1": "S/ 5.00\nSin dato anterior",
+            "tienda_2": "S/ 5.00\nSin dato anterior",
+        },
+    ]
+
+
+def test_sin_filas():
+    vacio = pd.DataFrame(columns=["fecha_dia", "ecommerce", "promedio"])
+    assert main.preparar_comparativa(vacio) is None
+
+
+def test_paginas_igual_a_pivot_table(precios, monkeypatch):
+    monkeypatch.setattr(main, "FILAS_COMPARATIVA", 7)
+    monkeypatch.setattr(main, "TIENDAS_POR_PAGINA", 3)
+    tabla = ventanas(main.preparar_comparativa(precios))
+
+    ultimo = precios[precios["fecha_dia"] == precios["fecha_dia"].max()]
+    pivote = ultimo.pivot_table(
+        index="descripcion_producto",
+        columns="ecommerce",
+        values="promedio",
+        aggfunc="mean",
+        observed=True,
+    ).astype("float64")
+
+    assert list(tabla.index) == list(pivote.index.astype(str))
+    assert list(tabla.columns) == list(pivote.columns)
+    for producto, precios_fila in pivote.iterrows():
+        fila = tabla.loc[str(producto)]
+        hay_rango = precios_fila.max() != precios_fila.min()
+        for tienda, precio in precios_fila.items():
+            celda = fila[tienda]
+            if np.isnan(precio):
+                assert celda == "-"
+                continue
+            assert f"S/ {precio:.2f}" in celda
+            assert celda.startswith("🟢") == (
+                hay_rango and precio == precios_fila.max()
+            )
+            assert celda.startswith("🔴") == (
+                hay_rango and precio == precios_fila.min()
+            )
+
+
+def pivote_esperado(df, dia):
+    return df[df["fecha_dia"] == dia].pivot_table(
+        index="descripcion_producto",
+        columns="ecommerce",
+        values="promedio",
+        aggfunc="mean",
+        observed=True,
+    )
+
+
+@pytest.mark.parametrize("condiciones, fecha", CASOS_HISTORICOS)
+def test_pivote_historico_igual_a_pivot_table(precios, condiciones, fecha):
+    comparativa = main.PivotesComparativa(precios).comparativa(
+        condiciones, fecha=fecha
+    )
+
+    filtrado = precios[precios["promedio"].notna()]
+    if fecha:
+        filtrado = filtrado[filtrado["fecha_dia"] <= pd.Timestamp(fecha)]
+    for columna, valores in condiciones.items():
+        filtrado = filtrado[filtrado[columna].isin(valores)]
+    if len(filtrado) == 0:
+        assert comparativa is None
+        return
+
+    # Último día con precio y el anterior con precio, si lo hay
+    dias = filtrado["fecha_dia"].drop_duplicates().nlargest(2).tolist()
+    dias += [None] * (2 - len(dias))
+    assert comparativa["fecha"] == dias[0]
+    assert comparativa["fecha_anterior"] == dias[1]
+
+    hoy = pivote_esperado(filtrado, dias[0])
+    ayer = pivote_esperado(filtrado, dias[1])
+    tiendas = sorted(set(hoy.columns) | set(ayer.columns))
+    hoy = hoy.reindex(columns=tiendas)
+    ayer = ayer.reindex(index=hoy.index, columns=tiendas)
+
+    assert list(comparativa["productos"]) == list(hoy.index.astype(str))
+    assert comparativa["tiendas"] == tiendas
+    np.testing.assert_allclose(comparativa["hoy"], hoy, rtol=1e-6)
+    np.testing.assert_allclose(comparativa["ayer"], ayer, rtol=1e-6)
+
+
+@pytest.mark.parametrize("condiciones, fecha", CASOS_HISTORICOS)
+def test_pivotes_igual_a_preparar_comparativa(precios, condiciones, fecha):
+    esperado = precios
+    for columna, valores in condiciones.items():
+        esperado = esperado[esperado[columna].isin(valores)]
+    esperado = main.preparar_comparativa(esperado, fecha)
+    comparativa = main.PivotesComparativa(precios).comparativa(
+        condiciones, fecha=fecha
+    )
+    if esperado is None:
+        assert comparativa is None
+        return
+    for clave in ("fecha", "fecha_anterior", "tiendas"):
+        assert comparativa[clave] == esperado[clave]
+    for clave in ("productos", "es_max", "es_min"):
+        np.testing.assert_array_equal(comparativa[clave], esperado[clave])
+    for clave in ("hoy", "ayer"):
+        np.testing.assert_allclose(
+            comparativa[clave], esperado[clave], rtol=1e-6
+        )
+
+
+def test_pivotes_guardan_solo_celdas_con_precio(precios):
+    pivotes = main.PivotesComparativa(precios)
+    con_precio = precios[precios["promedio"].notna()]
+    celdas = con_precio.groupby(["fecha_dia", "sku"], observed=True).ngroups
+    assert len(pivotes.serie) == len(pivotes.precio) == len(pivotes.filas)
+    assert len(pivotes.serie) <= celdas
+    assert pivotes.filas.sum() == len(con_precio)
+    assert pivotes.inicio_dia[-1] == len(pivotes.serie)
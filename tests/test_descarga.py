@@ -0,0 +1,200 @@
+import gzip
+import io
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import main
+
+
+@pytest.fixture
+def datos(precios, monkeypatch):
+    # El primer request también arma el layout, que lee el catálogo
+    datos = {
+        "df": precios,
+        "indice": main.IndicePrecios(precios),
+        "catalogo": main.catalogo_precios(precios),
+        "version": "v1",
+        "datos_al": main.datetime(2025, 3, 1),
+    }
+    monkeypatch.setattr(main, "MODO_CONSULTA", "memoria")
+    monkeypatch.setattr(main, "get_datos_precios", lambda: datos)
+    # Sin el hilo de refresco que arranca el primer request
+    monkeypatch.setattr(main.refresco_precios, "iniciar", lambda: None)
+    return datos
+
+
+# Estados de filtros aplicados; None es la descarga sin filtros
+FILTROS = [
+    None,
+    {
+        "aplicado": True,
+        "nombre_producto": ["Producto 3", "Producto 12"],
+        "ecommerce": "Tienda 1",
+        "marca": "ALL",
+        "start_date": "2025-01-20",
+        "end_date": "2025-03-05",
+    },
+    {
+        "aplicado": True,
+        "nombre_producto": [],
+        "especie": "Gato",
+        "start_date": "2025-02-01",
+        "end_date": "2025-02-28",
+    },
+    {"aplicado": True, "nombre_producto": [], "ecommerce": "No existe"},
+]
+
+
+def df_esperado(datos, filtros):
+    df, _ = main.filtrar_precios(
+        filtros or {},
+        con_comparativa=False,
+        orden=["fecha_dia", "sku"],
+        datos=datos,
+    )
+    return df
+
+
+def csv_esperado(datos, filtros):
+    return df_esperado(datos, filtros).to_csv(index=False)
+
+
+def leer(formato, cuerpo):
+    if formato == "parquet":
+        return pq.read_table(io.BytesIO(cuerpo)).to_pandas()
+    return pa.ipc.open_stream(cuerpo).read_all().to_pandas()
+
+
+@pytest.mark.parametrize("filtros", FILTROS)
+@pytest.mark.parametrize("comprimir", [True, False])
+def test_ruta_igual_a_filtrar_precios(datos, filtros, comprimir):
+    query = main.filtros_a_query(filtros)
+    cliente = main.server.test_client()
+    respuesta = cliente.get(
+        f"{main.RUTA_DESCARGA}.csv?{query}",
+        headers={"Accept-Encoding": "gzip" if comprimir else "identity"},
+    )
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.get_data()
+    if comprimir:
+        assert respuesta.headers["Content-Encoding"] == "gzip"
+        cuerpo = gzip.decompress(cuerpo)
+    assert cuerpo.decode() == csv_esperado(datos, filtros)
+
+    nombre = (
+        "precios_filtrados_completos.csv" if query else "precios_completos"
+    )
+    assert nombre in respuesta.headers["Content-Disposition"]
+
+
+@pytest.mark.parametrize("filtros", FILTROS)
+def test_bloques_chicos(datos, filtros):
+    bloques = main.bloques_descarga(filtros or {}, filas_bloque=37)
+    cuerpo = gzip.decompress(b"".join(main.csv_por_bloques(bloques)))
+    assert cuerpo.decode() == csv_esperado(datos, filtros)
+
+
+@pytest.mark.parametrize("filtros", FILTROS)
+@pytest.mark.parametrize("formato", ["parquet", "arrows"])
+def test_arrow_igual_a_filtrar_precios(datos, filtros, formato):
+    query = main.filtros_a_query(filtros)
+    respuesta = main.server.test_client().get(
+        f"{main.RUTA_DESCARGA}.{formato}?{query}"
+    )
+    assert respuesta.status_code == 200
+    leido = leer(formato, respuesta.get_data())
+
+    # Los precios salen como en la vista: float64 redondeados a céntimos
+    esperado = df_esperado(datos, filtros).reset_index(drop=True)
+    precios = esperado.select_dtypes("float32").columns
+    esperado = esperado.astype(dict.fromkeys(precios, "float64")).round(2)
+    pd.testing.assert_frame_equal(leido, esperado, check_categorical=False)
+    for columna in esperado.select_dtypes("category"):
+        assert leido[columna].dtype == "category"
+
+
+@pytest.mark.parametrize("formato", ["parquet", "arrows"])
+def test_arrow_sin_bloques_es_legible(formato):
+    _, abrir_escritor = main.FORMATOS_DESCARGA[formato]
+    cuerpo = b"".join(main.archivo_por_bloques(iter([]), abrir_escritor))
+    leido = leer(formato, cuerpo)
+    assert len(leido) == 0
+    assert list(leido.columns) == ["fecha_dia", *main.ESQUEMA_PRECIOS]
+
+
+def test_formato_desconocido(datos):
+    cliente = main.server.test_client()
+    assert cliente.get(f"{main.RUTA_DESCARGA}.xlsx").status_code == 404
+
+
+def test_csv_sin_bloques_trae_encabezados():
+    cuerpo = gzip.decompress(b"".join(main.csv_por_bloques(iter([]))))
+    assert cuerpo.decode().strip() == ",".join(
+        ["fecha_dia", *main.ESQUEMA_PRECIOS]
+    )
+
+
+@pytest.fixture
+def exportaciones(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DIRECTORIO_EXPORTACIONES", str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.parametrize("formato", ["csv", "parquet", "arrows"])
+def test_exportacion_igual_a_filtrar_precios(datos, exportaciones, formato):
+    avances = []
+    nombre = main.exportar_a_archivo(
+        {}, formato, lambda *avance: avances.append(avance)
+    )
+    assert [ruta.name for ruta in exportaciones.iterdir()] == [nombre]
+
+    # El avance llega a todas las filas, que son las de la descarga
+    total = len(datos["df"])
+    assert avances[-1] == (total, total)
+    assert [escritas for escritas, _ in avances] == sorted(
+        escritas for escritas, _ in avances
+    )
+
+    respuesta = main.server.test_client().get(
+        f"{main.RUTA_EXPORTACIONES}/{nombre}"
+    )
+    assert respuesta.status_code == 200
+    assert "precios_completos" in respuesta.headers["Content-Disposition"]
+    cuerpo = respuesta.get_data()
+    if formato == "csv":
+        assert cuerpo == (exportaciones / nombre).read_bytes()
+        assert gzip.decompress(cuerpo).decode() == csv_esperado(datos, None)
+    else:
+        assert len(leer(formato, cuerpo)) == total
+
+
+def test_exportacion_vacia_es_legible(datos, exportaciones, monkeypatch):
+    monkeypatch.setattr(main, "bloques_descarga", lambda filtros: iter([]))
+    nombre = main.exportar_a_archivo({}, "parquet")
+    leido = leer("parquet", (exportaciones / nombre).read_bytes())
+    assert len(leido) == 0
+    assert list(leido.columns) == ["fecha_dia", *main.ESQUEMA_PRECIOS]
+
+
+def test_exportaciones_vencidas_se_borran(exportaciones):
+    vieja = exportaciones / "vieja.csv.gz"
+    nueva = exportaciones / "nueva.csv.gz"
+    vieja.write_bytes(b"")
+    nueva.write_bytes(b"")
+    hace = time.time() - main.MINUTOS_EXPORTACIONES * 60 - 1
+    os.utime(vieja, (hace, hace))
+
+    main.limpiar_exportaciones()
+    assert not vieja.exists()
+    assert nueva.exists()
+
+
+def test_exportacion_con_formato_desconocido(datos, exportaciones):
+    (exportaciones / "x.xlsx").write_bytes(b"")
+    cliente = main.server.test_client()
+    assert cliente.get(f"{main.RUTA_EXPORTACIONES}/x.xlsx").status_code == 404
@@ -0,0 +1,99 @@
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture(scope="module")
+def datos(precios):
+    return {"df": precios, "indice": main.IndicePrecios(precios)}
+
+
+def filtros_prueba(**valores):
+    filtros = {
+        "aplicado": True,
+        "nombre_producto": None,
+        "start_date": "2025-01-15",
+        "end_date": "2025-03-15",
+    }
+    filtros.update({clave: "ALL" for clave in main.COLUMNAS_FILTRO})
+    filtros.update(valores)
+    return filtros
+
+
+def esperado(df, filtros, aplicar_ecommerce=True):
+    mascara = df["fecha_dia"].between(
+        pd.Timestamp(filtros["start_date"]), pd.Timestamp(filtros["end_date"])
+    )
+    condiciones = main.condiciones_filtros(filtros, aplicar_ecommerce)
+    for columna, valores in condiciones.items():
+        mascara &= df[columna].isin(valores)
+    return df.loc[mascara, main.COLUMNAS_DASHBOARD]
+
+
+def comparar(obtenido, df_esperado):
+    pd.testing.assert_frame_equal(
+        obtenido.reset_index(drop=True), df_esperado.reset_index(drop=True)
+    )
+
+
+@pytest.mark.parametrize(
+    "valores",
+    [
+        {},
+        {"marca": "Marca 3"},
+        {"nombre_producto": ["Producto 2", "Producto 9"], "biomont": "NO"},
+        {"especie": "Perro", "segmento_producto": "Bulk"},
+        {"marca": None, "especie": None},
+    ],
+)
+def test_sin_ecommerce_la_comparativa_es_la_misma(precios, datos, valores):
+    filtros = filtros_prueba(**valores)
+    df_filtrado, df_comparativa = main.filtrar_precios(
+        filtros, main.COLUMNAS_DASHBOARD, datos=datos
+    )
+    assert df_comparativa is df_filtrado
+    comparar(df_filtrado, esperado(precios, filtros))
+
+
+@pytest.mark.parametrize(
+    "valores",
+    [
+        {"ecommerce": "Tienda 2"},
+        {"ecommerce": "Tienda 0", "presentacion": "Pipeta"},
+        {"ecommerce": "Tienda 1", "nombre_producto": ["Producto 4"]},
+        {"ecommerce": "No existe"},
+    ],
+)
+def test_comparativa_sin_filtro_de_ecommerce(precios, datos, valores):
+    filtros = filtros_prueba(**valores)
+    df_filtrado, df_comparativa = main.filtrar_precios(
+        filtros, main.COLUMNAS_DASHBOARD, datos=datos
+    )
+    comparar(df_filtrado, esperado(precios, filtros))
+    comparar(
+        df_comparativa,
+        esperado(precios, filtros, aplicar_ecommerce=False),
+    )
+
+
+def test_descarga_ordenada_y_con_todas_las_columnas(precios, datos):
+    filtros = filtros_prueba(ecommerce="Tienda 3", subcategoria="Pulgas")
+    df_descarga, df_comparativa = main.filtrar_precios(
+        filtros,
+        con_comparativa=False,
+        orden=["fecha_dia", "sku"],
+        datos=datos,
+    )
+    assert df_comparativa is None
+    assert list(df_descarga.columns) == list(precios.columns)
+
+    mascara = precios.index.isin(esperado(precios, filtros).index)
+    comparar(df_descarga, precios[mascara].sort_values(["fecha_dia", "sku"]))
+
+
+def test_sin_filtros_devuelve_todo(precios, datos):
+    df_filtrado, _ = main.filtrar_precios(
+        {}, con_comparativa=False, datos=datos
+    )
+    comparar(df_filtrado, precios)
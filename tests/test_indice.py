@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+# (condiciones, inicio, fin): filtros selectivos, amplios, combinados,
+# con nulos y con valores que no existen
+CASOS = [
+    ({}, None, None),
+    ({}, "2025-02-01", "2025-02-15"),
+    ({"ecommerce": ["Tienda 1"]}, None, None),
+    ({"nombre_producto": ["Producto 3"]}, "2025-01-10", "2025-03-01"),
+    (
+        {"nombre_producto": ["Producto 3", "Producto 8", "Producto 21"]},
+        None,
+        None,
+    ),
+    (
+        {"marca_producto": ["Marca 2"], "ecommerce": ["Tienda 0", "Tienda 3"]},
+        "2025-01-05",
+        "2025-04-01",
+    ),
+    (
+        {
+            "nombre_producto": ["Producto 5"],
+            "presentacion_producto": ["Pipeta"],
+        },
+        None,
+        None,
+    ),
+    (
+        {"biomont_producto": ["SI"], "segmento_producto": ["Retail"]},
+        "2025-03-01",
+        "2025-03-01",
+    ),
+    ({"subcategoria_producto": ["Pulgas"]}, "2025-06-01", "2025-07-01"),
+    ({"ecommerce": ["No existe"]}, None, None),
+    ({"nombre_producto": ["Producto 1", "No existe"]}, None, None),
+]
+
+
+def esperado(df, condiciones, inicio, fin):
+    mascara = np.ones(len(df), dtype=bool)
+    if inicio and fin:
+        mascara &= (
+            df["fecha_dia"]
+            .between(pd.Timestamp(inicio), pd.Timestamp(fin))
+            .to_numpy()
+        )
+    for columna, valores in condiciones.items():
+        mascara &= df[columna].isin(valores).to_numpy()
+    return np.flatnonzero(mascara)
+
+
+@pytest.fixture(scope="module")
+def indice(precios):
+    return main.IndicePrecios(precios)
+
+
+@pytest.mark.parametrize("condiciones, inicio, fin", CASOS)
+def test_seleccionar_igual_a_mascaras(
+    precios, indice, condiciones, inicio, fin
+):
+    pos = indice.seleccionar(condiciones, inicio, fin)
+    np.testing.assert_array_equal(
+        pos, esperado(precios, condiciones, inicio, fin)
+    )
+
+
+def test_seleccionar_filtros_al_azar(precios, indice):
+    rng = np.random.default_rng(1)
+    dias = precios["fecha_dia"].unique()
+    for _ in range(200):
+        condiciones = {}
+        for columna in main.COLUMNAS_CATALOGO:
+            if rng.random() < 0.3:
+                categorias = precios[columna].cat.categories
+                condiciones[columna] = list(
+                    rng.choice(categorias, rng.integers(1, 4))
+                )
+        inicio, fin = sorted(rng.choice(dias, 2))
+        pos = indice.seleccionar(condiciones, inicio, fin)
+        np.testing.assert_array_equal(
+            pos, esperado(precios, condiciones, inicio, fin)
+        )
+
+
+def test_restringir(precios, indice):
+    pos = indice.seleccionar({"nombre_producto": ["Producto 7"]})
+    restringidas = indice.restringir(pos, "ecommerce", ["Tienda 2"])
+    np.testing.assert_array_equal(
+        restringidas,
+        esperado(
+            precios,
+            {"nombre_producto": ["Producto 7"], "ecommerce": ["Tienda 2"]},
+            None,
+            None,
+        ),
+    )
+
+
+def test_indice_mas_chico_que_los_datos(precios, indice):
+    def tamano(valor):
+        if isinstance(valor, np.ndarray):
+            return valor.nbytes
+        if isinstance(valor, dict):
+            return sum(tamano(v) for v in valor.values())
+        return 0
+
+    assert tamano(vars(indice)) < precios.memory_usage(deep=True).sum()
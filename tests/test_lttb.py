@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import main
+
+
+def series_al_azar(largos, seed=0):
+    rng = np.random.default_rng(seed)
+    limites = np.r_[0, np.cumsum(largos)]
+    x = np.concatenate(
+        [
+            np.datetime64("2025-01-01")
+            + np.sort(rng.choice(1000, largo, replace=False)).astype(
+                "timedelta64[D]"
+            )
+            for largo in largos
+        ]
+    )
+    y = rng.normal(50, 10, limites[-1]).astype(np.float32)
+    return x, y, limites
+
+
+@pytest.mark.parametrize("n_salida", [3, 10, 50])
+def test_conserva_extremos_y_no_pasa_de_n_salida(n_salida):
+    largos = [1, 2, 9, 10, 11, 60, 400]
+    x, y, limites = series_al_azar(largos)
+    elegidos = main.lttb_por_bloques(x, y, limites, n_salida)
+
+    assert len(elegidos) == len(largos)
+    for k, pos in enumerate(elegidos):
+        inicio, fin = limites[k], limites[k + 1]
+        assert len(pos) == min(n_salida, fin - inicio)
+        assert pos[0] == inicio
+        assert pos[-1] == fin - 1
+        # Posiciones de la propia serie, en orden y sin repetir
+        assert np.all(np.diff(pos) > 0)
+        assert pos.min() >= inicio and pos.max() < fin
+
+
+def test_series_cortas_quedan_completas():
+    x, y, limites = series_al_azar([5, 8])
+    elegidos = main.lttb_por_bloques(x, y, limites, 10)
+    np.testing.assert_array_equal(elegidos[0], np.arange(0, 5))
+    np.testing.assert_array_equal(elegidos[1], np.arange(5, 13))
+
+
+def test_conserva_un_pico():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[437] = 100
+    elegidos = main.lttb_por_bloques(x, y, np.array([0, 1000]), 20)
+    assert 437 in elegidos[0]
@@ -0,0 +1,119 @@
+import json
+
+import plotly
+import pytest
+
+import main
+
+
+def aplicar(figura, patch):
+    """Aplica las operaciones de un Patch a la figura (dict) del cliente"""
+    operaciones = json.loads(
+        json.dumps(patch.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder)
+    )["operations"]
+    for operacion in operaciones:
+        *camino, ultimo = operacion["location"]
+        destino = figura
+        for paso in camino:
+            if isinstance(destino, dict):
+                destino = destino.setdefault(paso, {})
+            else:
+                destino = destino[paso]
+        if operacion["operation"] == "Assign":
+            destino[ultimo] = operacion["params"]["value"]
+        elif operacion["operation"] == "Delete":
+            del destino[ultimo]
+        else:
+            raise AssertionError(operacion)
+    return figura
+
+
+def cliente(figura):
+    """La figura como la tiene el navegador: JSON ya decodificado"""
+    return json.loads(
+        json.dumps(figura.to_dict(), cls=plotly.utils.PlotlyJSONEncoder)
+    )
+
+
+def estado(figura):
+    return {
+        "trazas": [traza.name for traza in figura.data],
+        "tipo": figura.data[0].type if figura.data else None,
+    }
+
+
+def graficos(precios, productos, inicio="2025-01-01", fin="2025-02-15"):
+    df = precios[
+        precios["nombre_producto"].isin(productos)
+        & precios["fecha_dia"].between(inicio, fin)
+    ]
+    df = df[main.COLUMNAS_DASHBOARD]
+    return (
+        main.crear_grafico_principal(df),
+        main.crear_boxplot(main.resumen_precios(df)),
+        main.crear_conteo(df),
+    )
+
+
+def campos(figura, claves=("name", "x", "y", "customdata")):
+    return [
+        {clave: traza.get(clave) for clave in claves}
+        for traza in figura["data"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "antes, despues",
+    [
+        (["Producto 1", "Producto 2", "Producto 3"], ["Producto 2"]),
+        (["Producto 1", "Producto 2"], ["Producto 1", "Producto 2"]),
+    ],
+)
+def test_patch_principal_lleva_a_la_figura_nueva(precios, antes, despues):
+    fig_antes = graficos(precios, antes)[0]
+    fig_despues = graficos(precios, despues, fin="2025-03-01")[0]
+
+    patch = main.patch_figura_principal(fig_despues, estado(fig_antes))
+    assert isinstance(patch, main.Patch)
+
+    resultado = aplicar(cliente(fig_antes), patch)
+    esperado = cliente(fig_despues)
+    assert campos(resultado) == campos(esperado)
+    assert (
+        resultado["layout"]["title"]["text"]
+        == esperado["layout"]["title"]["text"]
+    )
+    for traza, traza_esperada in zip(resultado["data"], esperado["data"]):
+        assert traza["line"]["color"] == traza_esperada["line"]["color"]
+
+
+def test_producto_nuevo_envia_la_figura_completa(precios):
+    fig_antes = graficos(precios, ["Producto 1"])[0]
+    fig_despues = graficos(precios, ["Producto 1", "Producto 2"])[0]
+    resultado = main.patch_figura_principal(fig_despues, estado(fig_antes))
+    assert resultado is fig_despues
+
+
+def test_sin_estado_envia_la_figura_completa(precios):
+    fig = graficos(precios, ["Producto 1"])[0]
+    assert main.patch_figura_principal(fig, None) is fig
+    assert main.patch_figura_principal(fig, {"trazas": []}) is fig
+
+
+def test_patch_secundarias(precios):
+    _, box_antes, conteo_antes = graficos(
+        precios, ["Producto 1", "Producto 5"]
+    )
+    fig_despues, box_despues, conteo_despues = graficos(
+        precios, ["Producto 5"], fin="2025-04-01"
+    )
+    patch_box = main.patch_boxplot(box_despues, estado(fig_despues))
+    patch_conteo = main.patch_conteo(conteo_despues, estado(fig_despues))
+
+    resultado = aplicar(cliente(box_antes), patch_box)
+    claves = ["q1", "median", "q3", "lowerfence", "upperfence", "mean", "y"]
+    assert campos(resultado, claves) == campos(cliente(box_despues), claves)
+    resultado = aplicar(cliente(conteo_antes), patch_conteo)
+    assert campos(resultado, ["x", "y"]) == campos(
+        cliente(conteo_despues), ["x", "y"]
+    )
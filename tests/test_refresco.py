@@ -0,0 +1,271 @@
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+import main
+
+
+@pytest.fixture
+def vista(precios, tmp_path, monkeypatch):
+    """
+    Almacén y refresco propios sobre un directorio temporal y una vista
+    falsa: leer_precios devuelve vista.df y anota en vista.lecturas desde
+    qué fecha se leyó (None si completa); la huella es vista.huella
+    """
+    almacen = main.AlmacenCompartido(str(tmp_path / "datos"), "precios")
+    vista = SimpleNamespace(df=precios, huella="h1", lecturas=[])
+
+    def leer_precios(desde=None):
+        vista.lecturas.append(desde)
+        if desde is None:
+            return vista.df
+        return vista.df[vista.df["fecha_dia"] >= desde]
+
+    monkeypatch.setattr(main, "MODO_CONSULTA", "memoria")
+    monkeypatch.setattr(main, "almacen_precios", almacen)
+    monkeypatch.setattr(
+        main, "RUTA_INSTANTANEA", str(tmp_path / "instantanea.parquet")
+    )
+    monkeypatch.setattr(
+        main, "refresco_precios", main.RefrescoDatos(almacen, 3600)
+    )
+    monkeypatch.setattr(main, "leer_precios", leer_precios)
+    monkeypatch.setattr(main, "consultar_huella", lambda: vista.huella)
+    return vista
+
+
+def envejecer(almacen, segundos, marca=None):
+    """Deja el sello (o `marca`) como tocado hace `segundos`"""
+    almacen.tocar(marca, time.time() - segundos)
+
+
+def test_arranque_en_frio_carga_una_vez(precios, vista):
+    datos = main.get_datos_precios()
+    assert main.get_datos_precios() is datos
+    assert vista.lecturas == [None]
+    assert main.get_version_datos() == datos["version"]
+    assert datos["version"].startswith("h1-")
+    assert main.almacen_precios.edad("completa") < 60
+    pd.testing.assert_frame_equal(datos["df"], precios)
+
+
+def test_misma_huella_no_trae_nada(vista):
+    datos = main.get_datos_precios()
+    envejecer(main.almacen_precios, 600)
+
+    assert main.refrescar_datos_precios() is datos
+    assert vista.lecturas == [None]
+    # Queda como recién revisada
+    assert main.almacen_precios.edad() < 60
+
+
+def test_huella_nueva_trae_desde_la_marca_de_agua(precios, vista):
+    datos = main.get_datos_precios()
+    vista.huella = "h2"
+    nuevos = main.refrescar_datos_precios()
+
+    assert vista.lecturas == [None, precios["fecha_dia"].max()]
+    assert nuevos["version"].startswith("h2-")
+    assert nuevos["carga_completa"] == datos["carga_completa"]
+    pd.testing.assert_frame_equal(nuevos["df"], precios)
+    assert main.get_datos_precios()["version"] == nuevos["version"]
+
+
+def test_carga_completa_con_los_mismos_datos_mantiene_la_version(vista):
+    datos = main.get_datos_precios()
+    envejecer(main.almacen_precios, 7200, "completa")
+
+    # Mismas filas en otro orden: la versión (y el caché) se mantienen
+    vista.df = vista.df.sample(frac=1, random_state=0)
+    assert main.refrescar_datos_precios(completa=True) is datos
+    assert vista.lecturas == [None, None]
+    assert main.almacen_precios.version() == datos["version"]
+    assert main.almacen_precios.edad("completa") < 60
+
+
+def test_carga_completa_con_correcciones_cambia_la_version(precios, vista):
+    datos = main.get_datos_precios()
+
+    # Corrección en el primer día: la huella (últimos días) no la ve
+    vista.df = precios.copy()
+    vista.df.loc[0, "promedio"] += 1
+    nuevos = main.refrescar_datos_precios(completa=True)
+    assert nuevos["huella"] == datos["huella"]
+    assert nuevos["version"] != datos["version"]
+    assert nuevos["df"]["promedio"].iloc[0] == vista.df["promedio"].iloc[0]
+
+
+def test_refresco_periodico(precios, vista):
+    main.get_datos_precios()
+    refresco = main.refresco_precios
+    vista.huella = "h2"
+
+    # Otro worker acaba de publicar: el periódico se salta, el pedido no
+    refresco.refrescar()
+    assert vista.lecturas == [None]
+    refresco.refrescar(forzar=True)
+    assert vista.lecturas == [None, precios["fecha_dia"].max()]
+
+    # Pasada la vigencia de la última carga completa se lee todo otra vez
+    envejecer(
+        main.almacen_precios, main.SEGUNDOS_VIGENCIA_CACHE + 1, "completa"
+    )
+    refresco.refrescar(forzar=True)
+    assert vista.lecturas[-1] is None
+
+
+def test_solicitar_refresca_en_segundo_plano(vista):
+    version = main.get_datos_precios()["version"]
+    vista.huella = "h2"
+    main.refresco_precios.solicitar()
+
+    limite = time.monotonic() + 10
+    while main.almacen_precios.version() == version:
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+    assert len(vista.lecturas) == 2
+
+
+def test_pedidos_simultaneos_hacen_una_sola_carga(vista):
+    main.get_datos_precios()
+    refresco = main.RefrescoDatos(main.almacen_precios, 3600, reuso=60)
+    vista.huella = "h2"
+
+    # Recién publicada: el pedido reutiliza esa versión
+    refresco.refrescar(forzar=True)
+    assert len(vista.lecturas) == 1
+
+    # Más vieja que `reuso`: de varios pedidos a la vez carga solo uno y
+    # los demás, al conseguir el lock, ven la versión nueva
+    envejecer(main.almacen_precios, 120)
+    hilos = [
+        threading.Thread(target=refresco.refrescar, args=(True,))
+        for _ in range(5)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert len(vista.lecturas) == 2
+
+
+def test_reinicio_usa_lo_publicado(vista, monkeypatch):
+    datos = main.get_datos_precios()
+
+    # Otro proceso sobre el mismo directorio: mapea lo publicado sin leer
+    # la vista ni la instantánea
+    otro = main.AlmacenCompartido(main.almacen_precios.directorio, "precios")
+    monkeypatch.setattr(main, "almacen_precios", otro)
+    monkeypatch.setattr(main, "leer_instantanea", lambda: None)
+    assert main.get_datos_precios()["version"] == datos["version"]
+    assert vista.lecturas == [None]
+
+
+def test_arranque_desde_la_instantanea(precios, vista, monkeypatch):
+    datos = main.get_datos_precios()
+
+    # Formato nuevo (p. ej. tras un deploy): no se lee lo publicado, sino
+    # la instantánea, con la misma versión y fecha de los datos
+    nuevo = main.AlmacenCompartido(
+        main.almacen_precios.directorio, "precios", formato=2
+    )
+    monkeypatch.setattr(main, "almacen_precios", nuevo)
+    desde_instantanea = main.get_datos_precios()
+    assert vista.lecturas == [None]
+    assert desde_instantanea["version"] == datos["version"]
+    assert desde_instantanea["datos_al"] == datos["datos_al"]
+    pd.testing.assert_frame_equal(desde_instantanea["df"], precios)
+
+
+def test_instantanea_vieja_se_reconcilia_al_arrancar(vista, monkeypatch):
+    datos = main.get_datos_precios()
+    main.escribir_instantanea(
+        dict(datos, datos_al=datos["datos_al"] - timedelta(days=1))
+    )
+    nuevo = main.AlmacenCompartido(
+        main.almacen_precios.directorio, "precios", formato=2
+    )
+    monkeypatch.setattr(main, "almacen_precios", nuevo)
+    refresco = main.RefrescoDatos(nuevo, 3600, reuso=60)
+    monkeypatch.setattr(main, "refresco_precios", refresco)
+
+    # Su edad cuenta desde que se leyeron los datos, no desde que se
+    # publicaron, así el primer refresco del hilo no se salta
+    main.get_datos_precios()
+    assert nuevo.edad() > 3600
+    vista.huella = "h2"
+    refresco.iniciar()
+    limite = time.monotonic() + 10
+    while not nuevo.version().startswith("h2-"):
+        assert time.monotonic() < limite
+        time.sleep(0.01)
+
+
+def test_instantanea_ilegible(vista):
+    with open(main.RUTA_INSTANTANEA, "wb") as f:
+        f.write(b"no es parquet")
+    assert main.leer_instantanea() is None
+    main.get_datos_precios()
+    assert vista.lecturas == [None]
+
+
+@pytest.fixture
+def vista_sql(precios, tmp_path, monkeypatch):
+    """La vista en un SQLite en memoria, con el catálogo en tmp_path"""
+    engine = create_engine("sqlite://")
+    precios.to_sql(
+        "vw_peco_ecommerce_antiparasitarios_daily", engine, index=False
+    )
+    monkeypatch.setattr(main, "engine", engine)
+    monkeypatch.setattr(main, "MODO_CONSULTA", "sql")
+    monkeypatch.setattr(
+        main,
+        "almacen_catalogo",
+        main.AlmacenCompartido(str(tmp_path), "catalogo"),
+    )
+    return engine
+
+
+def agregar_fila(engine, fila):
+    fila.to_sql(
+        "vw_peco_ecommerce_antiparasitarios_daily",
+        engine,
+        index=False,
+        if_exists="append",
+    )
+
+
+def test_huella_mira_los_ultimos_dias(precios, vista_sql):
+    huella = main.consultar_huella()
+    assert main.consultar_huella() == huella
+
+    # Una fila del primer día queda fuera de los últimos DIAS_HUELLA, pero
+    # cambia el total de filas
+    agregar_fila(vista_sql, precios.iloc[[0]])
+    assert main.consultar_huella() != huella
+
+
+def test_catalogo_sql_sigue_la_huella(precios, vista_sql):
+    catalogo = main.get_catalogo_filtros()
+    esperado = main.catalogo_precios(precios)
+    assert {col: catalogo[col] for col in esperado} == esperado
+    assert catalogo["version"] == main.consultar_huella()
+
+    # Vencido pero con la misma huella: misma versión, sin volver a armarlo
+    envejecer(main.almacen_catalogo, main.SEGUNDOS_VIGENCIA_CACHE + 1)
+    mismo = main.get_catalogo_filtros()
+    assert mismo["version"] == catalogo["version"]
+    assert mismo["datos_al"] == catalogo["datos_al"]
+    assert main.almacen_catalogo.edad() < 60
+
+    # Un refresco pedido con la vista cambiada publica una versión nueva
+    agregar_fila(vista_sql, precios.iloc[[-1]])
+    envejecer(main.almacen_catalogo, main.SEGUNDOS_REUSO_REFRESCO + 1)
+    nuevo = main.get_catalogo_filtros(refrescar=True)
+    assert nuevo["version"] == main.consultar_huella() != catalogo["version"]
+    assert main.get_version_datos() == nuevo["version"]
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+import main
+
+CUARTILES = {"q1": 0.25, "mediana": 0.5, "q3": 0.75}
+
+CASOS = [
+    ({}, None, None),
+    ({}, "2025-02-01", "2025-02-28"),
+    ({"nombre_producto": ["Producto 4"]}, None, None),
+    ({"ecommerce": ["Tienda 2"]}, "2025-01-15", "2025-03-15"),
+    (
+        {"marca_producto": ["Marca 1"], "presentacion_producto": ["Pipeta"]},
+        None,
+        None,
+    ),
+    ({"nombre_producto": ["Producto 0"]}, "2025-04-01", "2025-04-01"),
+]
+
+
+@pytest.fixture(scope="module")
+def sketch(precios):
+    return main.SketchPrecios(precios)
+
+
+@pytest.fixture(scope="module")
+def indice(precios):
+    return main.IndicePrecios(precios)
+
+
+@pytest.mark.parametrize("condiciones, inicio, fin", CASOS)
+def test_resumir_dentro_del_error(
+    precios, sketch, indice, condiciones, inicio, fin
+):
+    filas = precios.iloc[indice.seleccionar(condiciones, inicio, fin)]
+    exacto = main.resumen_precios(filas)
+    aproximado = sketch.resumir(condiciones, inicio, fin)
+
+    for clave in ["productos", "dias"]:
+        assert aproximado[clave] == exacto[clave]
+    for clave in ["maximo", "minimo", "promedio"]:
+        assert aproximado[clave] == pytest.approx(exacto[clave], rel=1e-5)
+
+    error = sketch.error_relativo
+    for col in main.SketchPrecios.COLUMNAS:
+        valores = filas[col].dropna().to_numpy("float64")
+        caja = aproximado["cajas"][col]
+        # El sketch toma el valor de rango (n - 1) * q; el cuantil exacto
+        # interpola entre ese y el siguiente. Se suma medio céntimo por el
+        # redondeo.
+        for nombre, q in CUARTILES.items():
+            menor = np.quantile(valores, q, method="lower")
+            mayor = np.quantile(valores, q, method="higher")
+            assert menor * (1 - error) - 0.005 <= caja[nombre]
+            assert caja[nombre] <= mayor * (1 + error) + 0.005
+        assert caja["media"] == pytest.approx(
+            exacto["cajas"][col]["media"], abs=0.01
+        )
+
+
+def test_resumir_sin_filas(sketch):
+    assert sketch.resumir({"ecommerce": ["No existe"]}) is None
+    assert sketch.resumir({}, "2030-01-01", "2030-01-31") is None
+
+
+def test_sketch_guarda_solo_celdas_con_filas(precios, sketch):
+    celdas = precios.groupby(
+        ["descripcion_producto", *main.COLUMNAS_CATALOGO, "fecha_dia"],
+        observed=True,
+        dropna=False,
+    ).ngroups
+    assert len(sketch.dia_celda) == celdas
+    assert sketch.inicio_serie[-1] == celdas